@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LedgersConfig(AppConfig):
     name = 'ledgers'
+
+    def ready(self):
+        from ledgers import signals  # noqa
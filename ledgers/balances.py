@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+""" Maintenance of `AccountPeriodBalance`, materialised per account, per
+month totals of `Line`.
+
+Balances are updated incrementally as lines are posted:
+
+- `Line.save()`: one update (or insert) per line, or collected and applied
+  once on leaving `ledgers.posting.deferred_balancing()`.
+- `Transaction.objects.bulk_post()`: one update per (account, month) in the
+  batch.
+- `Line` deletion: `ledgers.signals`.
+
+Changing a posted `Transaction.date` is not tracked, run:
+
+    ./manage.py rebuild_period_balances
+
+which rebuilds from `Line` (`--verify` to only check).
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+from ledgers.models import AccountPeriodBalance, Line
+
+
+def month_start(value):
+    """ `AccountPeriodBalance.month` is always the 1st of month. """
+    return date(value.year, value.month, 1)
+
+
+def add_line_delta(deltas, account_id, line_date, value, sign=1):
+    """ Adds a `Line` to `deltas` dict:
+    {(account_id, month): [debit, credit, line_count]} """
+    value = Decimal(value)
+    delta = deltas.setdefault((account_id, month_start(line_date)),
+                              [Decimal(0), Decimal(0), 0])
+    if value > 0:
+        delta[0] += value * sign
+    else:
+        delta[1] -= value * sign
+    delta[2] += sign
+    return deltas
+
+
+def lines_deltas(lines, sign=1):
+    """ `lines` must have `transaction` cached, eg. `Line` objects being
+    created or `select_related('transaction')`. """
+    deltas = {}
+    for line in lines:
+        add_line_delta(deltas, line.account_id, line.transaction.date,
+                       line.value, sign)
+    return deltas
+
+
+def merge_deltas(deltas, other):
+    for key, (debit, credit, count) in other.items():
+        delta = deltas.setdefault(key, [Decimal(0), Decimal(0), 0])
+        delta[0] += debit
+        delta[1] += credit
+        delta[2] += count
+    return deltas
+
+
+def apply_deltas(deltas):
+    """ One update per (account, month), with one insert for all new
+    (account, month) combinations. """
+    missing = []
+    for (account_id, month), (debit, credit, count) in deltas.items():
+        if not (debit or credit or count):
+            continue
+        updated = AccountPeriodBalance.objects.filter(
+            account_id=account_id, month=month).update(
+            debit=F('debit') + debit,
+            credit=F('credit') + credit,
+            net=F('net') + debit - credit,
+            line_count=F('line_count') + count)
+        if not updated:
+            missing.append(AccountPeriodBalance(
+                account_id=account_id, month=month, debit=debit,
+                credit=credit, net=debit - credit, line_count=count))
+    if missing:
+        try:
+            with db_transaction.atomic():
+                AccountPeriodBalance.objects.bulk_create(missing)
+        except IntegrityError:
+            # Created concurrently, just retry as updates.
+            apply_deltas({
+                (obj.account_id, obj.month): [
+                    obj.debit, obj.credit, obj.line_count]
+                for obj in missing})
+
+
+def post_deltas(deltas):
+    """ Applies `deltas` now, or when leaving `deferred_balancing()`. """
+    from ledgers.posting import defer_period_deltas
+    if not defer_period_deltas(deltas):
+        apply_deltas(deltas)
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Rebuild/Verify
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+def aggregate_lines():
+    """ Returns the expected `AccountPeriodBalance` values from `Line`:
+    {(account_id, month): (debit, credit, net, line_count)} """
+    amount = DecimalField(max_digits=19, decimal_places=2)
+    rows = Line.objects.order_by().annotate(
+        month=TruncMonth('transaction__date')).values(
+        'account_id', 'month').annotate(
+        debit=Sum(Case(When(value__gt=0, then=F('value')),
+                       default=Value(0), output_field=amount)),
+        net=Sum('value', output_field=amount),
+        line_count=Count('pk'))
+    return {
+        (row['account_id'], row['month']): (
+            row['debit'], row['debit'] - row['net'], row['net'],
+            row['line_count'])
+        for row in rows}
+
+
+def rebuild():
+    """ Replaces every `AccountPeriodBalance` using one grouped query. """
+    expected = aggregate_lines()
+    with db_transaction.atomic():
+        AccountPeriodBalance.objects.all().delete()
+        AccountPeriodBalance.objects.bulk_create([
+            AccountPeriodBalance(
+                account_id=account_id, month=month, debit=debit,
+                credit=credit, net=net, line_count=line_count)
+            for (account_id, month), (debit, credit, net, line_count)
+            in expected.items()])
+    return len(expected)
+
+
+def verify():
+    """ Returns list of differences between `AccountPeriodBalance` and
+    `Line`: [((account_id, month), expected, actual), ...] """
+    expected = aggregate_lines()
+    actual = {
+        (row[0], row[1]): tuple(row[2:])
+        for row in AccountPeriodBalance.objects.values_list(
+            'account_id', 'month', 'debit', 'credit', 'net', 'line_count')}
+    empty = (Decimal(0), Decimal(0), Decimal(0), 0)
+    differences = []
+    for key in sorted(set(expected) | set(actual)):
+        if expected.get(key, empty) != actual.get(key, empty):
+            differences.append(
+                (key, expected.get(key, empty), actual.get(key, empty)))
+    return differences
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+""" Date parsing for imports.
+
+`dateparser.parse` takes milliseconds per call, so the formats actually seen
+in bank statements and subledger uploads are matched with compiled patterns
+first and `dateparser` is only used for anything else:
+
+    2-May-2017, 02 May 2017   D-Mon-YYYY  >> datetime
+    02/May/17                 DD/Mon/YY   >> datetime
+    May. 2, 2017              Mon. D, YYYY >> datetime
+    20170502                  YYYYMMDD    >> date
+    2017-05, 201705           YYYY-MM     >> date (1st of month)
+
+Month as word formats return `datetime` as `dateparser` does.
+
+Results are cached (`LEDGERS_DATE_CACHE_SIZE`), statement dates repeat a lot.
+
+To compare against `dateparser` run:
+
+    ./manage.py benchmark_dates
+"""
+import re
+from datetime import date, datetime
+from functools import lru_cache
+
+import dateparser
+from django.conf import settings
+
+
+DATE_CACHE_SIZE = getattr(settings, 'LEDGERS_DATE_CACHE_SIZE', 4096)
+
+MONTHS = {}
+for number, name in enumerate([
+        'january', 'february', 'march', 'april', 'may', 'june', 'july',
+        'august', 'september', 'october', 'november', 'december'], 1):
+    MONTHS[name] = MONTHS[name[:3]] = number
+MONTHS['sept'] = 9
+
+DAY_MONTH_YEAR = re.compile(
+    r'^\s*(\d{1,2})[-/ ]([A-Za-z]{3,9})\.?[-/ ](\d{4}|\d{2})\s*$')
+MONTH_DAY_YEAR = re.compile(
+    r'^\s*([A-Za-z]{3,9})\.? (\d{1,2}),? (\d{4})\s*$')
+YEAR_MONTH_DAY = re.compile(r'^(\d{4})(\d{2})(\d{2})$')
+YEAR_MONTH = re.compile(r'^(\d{4})\D?(\d{2})$')
+MONTH_AS_WORD = re.compile(r'[a-zA-Z.]')
+
+
+def make_year(value):
+    """ 2 digit years as per `strptime('%y')`: 69-99 >> 1900s. """
+    year = int(value)
+    if len(value) == 2:
+        year += 1900 if year >= 69 else 2000
+    return year
+
+
+def parse_fast(value):
+    """ Returns `date`/`datetime` for known formats, otherwise None. """
+    try:
+        match = DAY_MONTH_YEAR.match(value)
+        if match:
+            day, month, year = match.groups()
+            return datetime(make_year(year), MONTHS[month.lower()], int(day))
+
+        match = MONTH_DAY_YEAR.match(value)
+        if match:
+            month, day, year = match.groups()
+            return datetime(int(year), MONTHS[month.lower()], int(day))
+
+        match = YEAR_MONTH_DAY.match(value)
+        if match:
+            return date(*[int(x) for x in match.groups()])
+
+        match = YEAR_MONTH.match(value)
+        if match:
+            year, month = match.groups()
+            return date(int(year), int(month), 1)
+    except (KeyError, ValueError):
+        # Not a month name, or not a valid date, eg. 31-Feb-2017.
+        pass
+    return None
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(value):
+    """ Parses str `value`, see module docstring for formats.
+
+    Numeric day/month formats are refused as ambiguous (USA v. ISO8601,
+    eg. 5-2-2017 May or Feb?), month must be a word eg: 2-May-2017.
+    """
+    parsed = parse_fast(value)
+    if parsed is not None:
+        return parsed
+
+    if not MONTH_AS_WORD.search(value):
+        raise Exception(
+            "Ambiguous date provided. Please provide month as word. eg: GOOD: 2-May-2017 BAD: 2017-02-05")  # noqa
+
+    return dateparser.parse(value)
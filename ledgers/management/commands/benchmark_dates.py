@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import random
+import timeit
+from datetime import date
+
+import dateparser
+from django.core.management.base import BaseCommand
+
+from ledgers import dates
+
+
+SAMPLES = ['2-May-2017', '31-Jan-2016', '02/Jun/17', 'Jan. 31, 2016',
+           '20170502', '2017-05']
+
+
+def make_date_dateparser(value):
+    """ `ledgers.utils.make_date` before `ledgers.dates`, for comparison. """
+    if len(value) == 8:
+        try:
+            return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+        except ValueError:
+            pass
+    if len(value) == 7:
+        try:
+            return date(int(value[0:4]), int(value[5:7]), 1)
+        except ValueError:
+            pass
+    return dateparser.parse(value)
+
+
+class Command(BaseCommand):
+    help = "Compare `ledgers.dates.parse_date` against `dateparser.parse`."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=2000,
+            help="Dates parsed per run, drawn from a month of statement "
+                 "dates so they repeat as they do in imports.")
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        month = ['{}-May-2017'.format(day) for day in range(1, 32)]
+        values = [random.choice(month) for x in range(rows)] + SAMPLES
+
+        for value in SAMPLES:
+            fast, slow = dates.parse_date(value), make_date_dateparser(value)
+            self.stdout.write("{:>14}  {}  {}".format(
+                value, fast, "ok" if fast == slow else "DIFFERS: {}".format(
+                    slow)))
+
+        def run_fast():
+            dates.parse_date.cache_clear()
+            for value in values:
+                dates.parse_date(value)
+
+        def run_uncached():
+            for value in values:
+                dates.parse_fast(value)
+
+        def run_dateparser():
+            for value in values:
+                make_date_dateparser(value)
+
+        for name, func in [('dateparser', run_dateparser),
+                           ('fast path', run_uncached),
+                           ('fast path + cache', run_fast)]:
+            seconds = min(timeit.repeat(func, number=1, repeat=3))
+            self.stdout.write("{:>18}: {:8.2f} ms ({:.2f} us/date)".format(
+                name, seconds * 1000, seconds * 1000000 / len(values)))
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from ledgers import balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild `AccountPeriodBalance` from `Line`, or --verify against it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true', default=False,
+            help="Only compare `AccountPeriodBalance` against `Line`.")
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            count = balances.rebuild()
+            self.stdout.write("Rebuilt {} account period balances.".format(
+                count))
+
+        differences = balances.verify()
+        for (account_id, month), expected, actual in differences:
+            self.stdout.write(
+                "Account {} {:%b-%Y}: expected {} actual {}".format(
+                    account_id, month, expected, actual))
+        if differences:
+            raise CommandError("{} account period balances differ.".format(
+                len(differences)))
+        self.stdout.write("Account period balances match lines.")
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledgers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountPeriodBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('debit', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=19)),
+                ('credit', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=19)),
+                ('net', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=19)),
+                ('line_count', models.IntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_balances', to='ledgers.Account')),
+            ],
+            options={
+                'ordering': ['month', 'account'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountperiodbalance',
+            unique_together={('account', 'month')},
+        ),
+    ]
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import re
 import decimal
 from django.db import models
 from django.db.models import Sum
@@ -99,25 +98,25 @@ class Account(models.Model):
                                                number=self.number)
 
     def get_account_code_list():
-        return [account.get_code() for account in Account.objects.all()] \
-            + ["[{}]".format(account.get_code())
-               for account in Account.objects.all()]
+        """ Uses `ledgers.registry.chart_of_accounts`, no query once loaded.
+        """
+        from ledgers.registry import chart_of_accounts
+        return chart_of_accounts.code_list()
 
     def get_account(data):
-        """ Allow fetch `Account` by either string of "code" or Account obj"""
+        """ Allow fetch `Account` by either string of "code" or Account obj
+
+        Codes are looked up in `ledgers.registry.chart_of_accounts`."""
+        from ledgers.registry import chart_of_accounts
 
         # is `Account` object
         if type(data) is Account:
             return data
 
-        try:
-            # is string, search for `Account` object
-            data = re.sub(r'[^\d\-.]', '', data)
-            account = Account.objects.by_code(data)
-            if account:
-                return account
-        except TypeError:
-            pass
+        # is string, search for `Account` object
+        account = chart_of_accounts.get(data)
+        if account:
+            return account
 
         raise Exception(
             "Account can't be found based upon that input: {}.".format(data))
@@ -192,6 +191,13 @@ class Transaction(models.Model):
         new_transaction.save(lines=lines)
         ```
 
+    Many transactions at once (eg. month end, imports):
+
+        ```
+        entries = [(kwargs, lines), (kwargs, lines), ...]
+        Transaction.objects.bulk_post(entries)
+        ```
+
     """
     # ---
     # Minimum required fields for object.
@@ -225,6 +231,8 @@ class Transaction(models.Model):
     # sum out to zero. This is fundamental.
     is_balanced = models.BooleanField(default=False)
 
+    objects = querysets.TransactionQuerySet.as_manager()
+
     class Meta:
         ordering = ['date']
 
@@ -273,8 +281,7 @@ new_transaction.save(lines)
         else:
             """ Existing objects: check and save """
             # Always check balances.
-            if not self.is_balanced == self.check_is_balanced():
-                self.is_balanced = self.check_is_balanced()
+            self.is_balanced = self.check_is_balanced()
             super(Transaction, self).save(*args, **kwargs)
 
     # Custom methods
@@ -386,6 +393,71 @@ class Line(models.Model):
         return name
 
     def save(self, *args, **kwargs):
+        from ledgers.balances import add_line_delta, post_deltas
+        from ledgers.posting import defer_balance_check
+
+        # `AccountPeriodBalance` changes: remove previous, add new.
+        deltas = {}
+        if not self._state.adding:
+            previous = Line.objects.filter(pk=self.pk).values_list(
+                'account_id', 'transaction__date', 'value').first()
+            if previous:
+                add_line_delta(deltas, *previous, sign=-1)
+
         obj = super(Line, self).save(*args, **kwargs)
+
+        add_line_delta(deltas, self.account_id, self.transaction.date,
+                       self.value)
+        post_deltas(deltas)
+
         # re-save for `Transaction.is_balanced`
-        self.transaction.save()
+        # (unless inside `ledgers.posting.deferred_balancing()`)
+        if not defer_balance_check(self.transaction):
+            self.transaction.save()
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# PERIOD BALANCES
+
+# Materialised totals of `Line` per `Account` per month, so reports don't
+# have to aggregate every `Line` from scratch.
+# Maintained on posting, see `ledgers.balances`.
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+class AccountPeriodBalance(models.Model):
+    """ Totals of every `Line` for `account` where transaction date is in
+    `month`.
+
+    `debit` and `credit` are both positive, `net` = `debit` - `credit`
+    (same sign as `Line.value`).
+    """
+
+    account = models.ForeignKey(Account, models.CASCADE,
+                                related_name="period_balances")
+
+    # Always 1st of month.
+    month = models.DateField()
+
+    debit = models.DecimalField(max_digits=19, decimal_places=2,
+                                default=decimal.Decimal(0))
+
+    credit = models.DecimalField(max_digits=19, decimal_places=2,
+                                 default=decimal.Decimal(0))
+
+    net = models.DecimalField(max_digits=19, decimal_places=2,
+                              default=decimal.Decimal(0))
+
+    line_count = models.IntegerField(default=0)
+
+    objects = querysets.AccountPeriodBalanceQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['month', 'account']
+        unique_together = ('account', 'month')
+
+    def __str__(self):
+        return "[{acc}] {month:%b-%Y} ${net}".format(
+            acc=self.account.get_code(), month=self.month, net=self.net)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+""" Set-based posting of `Transaction`/`Line` objects.
+
+`Transaction.save(lines=...)` is fine for one-off entries but posts each
+`Line` individually, and every `Line.save()` re-saves its `Transaction` to
+recompute `is_balanced`. For month-end volumes use:
+
+    Transaction.objects.bulk_post(entries)
+
+where `entries` is an iterable of `(transaction_kwargs, lines)` pairs, with
+`lines` in any format accepted by `Transaction.line_validation`.
+
+Where lines must still be saved one at a time, defer the balance checks:
+
+    with deferred_balancing():
+        new_transaction.save(lines=lines)
+        line.save()
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from ledgers import balances
+from ledgers.models import Line, Transaction
+
+
+BULK_POST_BATCH_SIZE = getattr(settings, 'LEDGERS_BULK_POST_BATCH_SIZE', 500)
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Utilities
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+class QueryCounter(object):
+    """ Counts queries executed on `connection`, regardless of `DEBUG`.
+
+    Usage:
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            ...
+        counter.count
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def chunked(items, size):
+    """ Yields lists of up to `size` items from any iterable. """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bulk_create_with_pks(model, objs, batch_size=None):
+    """ `bulk_create` which always leaves `pk` set on `objs`.
+
+    Dependent rows (eg. `Line` for `Transaction`) need their parent's `pk`.
+    Only some backends return ids from a bulk insert:
+
+    - returning backends (postgres): plain `bulk_create`.
+    - sqlite: holds the database write lock for the whole atomic block, so
+      the ids of rows just inserted are the highest ids in the table.
+    - anything else: falls back to one insert per object.
+
+    Must be called inside an atomic block.
+    """
+    if not connection.in_atomic_block:
+        raise Exception("bulk_create_with_pks must be run inside atomic().")
+
+    batch_size = batch_size or BULK_POST_BATCH_SIZE
+
+    if connection.features.can_return_ids_from_bulk_insert:
+        return model.objects.bulk_create(objs, batch_size=batch_size)
+
+    for chunk in chunked(objs, batch_size):
+        if connection.vendor == 'sqlite':
+            model.objects.bulk_create(chunk)
+            pks = model.objects.order_by('-pk').values_list(
+                'pk', flat=True)[:len(chunk)]
+            for obj, pk in zip(chunk, reversed(list(pks))):
+                obj.pk = pk
+                obj._state.adding = False
+                obj._state.db = connection.alias
+        else:
+            for obj in chunk:
+                obj.save_base(force_insert=True)
+    return objs
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Bulk Posting
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+def bulk_post(entries, batch_size=None):
+    """ Validates and writes many `Transaction` objects with their `Line`s.
+
+    1. Every `(transaction_kwargs, lines)` pair is validated in memory using
+       `Transaction.line_validation`. Nothing is written if any pair fails.
+
+    2. Headers and lines are written with chunked `bulk_create` inside one
+       atomic block. `is_balanced` is set as per `Transaction.save()`: if it
+       passed `line_validation` then it is balanced.
+
+    `AccountPeriodBalance` is updated once per (account, month) in batch.
+
+    Returns dict:
+        {
+          'transactions': [Transaction, ...],  # saved, in input order
+          'lines': int,                        # number of lines created
+          'queries': int,                      # queries used by this batch
+        }
+
+    Note: account codes are resolved while validating, `Account` objects
+    can be provided in `lines` to skip this.
+    """
+    batch_size = batch_size or BULK_POST_BATCH_SIZE
+    counter = QueryCounter()
+
+    with connection.execute_wrapper(counter):
+
+        # 1. Validate all entries before writing anything.
+        new_transactions, valid_lines = [], []
+        for trans_kwargs, lines in entries:
+            new_transaction = Transaction(**trans_kwargs)
+            new_transaction.value, line_kwargs = \
+                Transaction.line_validation(lines)
+            new_transaction.is_balanced = True
+            new_transactions.append(new_transaction)
+            valid_lines.append(line_kwargs)
+
+        # 2. Write headers, then lines.
+        new_lines = []
+        with db_transaction.atomic():
+            bulk_create_with_pks(Transaction, new_transactions, batch_size)
+            for new_transaction, line_kwargs in zip(new_transactions,
+                                                    valid_lines):
+                for kwargs in line_kwargs:
+                    new_lines.append(
+                        Line(transaction=new_transaction, **kwargs))
+            Line.objects.bulk_create(new_lines, batch_size=batch_size)
+            balances.apply_deltas(balances.lines_deltas(new_lines))
+
+    return {
+        'transactions': new_transactions,
+        'lines': len(new_lines),
+        'queries': counter.count,
+    }
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Deferred Balancing
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+_deferred = threading.local()
+
+
+def is_deferred():
+    return getattr(_deferred, 'transactions', None) is not None
+
+
+def defer_balance_check(transaction):
+    """ Called by `Line.save()`. Returns True if the `Transaction` re-save
+    should be skipped, as it will be verified on leaving
+    `deferred_balancing()`. """
+    if not is_deferred():
+        return False
+    _deferred.transactions.add(transaction.pk)
+    return True
+
+
+def defer_period_deltas(deltas):
+    """ Called by `ledgers.balances.post_deltas`. Returns True if the
+    `AccountPeriodBalance` changes will be applied on leaving
+    `deferred_balancing()`. """
+    if not is_deferred():
+        return False
+    balances.merge_deltas(_deferred.deltas, deltas)
+    return True
+
+
+def verify_balances(transaction_ids):
+    """ Checks every `Transaction` in `transaction_ids` balances using one
+    grouped query (per batch of ids), then sets `is_balanced` in one update.
+
+    Raises if any do not balance.
+    """
+    transaction_ids = sorted(transaction_ids)
+    balanced, unbalanced = [], []
+
+    for ids in chunked(transaction_ids, BULK_POST_BATCH_SIZE):
+        totals = {
+            row['transaction_id']: row for row in Line.objects.filter(
+                transaction_id__in=ids).order_by().values(
+                'transaction_id').annotate(
+                total=Sum('value'), count=Count('pk'))}
+        for pk in ids:
+            row = totals.get(pk)
+            # as per `Transaction.check_is_balanced`
+            if row and row['count'] >= 2 and row['total'] == 0:
+                balanced.append(pk)
+            else:
+                unbalanced.append(pk)
+
+    if unbalanced:
+        raise Exception("Transactions do not balance: {}".format(
+            ", ".join(str(pk) for pk in unbalanced)))
+
+    for ids in chunked(balanced, BULK_POST_BATCH_SIZE):
+        Transaction.objects.filter(pk__in=ids).update(
+            is_balanced=True, updated_at=timezone.now())
+    return balanced
+
+
+@contextmanager
+def deferred_balancing():
+    """ Stops `Line.save()` re-saving its `Transaction` for every line.
+
+    All `Transaction`s touched inside the block are verified on exit with
+    `verify_balances`. The whole block is run inside `atomic()` so is rolled
+    back if any of them do not balance.
+
+    `AccountPeriodBalance` changes are also collected and applied once.
+
+    Nested use is fine, verification happens at the outermost block.
+    """
+    if is_deferred():
+        yield _deferred.transactions
+        return
+
+    _deferred.transactions, _deferred.deltas = set(), {}
+    try:
+        with db_transaction.atomic():
+            yield _deferred.transactions
+            touched, deltas = _deferred.transactions, _deferred.deltas
+            # Any further saves are checked immediately.
+            _deferred.transactions = _deferred.deltas = None
+            verify_balances(touched)
+            balances.apply_deltas(deltas)
+    finally:
+        _deferred.transactions = _deferred.deltas = None
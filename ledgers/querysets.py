@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 from approx_dates.models import ApproxDate
+from datetime import date
 
 from django.db import models
 from django.db.models import Sum
+from django.db.models.functions import TruncMonth
 from ledgers.periods import settings
 from ledgers.periods.models import CurrentFinancialYear
 
@@ -46,10 +48,28 @@ class AccountQuerySet(models.query.QuerySet):
         return self.annotate(total=Sum('lines__value'))
 
 
+class TransactionQuerySet(models.query.QuerySet):
+
+    def bulk_post(self, entries, batch_size=None):
+        """ See `ledgers.posting.bulk_post`. """
+        from ledgers.posting import bulk_post
+        return bulk_post(entries, batch_size=batch_size)
+
+
 class LineQuerySet(models.query.QuerySet):
     def range(self, start=None, end=None):
         return self.filter(transaction__date__range=(start, end))
 
+    def month_totals(self):
+        """ Account x month matrix in one grouped query.
+
+        Returns {(account_id, 'YYYY-MM'): total} """
+        rows = self.order_by().annotate(
+            month=TruncMonth('transaction__date')).values(
+            'account_id', 'month').annotate(total=Sum('value'))
+        return {(row['account_id'], row['month'].isoformat()[:7]):
+                row['total'] for row in rows}
+
     def day(self, day):
         return self.filter(transaction__date=day)
 
@@ -64,3 +84,25 @@ class LineQuerySet(models.query.QuerySet):
             fyear = CurrentFinancialYear.objects.get().current_financial_year
         return self.filter(transaction__date__range=(
             settings.FINANCIAL_YEARS[fyear]))
+
+
+class AccountPeriodBalanceQuerySet(models.query.QuerySet):
+
+    def range(self, start=None, end=None):
+        """ Whole months only: the months containing `start` to `end`. """
+        return self.filter(month__range=(
+            date(start.year, start.month, 1), end))
+
+    def month(self, month):
+        return self.filter(
+            month=ApproxDate.from_iso8601(month).earliest_date)
+
+    def fyear(self, fyear=None):
+        if not fyear:
+            fyear = CurrentFinancialYear.objects.get().current_financial_year
+        return self.filter(month__range=(settings.FINANCIAL_YEARS[fyear]))
+
+    def totals(self):
+        """ Returns {account_id: total} as per `AccountQuerySet.total()`. """
+        return dict(self.order_by().values('account_id').annotate(
+            total=Sum('net')).values_list('account_id', 'total'))
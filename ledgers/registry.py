@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+""" Process-wide, in-memory Chart of Accounts.
+
+Account lookups by code are the hottest path in imports, so rather than
+querying for every line the whole CofA is loaded once (one query) and kept
+until an `Account` is saved or deleted (see `ledgers.signals`).
+
+Signals are only received by the process saving the `Account`: other
+processes (eg. the web server and `run_import_jobs` workers) keep their
+snapshot, and `Account`s changed with `QuerySet.update()`/`bulk_create()`
+aren't noticed at all. Long running processes call `invalidate()` before
+each unit of work (`run_import_jobs` per job, `watch_bank_feeds` per poll),
+the next lookup reloads.
+
+Usage:
+
+    from ledgers.registry import chart_of_accounts
+
+    chart_of_accounts.get('01-0101')     # `Account` or None
+    chart_of_accounts.get('[01-0101]')   # `Account` or None
+    '01-0101' in chart_of_accounts.codes()
+    chart_of_accounts.special('bank')    # '01-0101'
+
+Beware: `Account` objects returned are shared, don't modify them in place
+without saving.
+"""
+import re
+import threading
+from collections import namedtuple
+
+from ledgers.models import Account
+
+
+CODE_PATTERN = re.compile(r'[^\d\-.]')
+
+
+Snapshot = namedtuple('Snapshot', ['version', 'accounts', 'codes',
+                                   'code_list', 'special', 'lookups'])
+
+
+class ChartOfAccounts(object):
+    """ Maps codes and `[code]` labels to `Account` objects, and special
+    accounts to codes.
+
+    `version` is incremented by every `invalidate()`, a snapshot loaded
+    while an invalidation happens is used once but not kept.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def invalidate(self, *args, **kwargs):
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+
+    def load(self):
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        version = self.version
+        accounts, code_list, special = {}, [], {}
+        # Ordered as per `Account.Meta`, so first match is as `by_code()`.
+        for account in Account.objects.all():
+            code = account.get_code()
+            if code not in accounts:
+                accounts[code] = account
+                code_list.append(code)
+            if account.special_account:
+                special.setdefault(account.special_account, code)
+        for code in list(code_list):
+            label = "[{}]".format(code)
+            accounts[label] = accounts[code]
+        code_list += ["[{}]".format(code) for code in code_list]
+
+        snapshot = Snapshot(version, accounts, frozenset(code_list),
+                            code_list, special, {})
+        with self._lock:
+            if self.version == version:
+                self._snapshot = snapshot
+        return snapshot
+
+    def get(self, data):
+        """ Returns `Account` by code (eg. "01-0101", "[01-0101] Bank"),
+        or None. Input is cleaned as per `Account.get_account`. """
+        snapshot = self.load()
+        try:
+            return snapshot.lookups[data]
+        except KeyError:
+            pass
+        except TypeError:
+            return None  # unhashable
+
+        account = snapshot.accounts.get(data)
+        if account is None:
+            try:
+                account = snapshot.accounts.get(CODE_PATTERN.sub('', data))
+            except TypeError:
+                return None
+        snapshot.lookups[data] = account
+        return account
+
+    def codes(self):
+        """ frozenset of every code and `[code]` label. """
+        return self.load().codes
+
+    def code_list(self):
+        """ As per `codes()`, but list: codes first then labels. """
+        return list(self.load().code_list)
+
+    def special(self, special_account):
+        """ Returns code of the `special_account` (see `SPECIAL`) or None. """
+        return self.load().special.get(special_account)
+
+
+chart_of_accounts = ChartOfAccounts()
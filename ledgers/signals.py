@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ledgers.balances import lines_deltas, post_deltas
+from ledgers.models import Account, Line
+from ledgers.registry import chart_of_accounts
+
+
+@receiver([post_save, post_delete], sender=Account)
+def invalidate_chart_of_accounts(sender, **kwargs):
+    chart_of_accounts.invalidate()
+
+
+@receiver(post_delete, sender=Line)
+def remove_line_period_balance(sender, instance, **kwargs):
+    post_deltas(lines_deltas([instance], sign=-1))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ledgers import balances
+from ledgers.models import Account, AccountPeriodBalance, Transaction
+from ledgers.posting import deferred_balancing
+
+
+class TestAccountPeriodBalance(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(
+            element='01', number='0101', name='Test Account 1')
+        self.a2 = Account.objects.create(
+            element='15', number='0501', name='Test Account 2')
+
+        self.t1 = Transaction(date=date(2017, 5, 2), user=self.user)
+        self.t1.save(lines=(self.a1, self.a2, 10))
+        self.t2 = Transaction(date=date(2017, 5, 20), user=self.user)
+        self.t2.save(lines=(self.a2, self.a1, 4))
+        self.t3 = Transaction(date=date(2017, 6, 1), user=self.user)
+        self.t3.save(lines=(self.a1, self.a2, 1))
+
+    def test_period_balance_on_save(self):
+        may = AccountPeriodBalance.objects.get(
+            account=self.a1, month=date(2017, 5, 1))
+        self.assertEqual(may.debit, Decimal(10))
+        self.assertEqual(may.credit, Decimal(4))
+        self.assertEqual(may.net, Decimal(6))
+        self.assertEqual(may.line_count, 2)
+        june = AccountPeriodBalance.objects.get(
+            account=self.a2, month=date(2017, 6, 1))
+        self.assertEqual(june.net, Decimal(-1))
+        self.assertEqual(balances.verify(), [])
+
+    def test_period_balance_line_changed(self):
+        line = self.t1.lines.get(account=self.a1)
+        line.account = self.a2
+        line.save()
+        self.assertEqual(balances.verify(), [])
+
+    def test_period_balance_line_deleted(self):
+        self.t2.delete()
+        may = AccountPeriodBalance.objects.get(
+            account=self.a1, month=date(2017, 5, 1))
+        self.assertEqual(may.net, Decimal(10))
+        self.assertEqual(balances.verify(), [])
+
+    def test_period_balance_bulk_post(self):
+        entries = [({'user': self.user, 'date': date(2017, 5, x)},
+                    (self.a1, self.a2, x)) for x in range(1, 10)]
+        Transaction.objects.bulk_post(entries)
+        self.assertEqual(balances.verify(), [])
+
+    def test_period_balance_deferred(self):
+        with deferred_balancing():
+            t = Transaction(date=date(2017, 7, 2), user=self.user)
+            t.save(lines=[(self.a1, 3), (self.a1, 2), (self.a2, -5)])
+        self.assertEqual(balances.verify(), [])
+
+    def test_period_balance_totals(self):
+        totals = AccountPeriodBalance.objects.all().totals()
+        self.assertEqual(totals[self.a1.pk], Decimal(7))
+        self.assertEqual(totals[self.a2.pk], Decimal(-7))
+        totals = AccountPeriodBalance.objects.month('2017-06').totals()
+        self.assertEqual(totals[self.a1.pk], Decimal(1))
+        totals = AccountPeriodBalance.objects.range(
+            date(2017, 5, 15), date(2017, 5, 31)).totals()
+        self.assertEqual(totals[self.a1.pk], Decimal(6))
+
+    def test_rebuild_period_balances_command(self):
+        AccountPeriodBalance.objects.all().update(net=0)
+        self.assertNotEqual(balances.verify(), [])
+        self.assertRaises(CommandError, call_command,
+                          'rebuild_period_balances', '--verify')
+        call_command('rebuild_period_balances')
+        self.assertEqual(balances.verify(), [])
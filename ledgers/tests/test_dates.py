@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from datetime import date, datetime
+
+import dateparser
+from django.test import TestCase
+
+from ledgers import dates
+
+
+class TestDatesParseDate(TestCase):
+
+    def test_parse_date_fast_paths(self):
+        for test_input, test_result in [
+                ('2-May-2017', datetime(2017, 5, 2)),
+                ('02 May 2017', datetime(2017, 5, 2)),
+                ('02/May/17', datetime(2017, 5, 2)),
+                ('2-Sept-2017', datetime(2017, 9, 2)),
+                ('Jan. 31, 2016', datetime(2016, 1, 31)),
+                ('20170502', date(2017, 5, 2)),
+                ('2017-05', date(2017, 5, 1)),
+                ('201705', date(2017, 5, 1))]:
+            self.assertEqual(dates.parse_fast(test_input), test_result,
+                             test_input)
+            self.assertEqual(dates.parse_date(test_input), test_result,
+                             test_input)
+
+    def test_parse_date_same_as_dateparser(self):
+        for test_input in ['2-May-2017', '02/Jun/17', 'Jan. 31, 2016',
+                           '11-Dec-2015', '1 February 2018']:
+            self.assertEqual(dates.parse_date(test_input),
+                             dateparser.parse(test_input), test_input)
+
+    def test_parse_date_fallback(self):
+        self.assertEqual(dates.parse_fast('Thursday, 2nd May 2017'), None)
+        self.assertEqual(dates.parse_date('Thursday, 2nd May 2017'),
+                         datetime(2017, 5, 2))
+
+    def test_parse_date_invalid_not_fast(self):
+        self.assertEqual(dates.parse_fast('31-Feb-2017'), None)
+        self.assertEqual(dates.parse_fast('2-Foo-2017'), None)
+
+    def test_parse_date_ambiguous_failure(self):
+        self.assertRaises(Exception, dates.parse_date, '2017-02-05')
+        self.assertRaises(Exception, dates.parse_date, '5/2/2017')
+
+    def test_parse_date_cached(self):
+        dates.parse_date.cache_clear()
+        dates.parse_date('2-May-2017')
+        dates.parse_date('2-May-2017')
+        self.assertEqual(dates.parse_date.cache_info().hits, 1)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from ledgers.models import Account, Transaction, Line
+from ledgers.posting import QueryCounter, deferred_balancing
+
+
+class TestTransactionBulkPost(TestCase):
+
+    def setUp(self):
+        self.date = date(2017, 6, 16)
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(
+            element='01', number='0101', name='Test Account 1')
+        self.a2 = Account.objects.create(
+            element='01', number='0102', name='Test Account 2')
+        self.a3 = Account.objects.create(
+            element='15', number='0501', name='Test Account 3')
+
+    def make_entries(self, n):
+        trans_kwargs = {'user': self.user, 'date': self.date,
+                        'source': 'ledgers.models.Transaction'}
+        entries = []
+        for x in range(n):
+            if x % 2:
+                lines = (self.a1, self.a2, Decimal(x))
+            else:
+                lines = [(self.a1, Decimal(5), "A notation"),
+                         (self.a2, Decimal(5)),
+                         (self.a3, Decimal(-10))]
+            entries.append((trans_kwargs, lines))
+        return entries
+
+    def test_bulk_post_creates_transactions_and_lines(self):
+        result = Transaction.objects.bulk_post(self.make_entries(4))
+        self.assertEqual(len(result['transactions']), 4)
+        self.assertEqual(result['lines'], 10)
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertEqual(Line.objects.count(), 10)
+
+    def test_bulk_post_transactions_balanced(self):
+        result = Transaction.objects.bulk_post(self.make_entries(4))
+        for t in result['transactions']:
+            t = Transaction.objects.get(pk=t.pk)
+            self.assertEqual(t.is_balanced, True)
+            self.assertEqual(t.is_balanced, t.check_is_balanced())
+
+    def test_bulk_post_values_correct(self):
+        result = Transaction.objects.bulk_post(self.make_entries(2))
+        t_multi, t_simple = result['transactions']
+        self.assertEqual(t_multi.value, Decimal(10))
+        self.assertEqual(t_multi.lines.get(account=self.a1).note,
+                         "A notation")
+        self.assertEqual(t_simple.value, Decimal(1))
+        self.assertEqual(t_simple.lines.get(account=self.a2).value,
+                         Decimal(-1))
+
+    def test_bulk_post_unbalanced_writes_nothing(self):
+        entries = self.make_entries(3)
+        entries.append(({'user': self.user, 'date': self.date},
+                        [(self.a1, 5), (self.a2, 6)]))
+        self.assertRaises(Exception, Transaction.objects.bulk_post, entries)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.assertEqual(Line.objects.count(), 0)
+
+    def test_bulk_post_queries_constant(self):
+        # first posting to period creates `AccountPeriodBalance` rows
+        Transaction.objects.bulk_post(self.make_entries(2))
+        small = Transaction.objects.bulk_post(self.make_entries(2))
+        large = Transaction.objects.bulk_post(self.make_entries(40))
+        self.assertEqual(small['queries'], large['queries'])
+
+
+class TestDeferredBalancing(TestCase):
+
+    def setUp(self):
+        self.date = date(2017, 6, 16)
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(
+            element='01', number='0101', name='Test Account 1')
+        self.a2 = Account.objects.create(
+            element='01', number='0102', name='Test Account 2')
+        self.lines = [(self.a1, Decimal(x)) for x in range(1, 11)] \
+            + [(self.a2, Decimal(-55))]
+
+    def test_deferred_balancing_saves_balanced(self):
+        with deferred_balancing():
+            t1 = Transaction(date=self.date, value=0, user=self.user)
+            t1.save(lines=self.lines)
+        t1 = Transaction.objects.get(pk=t1.pk)
+        self.assertEqual(t1.is_balanced, True)
+        self.assertEqual(t1.lines.count(), 11)
+
+    def test_deferred_balancing_fewer_queries(self):
+        immediate, deferred = QueryCounter(), QueryCounter()
+        with connection.execute_wrapper(immediate):
+            t1 = Transaction(date=self.date, value=0, user=self.user)
+            t1.save(lines=self.lines)
+        with connection.execute_wrapper(deferred):
+            with deferred_balancing():
+                t2 = Transaction(date=self.date, value=0, user=self.user)
+                t2.save(lines=self.lines)
+        # ~ one insert per line, no re-save per line
+        self.assertLess(deferred.count, len(self.lines) + 10)
+        self.assertLess(deferred.count * 2, immediate.count)
+
+    def test_deferred_balancing_unbalanced_rolls_back(self):
+        t1 = Transaction(date=self.date, value=0, user=self.user)
+        t1.save(lines=(self.a1, self.a2, 5))
+
+        def break_line():
+            with deferred_balancing():
+                t2 = Transaction(date=self.date, value=0, user=self.user)
+                t2.save(lines=self.lines)
+                broken_line = t1.lines.first()
+                broken_line.value = 10000
+                broken_line.save()
+
+        self.assertRaises(Exception, break_line)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(t1.lines.first().value, Decimal(5))
+
+    def test_deferred_balancing_not_deferred_after_exit(self):
+        with deferred_balancing():
+            pass
+        t1 = Transaction(date=self.date, value=0, user=self.user)
+        t1.save(lines=(self.a1, self.a2, 5))
+        broken_line = t1.lines.first()
+        broken_line.value = 10000
+        broken_line.save()
+        self.assertEqual(broken_line.transaction.is_balanced, False)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+
+from ledgers.models import Account
+from ledgers.registry import chart_of_accounts
+
+
+class TestChartOfAccounts(TestCase):
+
+    def setUp(self):
+        self.a1 = Account.objects.create(
+            element='01', number='0101', name='Test Account 1')
+        self.a2 = Account.objects.create(
+            element='03', number='0300', name='Test Account 2',
+            special_account='ACP')
+
+    def test_registry_get_code_passes(self):
+        self.assertEqual(chart_of_accounts.get('01-0101'), self.a1)
+
+    def test_registry_get_label_passes(self):
+        self.assertEqual(chart_of_accounts.get('[01-0101]'), self.a1)
+        self.assertEqual(chart_of_accounts.get('[03-0300] AP'), self.a2)
+
+    def test_registry_get_missing_returns_none(self):
+        self.assertEqual(chart_of_accounts.get('01-9999'), None)
+        self.assertEqual(chart_of_accounts.get(None), None)
+
+    def test_registry_special_passes(self):
+        self.assertEqual(chart_of_accounts.special('ACP'), '03-0300')
+        self.assertEqual(chart_of_accounts.special('bank'), None)
+
+    def test_registry_codes_passes(self):
+        self.assertEqual(chart_of_accounts.codes(), frozenset(
+            ['01-0101', '03-0300', '[01-0101]', '[03-0300]']))
+
+    def test_registry_get_account_no_queries_once_loaded(self):
+        chart_of_accounts.load()
+        with self.assertNumQueries(0):
+            for x in range(100):
+                Account.get_account('01-0101')
+                Account.get_account('[03-0300]')
+                Account.get_account_code_list()
+
+    def test_registry_invalidated_on_save(self):
+        version = chart_of_accounts.version
+        a3 = Account.objects.create(
+            element='15', number='0501', name='Test Account 3')
+        self.assertGreater(chart_of_accounts.version, version)
+        self.assertEqual(Account.get_account('15-0501'), a3)
+
+    def test_registry_invalidated_on_delete(self):
+        a3 = Account.objects.create(
+            element='15', number='0501', name='Test Account 3')
+        self.assertEqual(Account.get_account('15-0501'), a3)
+        a3.delete()
+        self.assertRaises(Exception, Account.get_account, '15-0501')
+
+    def test_registry_bulk_create_needs_invalidate(self):
+        chart_of_accounts.load()
+        Account.objects.bulk_create([
+            Account(element='15', number='0502', name='Test Account 4')])
+        self.assertEqual(chart_of_accounts.get('15-0502'), None)
+        chart_of_accounts.invalidate()
+        self.assertEqual(
+            chart_of_accounts.get('15-0502'),
+            Account.objects.get(element='15', number='0502'))
@@ -109,6 +109,26 @@ class TestUtilsMakeDecimal(TestCase, unittest.TestCase):
         test_input = "asdf"
         self.assertRaises(Exception, utils.make_decimal, test_input)
 
+    def test_make_decimal_str_currency_passes(self):
+        test_input = "$1,234.567"
+        test_result = Decimal('1234.57')
+        self.assertEqual(utils.make_decimal(test_input), test_result)
+
+    def test_make_decimal_empty_passes(self):
+        for test_input in ['', None, False]:
+            self.assertEqual(utils.make_decimal(test_input), Decimal('0.00'))
+
+    def test_parse_amounts_column_passes(self):
+        test_input = ['$485.27', '', '6.5', '$485.27', Decimal('-1.005'), 3]
+        test_result = [Decimal('485.27'), Decimal('0.00'), Decimal('6.50'),
+                       Decimal('485.27'), Decimal('-1.00'), Decimal('3.00')]
+        self.assertEqual(utils.parse_amounts(test_input), test_result)
+
+    def test_parse_amount_cached(self):
+        utils.parse_amount.cache_clear()
+        utils.parse_amounts(['$485.27'] * 10)
+        self.assertEqual(utils.parse_amount.cache_info().misses, 1)
+
 
 class TestUtilsTsvToDict(TestCase):
 
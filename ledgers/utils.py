@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 import re
-import dateparser
+from calendar import monthrange
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 from dateutil.rrule import rrule, MONTHLY
 from decimal import Decimal
+from functools import lru_cache
 from django.utils.module_loading import import_string
 
+from ledgers.dates import parse_date
 from ledgers.periods import settings as period_settings
 from subledgers import settings as subledger_settings
 
@@ -77,6 +79,8 @@ def make_date(value):
     variation, eg: 5-2-2017 v. 2-5-2017 (May or Feb?).
 
     Firmly enforce non-ambiguous date by Month as word eg: 2-May-2017.
+
+    See `ledgers.dates` for the formats parsed without `dateparser`.
     """
     if type(value) == date:
         return value
@@ -84,30 +88,7 @@ def make_date(value):
     if type(value) == datetime:
         return value
 
-    if type(value) is str and len(value) == 8:
-        try:
-            return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
-        except ValueError:
-            pass
-
-    if type(value) is str and len(value) == 7:
-        try:
-            return date(int(value[0:4]), int(value[5:7]), 1)
-        except ValueError:
-            pass
-
-    if type(value) is str and len(value) == 6:
-        try:
-            return date(int(value[0:4]), int(value[4:6]), 1)
-        except ValueError:
-            pass
-
-    month_as_word = re.sub(r'[^a-zA-Z.]', '', value)
-    if not month_as_word:
-        raise Exception(
-            "Ambiguous date provided. Please provide month as word. eg: GOOD: 2-May-2017 BAD: 2017-02-05")  # noqa
-
-    return dateparser.parse(value)
+    return parse_date(value)
 
 
 def make_date_end(value):
@@ -134,13 +115,32 @@ def get_months(start, end):
 # Numbers Formats
 
 
+AMOUNT_PATTERN = re.compile(r'[^0-9\-.]')
+
+AMOUNT_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=AMOUNT_CACHE_SIZE)
+def parse_amount(value):
+    """ str amount to `Decimal`, eg. "$1,234.50" >> Decimal('1234.50').
+    Cached, the same literals repeat a lot in imports. """
+    if value == '':
+        return round(Decimal(0), 2)
+    return round(Decimal(AMOUNT_PATTERN.sub('', value)), 2)
+
+
 def make_decimal(value):
-    if value in ['', False, None]:
+    if isinstance(value, str):
+        return parse_amount(value)
+    if value in [False, None]:
         value = 0
-    try:
-        return round(Decimal(re.sub(r'[^0-9\-.]', '', value)), 2)
-    except TypeError:
-        return round(Decimal(value), 2)
+    return round(Decimal(value), 2)
+
+
+def parse_amounts(values):
+    """ As per `make_decimal` for a whole column, eg. every `value` in an
+    import. Returns list of `Decimal`. """
+    return [make_decimal(value) for value in values]
 
 
 def set_CR(value):
@@ -181,3 +181,35 @@ def tsv_to_dict(dump):
         raise Exception("""Failed to convert dump to dict.
 
 All that is required is a copy and paste from a spreadsheet.""")
+
+
+def iter_lines(dump, separator="\r\n"):
+    """ Yields lines of a str without building the whole list. """
+    start = 0
+    while True:
+        end = dump.find(separator, start)
+        if end == -1:
+            yield dump[start:]
+            return
+        yield dump[start:end]
+        start = end + len(separator)
+
+
+def iter_tsv_dicts(dump):
+    """ As per `tsv_to_dict`, but yields one row `dict` at a time.
+
+    `dump` is the pasted str, or any iterable of lines (eg. an open file).
+    Blank lines are skipped."""
+    if isinstance(dump, str):
+        lines = iter_lines(dump)
+    else:
+        lines = (line.rstrip("\r\n") for line in dump)
+    try:
+        header_row = next(lines).split("\t")
+    except (AttributeError, StopIteration, TypeError):
+        raise Exception("""Failed to convert dump to dict.
+
+All that is required is a copy and paste from a spreadsheet.""")
+    for item in lines:
+        if item.strip():
+            yield dict(zip(header_row, item.split("\t")))
@@ -143,6 +143,12 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Uploaded files, eg. bank statements waiting for import.
+
+MEDIA_ROOT = os.path.join(BASE_DIR, "../media")
+
+MEDIA_URL = '/media/'
+
 # 3rd Party Apps
 
 REST_FRAMEWORK = {
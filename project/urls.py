@@ -37,6 +37,8 @@ urlpatterns = [
     # "The Upload"
     path('upload/', upload_view, name="upload-view"),
 
+    path('subledgers/', include('subledgers.urls')),
+
     # internal app urls
 
     path('ledgers/', include('ledgers.urls')),
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
+from approx_dates.models import ApproxDate
 from django.views import generic
 
 from ledgers import utils
-from ledgers.models import Account, Transaction
+from ledgers.models import Account, Line, Transaction
 from ledgers.periods.models import CurrentFinancialYear
 
 
@@ -10,6 +11,8 @@ class AccountSet(object):
 
     # pretty sure this is quite independant, could be put in utils instead
     def get_accounts_set_year(self, months_list):
+        """ Two queries regardless of number of accounts/months:
+        accounts with totals, then the account x month matrix. """
 
         accounts_set = [
             {'account': a, 'month': [
@@ -17,14 +20,22 @@ class AccountSet(object):
             for a in Account.objects.all().total()
             if a.total]
 
-        for i, month in enumerate(months_list):
-            for acc_year in accounts_set:
-                acc_mth = Account.objects.month(month).total().by_code(
-                    acc_year['account'].get_code())
-                if acc_mth:
-                    acc_year['month'][i] = utils.make_CRDR(acc_mth.total)
+        if not months_list:
+            return accounts_set
+
+        matrix = Line.objects.range(
+            ApproxDate.from_iso8601(months_list[0]).earliest_date,
+            ApproxDate.from_iso8601(months_list[-1]).latest_date,
+        ).month_totals()
+
+        for acc_year in accounts_set:
+            account = acc_year['account']
+            for i, month in enumerate(months_list):
+                total = matrix.get((account.pk, month))
+                if total is not None:
+                    acc_year['month'][i] = utils.make_CRDR(total)
                     acc_year['month'][len(months_list)] = utils.make_CRDR(
-                        acc_year['account'].total)
+                        account.total)
 
         return accounts_set
 
@@ -61,7 +72,6 @@ class AccountDetailView(generic.detail.DetailView):
         context = super(AccountDetailView, self).get_context_data(
             *args, **kwargs)
 
-        context['transaction_list'] = t = Transaction.objects.filter(
+        context['transaction_list'] = Transaction.objects.filter(
             lines__account=self.get_object()).order_by('date')
-        print(t)
         return context
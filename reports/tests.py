@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from ledgers import utils
+from ledgers.models import Account, Transaction
+from reports.ledgers.views import AccountSet
+
+
+class TestAccountSetYear(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.bank = Account.objects.create(
+            element='01', number='0101', name='Test Bank Account')
+        self.months_list = utils.get_months_fyear('F17')
+
+    def add_accounts(self, n, start=0):
+        for x in range(start, start + n):
+            account = Account.objects.create(
+                element='15', number='{:0>4}'.format(x),
+                name='Test Expense Account')
+            for month in (8, 9, 12):
+                new_transaction = Transaction(
+                    date=date(2016, month, 2), user=self.user)
+                new_transaction.save(lines=(account, self.bank, x + 1))
+
+    def test_accounts_set_year_values(self):
+        self.add_accounts(2)
+        # outside of months_list, only in total column
+        new_transaction = Transaction(date=date(2015, 1, 1), user=self.user)
+        new_transaction.save(lines=(self.bank, '15-0000', 1))
+
+        accounts_set = AccountSet().get_accounts_set_year(self.months_list)
+        self.assertEqual(len(accounts_set), 3)
+        bank, expense0, expense1 = accounts_set
+        self.assertEqual(bank['account'], self.bank)
+        self.assertEqual(bank['month'][1], '-3.00 CR')
+        self.assertEqual(bank['month'][0], '')
+        self.assertEqual(bank['month'][-1], '-8.00 CR')
+        self.assertEqual(expense0['month'][1], '1.00 DR')
+        self.assertEqual(expense0['month'][5], '1.00 DR')
+        self.assertEqual(expense0['month'][-1], '2.00 DR')
+        self.assertEqual(expense1['month'][2], '2.00 DR')
+        self.assertEqual(expense1['month'][-1], '6.00 DR')
+
+    def test_accounts_set_year_queries_constant(self):
+        """ Benchmark: query count doesn't grow with number of accounts. """
+        self.add_accounts(3)
+        with self.assertNumQueries(2):
+            small = AccountSet().get_accounts_set_year(self.months_list)
+        self.add_accounts(30, start=3)
+        with self.assertNumQueries(2):
+            large = AccountSet().get_accounts_set_year(self.months_list)
+        self.assertEqual(len(small), 4)
+        self.assertEqual(len(large), 34)
@@ -0,0 +1 @@
+default_app_config = 'subledgers.bank_reconciliations.apps.BankReconciliationsConfig'
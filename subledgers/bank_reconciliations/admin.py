@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import BankLine, BankEntry
+from .models import BankLine, BankEntry, BankFeed, BankFeedFile
 
 
 class BankEntryAdmin(admin.ModelAdmin):
@@ -14,5 +14,18 @@ class BankLineAdmin(admin.ModelAdmin):
     list_filter = ['bank_account', 'bank_account__bank', 'date']
 
 
+class BankFeedAdmin(admin.ModelAdmin):
+    list_display = ['bank_account', 'directory', 'pattern', 'input_format',
+                    'is_active']
+
+
+class BankFeedFileAdmin(admin.ModelAdmin):
+    list_display = ['feed', 'name', 'offset', 'size', 'inserted', 'skipped',
+                    'updated_at']
+    list_filter = ['feed']
+
+
 admin.site.register(BankLine, BankLineAdmin)
 admin.site.register(BankEntry, BankEntryAdmin)
+admin.site.register(BankFeed, BankFeedAdmin)
+admin.site.register(BankFeedFile, BankFeedFileAdmin)
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 
 class BankReconciliationsConfig(AppConfig):
-    name = 'bank_reconciliations'
+    name = 'subledgers.bank_reconciliations'
+
+    def ready(self):
+        from subledgers.bank_reconciliations import signals  # noqa
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+""" Suggests an `Account` or `Creditor` for bank lines, from learned words.
+
+`BankLearning(word, account)` and `CreditorLearning(word, creditor)` are
+loaded once (two queries) into an inverted index: word >> targets. New
+learnings are added to the index as they are saved, edits and deletes
+reload it (see `bank_reconciliations.signals`).
+
+Usage:
+
+    from subledgers.bank_reconciliations.categoriser import categoriser
+
+    categoriser.suggest("WOOLWORTHS 1234 SYDNEY")
+    # Suggestion(kind='account', pk=5, label='[15-0501] Groceries',
+    #            confidence=0.75, words=['woolworths'])
+
+    categoriser.suggest_lines(BankLine.objects.unreconciled())
+    # {bank_line.pk: Suggestion or None, ...}
+
+Each matched word scores 1 shared between all of its targets, so a word
+learned for one target counts more than a word learned for several.
+`confidence` is the best target's share of the total score.
+"""
+import threading
+from collections import namedtuple
+
+from subledgers.creditors.models import CreditorLearning
+from .models import BankLearning
+from .tokens import normalise, tokenise
+
+
+ACCOUNT, CREDITOR = 'account', 'creditor'
+
+
+Suggestion = namedtuple('Suggestion', ['kind', 'pk', 'label', 'confidence',
+                                       'words'])
+
+
+class Categoriser(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._labels = None
+        self.version = 0
+
+    def invalidate(self, *args, **kwargs):
+        with self._lock:
+            self.version += 1
+            self._index = self._labels = None
+
+    def load(self):
+        """ Returns (index, labels):
+
+        index: {word: {(kind, pk): number of learnings}}
+        labels: {(kind, pk): str}
+        """
+        index, labels = self._index, self._labels
+        if index is not None:
+            return index, labels
+
+        version = self.version
+        index, labels = {}, {}
+        for word, pk, element, number, name in \
+                BankLearning.objects.values_list(
+                    'word', 'account_id', 'account__element',
+                    'account__number', 'account__name'):
+            # as per `Account.__str__`
+            label = "[{}-{:0>4}] {}".format(element, number, name)
+            self._add(index, labels, word, (ACCOUNT, pk), label)
+        for word, pk, code, name in CreditorLearning.objects.values_list(
+                'word', 'creditor_id', 'creditor__entity__code',
+                'creditor__entity__name'):
+            # as per `Entity.__str__`
+            label = "[{}] {}".format(code, name)
+            self._add(index, labels, word, (CREDITOR, pk), label)
+
+        with self._lock:
+            if self.version == version:
+                self._index, self._labels = index, labels
+        return index, labels
+
+    def _add(self, index, labels, word, target, label):
+        labels[target] = label
+        for token in tokenise(word):
+            targets = index.setdefault(token, {})
+            targets[target] = targets.get(target, 0) + 1
+
+    def learn(self, word, kind, pk, label):
+        """ Adds a new learning to the loaded index, if loaded. """
+        with self._lock:
+            if self._index is not None:
+                self._add(self._index, self._labels, word, (kind, pk), label)
+
+    def suggest(self, text, index=None, labels=None):
+        """ Returns best `Suggestion` for `text`, or None. `text` is
+        `normalise()`d as per `BankLine.tokens`. """
+        return self.suggest_tokens(normalise(text).split(), index, labels)
+
+    def suggest_tokens(self, tokens, index=None, labels=None):
+        """ As per `suggest`, for already tokenised text. """
+        if index is None:
+            index, labels = self.load()
+
+        scores, words = {}, {}
+        for token in set(tokens):
+            targets = index.get(token)
+            if not targets:
+                continue
+            weight = 1.0 / len(targets)
+            for target in targets:
+                scores[target] = scores.get(target, 0) + weight
+                words.setdefault(target, []).append(token)
+
+        if not scores:
+            return None
+        # highest score, ties to lowest (kind, pk) so results are stable
+        best = min(scores, key=lambda target: (-scores[target], target))
+        return Suggestion(
+            best[0], best[1], labels[best], round(
+                scores[best] / sum(scores.values()), 2),
+            sorted(words[best]))
+
+    def suggest_lines(self, bank_lines):
+        """ Scores every `BankLine` in one pass over an already loaded
+        index, using `BankLine.tokens` (description, or `line_dump` if there
+        is none). Returns {bank_line.pk: Suggestion or None}. """
+        index, labels = self.load()
+        return {
+            line.pk: self.suggest_tokens(
+                (line.tokens or normalise(
+                    line.description or line.line_dump)).split(),
+                index, labels)
+            for line in bank_lines}
+
+
+categoriser = Categoriser()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+""" Imports statement files dropped by the bank into a `BankFeed` directory.
+
+    ./manage.py watch_bank_feeds          # keep polling feed directories
+    ./manage.py watch_bank_feeds --once   # import anything new then exit
+
+Each file has a `BankFeedFile` checkpoint of the bytes already imported, so
+only new files, or the new lines of a file still being written to
+(intraday), are read. Lines are parsed with the bank's statement parser and
+inserted in batches by `utils.import_bank_statement`.
+
+- Line formats (tsv, csv) are read from the checkpoint on. A last line
+  without a newline is left for next time, unless the file has not changed
+  for `BANK_FEED_SETTLE_SECONDS`.
+- Other formats (ofx, qif) are read whole, once the file has not changed for
+  `BANK_FEED_SETTLE_SECONDS`.
+
+A file which shrinks (replaced) is read again from the start, lines already
+imported are skipped as per any statement import.
+
+A file which can't be imported (eg. unparsable) has the error stored on its
+`BankFeedFile` and logged, its offset is left alone so it is tried again
+next time, and the other files and feeds are still imported.
+"""
+import fnmatch
+import logging
+import os
+import time
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from .models import BankFeed, BankFeedFile
+from .parsers import get_parser
+from .utils import import_bank_statement
+
+
+BANK_FEED_SETTLE_SECONDS = getattr(settings, 'BANK_FEED_SETTLE_SECONDS', 60)
+
+LINE_FORMATS = ['tsv', 'csv']
+
+logger = logging.getLogger(__name__)
+
+
+class TailReader(object):
+    """ Iterates lines (bytes) of `statement_file` from `offset`, keeping
+    `offset` at the end of the last line read.
+
+    A last line without a newline is only read if `complete`. """
+
+    def __init__(self, statement_file, offset=0, complete=False):
+        self.statement_file = statement_file
+        self.offset = offset
+        self.complete = complete
+        self.first_line = None
+
+    def __iter__(self):
+        self.statement_file.seek(self.offset)
+        for line in iter(self.statement_file.readline, b''):
+            if not line.endswith(b'\n') and not self.complete:
+                return
+            if self.offset == 0:
+                self.first_line = line
+            self.offset += len(line)
+            yield line
+
+
+def ingest_file(feed, name, settle=None):
+    """ Imports whatever is new in `feed` file `name`. Returns its
+    `BankFeedFile` checkpoint. """
+    settle = BANK_FEED_SETTLE_SECONDS if settle is None else settle
+    stat = os.stat(os.path.join(feed.directory, name))
+    complete = time.time() - stat.st_mtime >= settle
+    checkpoint, created = BankFeedFile.objects.get_or_create(
+        feed=feed, name=name)
+
+    if stat.st_size < checkpoint.offset:
+        # Replaced: start again.
+        checkpoint.offset, checkpoint.header = 0, ""
+    # Nothing new, or only a partial last line which hasn't changed since.
+    if stat.st_size == checkpoint.offset or \
+            (stat.st_size == checkpoint.size and not complete):
+        return checkpoint
+
+    line_format = feed.input_format in LINE_FORMATS
+    if not line_format and not complete:
+        return checkpoint
+    parser = get_parser(feed.bank_account.bank, feed.input_format)
+    offset = checkpoint.offset if line_format else 0
+
+    # Checkpoint is only moved on if the lines read are committed.
+    with db_transaction.atomic(), \
+            open(os.path.join(feed.directory, name), 'rb') as statement_file:
+        reader = TailReader(statement_file, offset, complete)
+        lines = reader
+        if parser.header and offset:
+            lines = chain([checkpoint.header.encode('utf-8') + b'\n'], reader)
+
+        results = import_bank_statement({
+            'bank': feed.bank_account_id,
+            'format': feed.input_format,
+            'input_data': lines,
+        }, append=bool(offset))
+
+        if reader.first_line is not None:
+            checkpoint.header = reader.first_line.decode(
+                'utf-8-sig').rstrip("\r\n")[:2048]
+        checkpoint.offset = reader.offset
+        checkpoint.size = stat.st_size
+        checkpoint.inserted += results['inserted']
+        checkpoint.skipped += results['skipped']
+        checkpoint.error = ""
+        checkpoint.save()
+    return checkpoint
+
+
+def record_error(feed, name, error):
+    """ Stores `error` on the `BankFeedFile` of `name`, nothing else
+    changed. Returns the checkpoint. """
+    checkpoint, created = BankFeedFile.objects.get_or_create(
+        feed=feed, name=name)
+    checkpoint.error = str(error)[:2048] or error.__class__.__name__
+    BankFeedFile.objects.filter(pk=checkpoint.pk).update(
+        error=checkpoint.error)
+    return checkpoint
+
+
+def scan_feed(feed, settle=None):
+    """ Imports new files/lines in `feed` directory, oldest name first.
+    Returns list of checkpoints of files read, with `error` set for any
+    which failed. """
+    checkpoints = []
+    for name in sorted(os.listdir(feed.directory)):
+        if not fnmatch.fnmatch(name, feed.pattern) or \
+                not os.path.isfile(os.path.join(feed.directory, name)):
+            continue
+        try:
+            checkpoints.append(ingest_file(feed, name, settle))
+        except Exception as e:
+            logger.exception("Bank feed %s: can't import %s", feed, name)
+            checkpoints.append(record_error(feed, name, e))
+    return checkpoints
+
+
+def scan_feeds(settle=None):
+    """ `scan_feed` for every active `BankFeed`. A feed which can't be read
+    at all (eg. missing directory) is logged and left out. """
+    results = {}
+    for feed in BankFeed.objects.filter(
+            is_active=True).select_related('bank_account'):
+        try:
+            results[feed] = scan_feed(feed, settle)
+        except Exception:
+            logger.exception("Bank feed %s: can't scan directory", feed)
+    return results
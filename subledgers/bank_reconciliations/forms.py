@@ -4,6 +4,7 @@ from django import forms
 
 from ledgers.bank_accounts.models import BankAccount
 # from .models import BankLine
+from .parsers import FORMATS
 
 
 class StatementUploadForm(forms.Form):
@@ -14,6 +15,14 @@ class StatementUploadForm(forms.Form):
         widget=forms.Textarea(attrs={'rows': 15, 'cols': 100}))
 
 
+class StatementFileUploadForm(forms.Form):
+
+    bank = forms.ModelChoiceField(
+        queryset=BankAccount.objects.all(), empty_label=None)
+    input_format = forms.ChoiceField(choices=FORMATS, initial='csv')
+    statement_file = forms.FileField()
+
+
 class BankReconciliationForm(forms.Form):
 
     pk = forms.IntegerField()
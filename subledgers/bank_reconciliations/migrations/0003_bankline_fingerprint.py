@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def make_fingerprint(bank_account_id, date, value, line_dump, balance,
+                     occurrence=0):
+    # Copy of `bank_reconciliations.models.make_fingerprint` at this point.
+    balance = "" if balance is None else Decimal(balance).quantize(
+        Decimal('0.01'))
+    key = "|".join(str(x) for x in [
+        bank_account_id, date.isoformat(),
+        Decimal(value).quantize(Decimal('0.01')), line_dump, balance,
+        occurrence])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    BankLine = apps.get_model('bank_reconciliations', 'BankLine')
+    occurrences = {}
+    for line in BankLine.objects.order_by('bank_account', 'date', 'pk'):
+        key = (line.bank_account_id, line.date, line.value, line.line_dump,
+               line.balance)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        BankLine.objects.filter(pk=line.pk).update(
+            fingerprint=make_fingerprint(*key, occurrence=occurrence))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_reconciliations', '0002_auto_20171103_0617'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankline',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=40),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def backfill_is_reconciled(apps, schema_editor):
+    BankLine = apps.get_model('bank_reconciliations', 'BankLine')
+    BankLine.objects.filter(bankentry__isnull=False).update(
+        is_reconciled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_reconciliations', '0003_bankline_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankline',
+            name='is_reconciled',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddIndex(
+            model_name='bankline',
+            index=models.Index(fields=['is_reconciled', 'date', 'id'],
+                               name='bankline_queue_idx'),
+        ),
+        migrations.RunPython(backfill_is_reconciled,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_accounts', '0001_initial'),
+        ('bank_reconciliations', '0004_bankline_is_reconciled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankFeed',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('directory', models.CharField(max_length=1024)),
+                ('pattern', models.CharField(default='*', max_length=64)),
+                ('input_format', models.CharField(choices=[('tsv', 'Pasted from spreadsheet'), ('csv', 'CSV'), ('ofx', 'OFX'), ('qif', 'QIF')], default='csv', max_length=8)),
+                ('is_active', models.BooleanField(default=True)),
+                ('bank_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeds', to='bank_accounts.BankAccount')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BankFeedFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('size', models.BigIntegerField(default=0)),
+                ('header', models.CharField(blank=True, default='', max_length=2048)),
+                ('inserted', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='bank_reconciliations.BankFeed')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='bankfeedfile',
+            unique_together={('feed', 'name')},
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_reconciliations', '0005_bankfeed_bankfeedfile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bankline',
+            index=models.Index(fields=['bank_account', 'is_reconciled', 'date', 'id'], name='bankline_account_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bankline',
+            index=models.Index(fields=['bank_account', 'value'], name='bankline_account_value_idx'),
+        ),
+    ]
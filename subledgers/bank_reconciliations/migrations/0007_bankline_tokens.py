@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+import zlib
+
+from django.db import migrations, models
+
+
+# Copy of `bank_reconciliations.tokens` at this point.
+TOKEN_PATTERN = re.compile(r"[a-z0-9&']+")
+
+NOISE_PATTERN = re.compile(
+    r"card xx\d+|value date:?\s*\S+|\b\d+[/\-.]\d+[/\-.]\d+\b")
+
+
+def normalise(text):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(
+            NOISE_PATTERN.sub(" ", (text or "").lower())):
+        if len(token) > 1 and not token.isdigit() and token not in tokens:
+            tokens.append(token)
+    return " ".join(tokens)
+
+
+def backfill_tokens(apps, schema_editor):
+    BankLine = apps.get_model('bank_reconciliations', 'BankLine')
+    for pk, description, line_dump in BankLine.objects.values_list(
+            'pk', 'description', 'line_dump'):
+        tokens = normalise(description or line_dump)[:512]
+        BankLine.objects.filter(pk=pk).update(
+            tokens=tokens,
+            signature=zlib.crc32(tokens.encode('utf-8')) if tokens else 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_reconciliations', '0006_bankline_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankline',
+            name='tokens',
+            field=models.CharField(blank=True, default='', max_length=512),
+        ),
+        migrations.AddField(
+            model_name='bankline',
+            name='signature',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_tokens, migrations.RunPython.noop),
+    ]
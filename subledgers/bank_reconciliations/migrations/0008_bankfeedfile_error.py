@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_reconciliations', '0007_bankline_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankfeedfile',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def make_fingerprint(bank_account_id, date, value, line_dump, balance,
+                     occurrence=0):
+    # Copy of `bank_reconciliations.models.make_fingerprint` at this point.
+    balance = "" if balance is None else Decimal(balance).quantize(
+        Decimal('0.01'))
+    key = "|".join(str(x) for x in [
+        bank_account_id, date.isoformat(),
+        Decimal(value).quantize(Decimal('0.01')), line_dump, balance,
+        occurrence])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def renumber_duplicates(apps, schema_editor):
+    """ Lines inserted twice by concurrent imports are kept, as identical
+    lines: re-fingerprinted after the last occurrence stored. """
+    BankLine = apps.get_model('bank_reconciliations', 'BankLine')
+    duplicates = BankLine.objects.order_by().values(
+        'bank_account', 'fingerprint').annotate(
+        count=Count('pk')).filter(count__gt=1)
+    for row in duplicates:
+        lines = list(BankLine.objects.filter(
+            bank_account=row['bank_account'],
+            fingerprint=row['fingerprint']).order_by('pk'))
+        first = lines[0]
+        key = (first.bank_account_id, first.date, first.value,
+               first.line_dump, first.balance)
+        taken = set(BankLine.objects.filter(
+            bank_account=first.bank_account_id).values_list(
+            'fingerprint', flat=True))
+        occurrence = 0
+        for line in lines[1:]:
+            fingerprint = make_fingerprint(*key, occurrence=occurrence)
+            while fingerprint in taken:
+                occurrence += 1
+                fingerprint = make_fingerprint(*key, occurrence=occurrence)
+            taken.add(fingerprint)
+            BankLine.objects.filter(pk=line.pk).update(
+                fingerprint=fingerprint)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_reconciliations', '0008_bankfeedfile_error'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='bankline',
+            unique_together={('bank_account', 'fingerprint')},
+        ),
+    ]
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
+import hashlib
+from decimal import Decimal
+
 from django.db import models
 
 from ..models import Entry
 from ..settings import SUBLEDGERS_AVAILABLE
 from . import querysets
+from .parsers import FORMATS
+from .tokens import make_signature, normalise
 
 
 class BankEntry(Entry):
@@ -23,6 +28,24 @@ class BankEntry(Entry):
         verbose_name_plural = "bank entries"
 
 
+def make_fingerprint(bank_account_id, date, value, line_dump, balance,
+                     occurrence=0):
+    """ Identifies a statement line, so re-importing a statement (or
+    overlapping statements) doesn't duplicate `BankLine`s.
+
+    Identical lines can legitimately occur on a statement (eg. two coffees
+    the same day), `occurrence` is the position among identical lines:
+    0 for the first, 1 for the second, etc.
+    """
+    balance = "" if balance is None else Decimal(balance).quantize(
+        Decimal('0.01'))
+    key = "|".join(str(x) for x in [
+        bank_account_id, date.isoformat(),
+        Decimal(value).quantize(Decimal('0.01')), line_dump, balance,
+        occurrence])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
 class BankLine(models.Model):
 
     # ** Outside of Trial Balance/accounting system **
@@ -66,8 +89,21 @@ class BankLine(models.Model):
 
     not_now = models.BooleanField(default=False)
 
+    # See `make_fingerprint`, set on import/save.
+    fingerprint = models.CharField(max_length=40, blank=True, default="",
+                                   db_index=True)
+
+    # See `tokens`, set on import/save: normalised `description` words, and a
+    # hash of them shared by lines with the same words.
+    tokens = models.CharField(max_length=512, blank=True, default="")
+    signature = models.BigIntegerField(default=0, db_index=True)
+
     # ~~ working fields ~~
 
+    # Denormalised "has a `BankEntry`", kept in sync by
+    # `bank_reconciliations.signals` (and bulk categorisation).
+    is_reconciled = models.BooleanField(default=False, db_index=True)
+
     note = models.CharField(max_length=64, blank=True, default=None, null=True)
 
     tags = models.ManyToManyField('ledgers.Tag', blank=True, default=None,
@@ -77,11 +113,41 @@ class BankLine(models.Model):
 
     class Meta:
         ordering = ['date']
+        # Concurrent imports (uploads, feeds) can't insert a line twice.
+        unique_together = ('bank_account', 'fingerprint')
+        indexes = [
+            # Unreconciled queue, paged by (date, pk), see `pagination`.
+            models.Index(fields=['is_reconciled', 'date', 'id'],
+                         name='bankline_queue_idx'),
+            # As above by bank account, see `views.BankLineViewSet` filters.
+            models.Index(fields=['bank_account', 'is_reconciled', 'date',
+                                 'id'],
+                         name='bankline_account_queue_idx'),
+            models.Index(fields=['bank_account', 'value'],
+                         name='bankline_account_value_idx'),
+        ]
 
     def __str__(self):
         return "{:%d-%b-%Y} -- ${} -- {}".format(self.date, self.value,
                                                  self.description)
 
+    def set_tokens(self):
+        self.tokens = normalise(self.description or self.line_dump)[:512]
+        self.signature = make_signature(self.tokens)
+
+    def save(self, *args, **kwargs):
+        self.set_tokens()
+        if not self.fingerprint:
+            # Saved one at a time: position after any identical lines.
+            occurrence = BankLine.objects.filter(
+                bank_account_id=self.bank_account_id, date=self.date,
+                value=self.value, line_dump=self.line_dump,
+                balance=self.balance).exclude(pk=self.pk).count()
+            self.fingerprint = make_fingerprint(
+                self.bank_account_id, self.date, self.value, self.line_dump,
+                self.balance, occurrence)
+        super(BankLine, self).save(*args, **kwargs)
+
 
 # ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
 
@@ -101,3 +167,65 @@ class BankLearning(models.Model):
 
     account = models.ForeignKey(
         'ledgers.Account', models.CASCADE)
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Bank Feeds
+
+# Statement files dropped in a directory by the bank, see `feeds`.
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+class BankFeed(models.Model):
+
+    bank_account = models.ForeignKey(
+        'bank_accounts.BankAccount', models.CASCADE, related_name='feeds')
+
+    # Local directory watched for statement files.
+    directory = models.CharField(max_length=1024)
+
+    # Only file names matching, eg. "*.csv"
+    pattern = models.CharField(max_length=64, default='*')
+
+    input_format = models.CharField(max_length=8, choices=FORMATS,
+                                    default='csv')
+
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return "{} {}".format(self.bank_account, self.directory)
+
+
+class BankFeedFile(models.Model):
+    """ Checkpoint of how much of a feed file has been imported. """
+
+    feed = models.ForeignKey('bank_reconciliations.BankFeed', models.CASCADE,
+                             related_name='files')
+
+    name = models.CharField(max_length=255)
+
+    # Bytes imported so far: only what is after this is read next time.
+    offset = models.BigIntegerField(default=0)
+
+    # File size when last seen.
+    size = models.BigIntegerField(default=0)
+
+    # First line, for formats which need it to parse later lines.
+    header = models.CharField(max_length=2048, blank=True, default="")
+
+    inserted = models.IntegerField(default=0)
+
+    skipped = models.IntegerField(default=0)
+
+    # Last error importing the file, blank once imported.
+    error = models.TextField(blank=True, default="")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('feed', 'name')
+
+    def __str__(self):
+        return "{} {} [{}]".format(self.feed, self.name, self.offset)
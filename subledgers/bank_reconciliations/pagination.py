@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+""" Keyset pagination of `BankLine`s by (date, pk).
+
+An offset page has to count past every earlier line, a keyset page starts
+from the last line seen using the `bankline_queue_idx` index, so opening
+page 1,000 of the unreconciled queue costs the same as page 1.
+
+Cursors are the last line of the previous page: "<date>.<pk>" eg.
+"2017-06-02.153".
+
+Usage:
+
+    object_list, next_cursor = keyset_page(
+        BankLine.objects.unreconciled(), request.GET.get('cursor'))
+"""
+from datetime import datetime
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+BANK_LINE_PAGE_SIZE = getattr(settings, 'BANK_LINE_PAGE_SIZE', 100)
+
+
+def parse_iso_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def encode_cursor(bank_line):
+    return "{:%Y-%m-%d}.{}".format(bank_line.date, bank_line.pk)
+
+
+def decode_cursor(cursor):
+    """ Returns (date, pk) from `cursor`. """
+    try:
+        cursor_date, pk = cursor.split('.')
+        return parse_iso_date(cursor_date), int(pk)
+    except (AttributeError, ValueError):
+        raise Exception("Invalid cursor: {}".format(cursor))
+
+
+def keyset_page(queryset, cursor=None, page_size=None):
+    """ Returns (list of up to `page_size` lines after `cursor`, cursor of
+    the next page or None if this is the last page). """
+    page_size = page_size or BANK_LINE_PAGE_SIZE
+    if cursor:
+        queryset = queryset.after(*decode_cursor(cursor))
+    else:
+        queryset = queryset.order_by('date', 'pk')
+
+    # one extra line to know if there is a next page, without a count.
+    object_list = list(queryset[:page_size + 1])
+    if len(object_list) <= page_size:
+        return object_list, None
+    object_list = object_list[:page_size]
+    return object_list, encode_cursor(object_list[-1])
+
+
+class BankLineKeysetPagination(BasePagination):
+    """ `keyset_page` for `BankLineViewSet`: `?cursor=...&page_size=...`. """
+
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            page_size = max(1, min(int(request.query_params['page_size']),
+                                   self.max_page_size))
+        except (KeyError, ValueError):
+            page_size = BANK_LINE_PAGE_SIZE
+        try:
+            object_list, self.next_cursor = keyset_page(
+                queryset, request.query_params.get('cursor'), page_size)
+        except Exception as e:
+            raise NotFound(str(e))
+        return object_list
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        query_params = self.request.query_params.copy()
+        query_params['cursor'] = self.next_cursor
+        return self.request.build_absolute_uri(
+            "{}?{}".format(self.request.path, query_params.urlencode()))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
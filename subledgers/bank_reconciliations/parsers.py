@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+""" Bank statement parsers, keyed on (`BankAccount.bank`, format).
+
+Every parser takes an iterable of text lines and yields `BankLine` kwargs:
+
+    {'date', 'value', 'line_dump', 'description', 'additional', 'balance'}
+
+one line at a time, so a statement file is never held in memory.
+
+Parsers registered with bank `None` are used for any bank without its own
+parser for that format:
+
+    @register('CBA', 'csv')
+    def parse_CBA_csv(lines):
+        ...
+
+    get_parser(bank_account.bank, 'csv')
+
+Unlike subledger uploads, numeric dates are accepted in statement files as
+the format is known for each bank (`BANK_STATEMENT_DAY_FIRST`).
+"""
+import codecs
+import csv
+import re
+from datetime import date, datetime
+
+from django.conf import settings
+
+from ledgers.dates import make_year
+from ledgers.utils import iter_lines, make_date, make_decimal
+
+
+BANK_STATEMENT_DAY_FIRST = getattr(
+    settings, 'BANK_STATEMENT_DAY_FIRST', True)
+
+FORMATS = [
+    ('tsv', 'Pasted from spreadsheet'),
+    ('csv', 'CSV'),
+    ('ofx', 'OFX'),
+    ('qif', 'QIF'),
+]
+
+PARSERS = {}
+
+
+def register(bank, statement_format, header=False):
+    """ Decorator registering a parser for `bank` (or None: any bank).
+
+    `header`: the parser needs the file's first line (eg. column names)
+    to parse any later lines. """
+    def decorator(parser):
+        parser.header = header
+        PARSERS[(bank, statement_format)] = parser
+        return parser
+    return decorator
+
+
+def get_parser(bank, statement_format):
+    for key in [(bank, statement_format), (None, statement_format)]:
+        if key in PARSERS:
+            return PARSERS[key]
+    raise Exception("No {} statement parser for bank {}.".format(
+        statement_format, bank))
+
+
+def iter_statement_lines(data):
+    """ Yields text lines from pasted str or an (uploaded) file in binary
+    mode, without reading the whole file. Blank lines are skipped. """
+    if isinstance(data, str):
+        lines = iter_lines(data)
+    else:
+        lines = codecs.iterdecode(data, 'utf-8-sig')
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.strip():
+            yield line
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Field helpers
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+NUMERIC_DATE = re.compile(r"^\s*(\d{1,4})[/\-.'](\d{1,2})[/\-.'](\d{2,4})")
+
+
+def make_statement_date(value, day_first=None):
+    """ `date` from statement date, numeric (eg. 02/06/2017, 6/2'17, as
+    per `BANK_STATEMENT_DAY_FIRST`) or month as word.
+
+    2 digit years as per `ledgers.dates.make_year`. """
+    if day_first is None:
+        day_first = BANK_STATEMENT_DAY_FIRST
+    match = NUMERIC_DATE.match(value)
+    if not match:
+        parsed = make_date(value.strip())
+        return parsed.date() if isinstance(parsed, datetime) else parsed
+    first, second, year = match.groups()
+    if len(first) == 4:
+        # ISO, eg. 2017-06-02
+        year, first, second = first, second, year
+        day_first = False
+    year = make_year(year)
+    if day_first:
+        return date(year, int(second), int(first))
+    return date(year, int(first), int(second))
+
+
+def process_line_dump(line_dump):
+    """ Splits bank additional information from description, at the first
+    of `splits` found in `line_dump`. """
+    splits = [
+        'Card xx',
+        'Value Date: ',
+        'BPAY ',
+    ]
+    for split in splits:
+        try:
+            description, additional = line_dump.split(split)
+            return description, "{}{}".format(split, additional)
+        except ValueError:
+            pass
+    return line_dump, ''
+
+
+def make_kwargs(line_date, value, description, additional='', balance=None,
+                line_dump=None):
+    if line_dump is None:
+        line_dump = " ".join(x for x in [description, additional] if x)
+    return {
+        'date': line_date,
+        'value': make_decimal(value),
+        'line_dump': line_dump,
+        'description': description,
+        'additional': additional,
+        'balance': None if balance in ['', None] else make_decimal(balance),
+    }
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Pasted from spreadsheet (tab separated)
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+@register('CBA', 'tsv')
+def preprocess_statement_CBA(lines):
+    # date	value	line_dump	balance
+    for line in lines:
+        if line.split('\t')[0] == 'date':
+            continue
+        line_date, value, line_dump, balance = line.split('\t')
+        description, additional = process_line_dump(line_dump)
+        yield make_kwargs(make_date(line_date).date(), value, description,
+                          additional, balance, line_dump=line_dump)
+
+
+@register('NAB', 'tsv')
+def preprocess_statement_NAB(lines):
+    # date	value	nil	nil	additional	description	balance
+    for line in lines:
+        line_date, value, nil, nil, additional, description, balance = \
+            line.split('\t')
+        yield make_kwargs(make_date(line_date).date(), value, description,
+                          additional, balance,
+                          line_dump="{} {}".format(description, additional))
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# CSV
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+@register(None, 'csv', header=True)
+def parse_csv(lines):
+    """ CSV with header row, columns (any case/order):
+    date, value (or amount), description, [additional], [balance] """
+    reader = csv.reader(lines)
+    header = [column.strip().lower() for column in next(reader, [])]
+    if 'amount' in header and 'value' not in header:
+        header[header.index('amount')] = 'value'
+    for row in reader:
+        row = dict(zip(header, row))
+        yield make_kwargs(
+            make_statement_date(row['date']), row['value'],
+            row.get('description', ''), row.get('additional', ''),
+            row.get('balance'))
+
+
+@register('CBA', 'csv')
+def parse_CBA_csv(lines):
+    # CommBank export, no header: date, value, line_dump, balance
+    for row in csv.reader(lines):
+        line_date, value, line_dump, balance = row[:4]
+        description, additional = process_line_dump(line_dump)
+        yield make_kwargs(make_statement_date(line_date), value,
+                          description, additional, balance,
+                          line_dump=line_dump)
+
+
+@register('NAB', 'csv')
+def parse_NAB_csv(lines):
+    # NAB export, as per NAB tsv plus trailing columns (category etc.)
+    for row in csv.reader(lines):
+        if row[0].strip().lower() == 'date':
+            continue
+        line_date, value, nil, nil, additional, description, balance = \
+            row[:7]
+        yield make_kwargs(make_statement_date(line_date), value, description,
+                          additional, balance,
+                          line_dump="{} {}".format(description, additional))
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# OFX (SGML or XML, tags on one or many lines)
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+@register(None, 'ofx')
+def parse_ofx(lines):
+    transaction = None
+    for line in lines:
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag, value = tag.upper(), value.strip()
+            if tag == 'STMTTRN':
+                if closing and transaction is not None:
+                    yield make_kwargs(
+                        make_date(transaction['DTPOSTED'][:8]),
+                        transaction['TRNAMT'],
+                        transaction.get('NAME', ''),
+                        transaction.get('MEMO', ''))
+                    transaction = None
+                elif not closing:
+                    transaction = {}
+            elif transaction is not None and not closing and value:
+                transaction[tag] = value
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# QIF
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+@register(None, 'qif')
+def parse_qif(lines):
+    record = {}
+    for line in lines:
+        code, value = line[0], line[1:].strip()
+        if code == '!':
+            continue  # eg. !Type:Bank
+        if code == '^':
+            if record:
+                yield make_kwargs(
+                    make_statement_date(record['D']),
+                    record.get('T', record.get('U')),
+                    record.get('P', ''), record.get('M', ''))
+            record = {}
+        else:
+            record[code] = value
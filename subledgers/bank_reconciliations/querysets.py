@@ -2,12 +2,34 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 from django.db import models
+from django.db.models import Q
+
+from .tokens import make_signature, normalise
 
 
 class QuerySet(models.query.QuerySet):
 
     def reconciled(self):
-        return self.filter(bankentry__id__gt=0)
+        return self.filter(is_reconciled=True)
 
     def unreconciled(self):
-        return self.exclude(bankentry__id__gt=0)
+        return self.filter(is_reconciled=False)
+
+    def after(self, date, pk):
+        """ Lines after (`date`, `pk`), in that order. See `pagination`. """
+        return self.filter(
+            Q(date__gt=date) | Q(date=date, pk__gt=pk)).order_by('date', 'pk')
+
+    def similar(self, text):
+        """ Lines with the same normalised words as `text`, see `tokens`. """
+        return self.filter(signature=make_signature(normalise(text)))
+
+    def search(self, text):
+        """ Lines with all the normalised words of `text`. """
+        queryset = self
+        for token in normalise(text).split():
+            queryset = queryset.filter(
+                Q(tokens=token) | Q(tokens__startswith=token + " ") |
+                Q(tokens__endswith=" " + token) |
+                Q(tokens__contains=" " + token + " "))
+        return queryset
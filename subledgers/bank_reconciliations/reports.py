@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+""" Bank reconciliation statement, for a `BankAccount` as at a date.
+
+    statement balance
+    - unreconciled bank lines    (on the statement, not yet in the ledger)
+    + unpresented ledger lines   (in the ledger, not yet on the statement)
+    = ledger balance
+
+`difference` is what is left over, zero once reconciled. Ledger amounts
+are reported with the statement's sign, see `as_statement()`.
+
+Statement running balances are computed in one ordered pass over the
+period's lines from an opening balance (the last statement `balance` before
+the period plus one aggregate), rather than summing every line up to each
+date. The ledger balance comes from `AccountPeriodBalance` for whole months
+plus the lines of the last month.
+
+Usage:
+
+    reconciliation_statement(bank_account, date(2017, 6, 30))
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+from ledgers.models import AccountPeriodBalance, Line
+from .models import BankLine
+
+
+# Bank lines are categorised DR account, CR bank account for the statement
+# value (`BankEntry.save_transaction()`, `categorise_bank_lines()`): the bank
+# account's ledger lines carry the opposite sign to the statement.
+STATEMENT_SIGN = -1
+
+
+def as_statement(value):
+    """ Bank account ledger `value` with the statement's sign. """
+    return STATEMENT_SIGN * value
+
+
+def ledger_balance(account, as_of):
+    """ Total of `Line`s of `account` up to and including `as_of`. """
+    month = date(as_of.year, as_of.month, 1)
+    months = AccountPeriodBalance.objects.filter(
+        account=account, month__lt=month).aggregate(
+        total=Sum('net'))['total'] or Decimal(0)
+    days = Line.objects.filter(
+        account=account, transaction__date__range=(month, as_of)).aggregate(
+        total=Sum('value'))['total'] or Decimal(0)
+    return months + days
+
+
+def opening_balance(bank_account, date_from):
+    """ Balance before `date_from`: the last `balance` provided by the
+    statement plus any lines after it, or the total of all earlier lines if
+    the statement never provided one. """
+    earlier = BankLine.objects.filter(bank_account=bank_account,
+                                      date__lt=date_from)
+    anchor = earlier.filter(balance__isnull=False).order_by(
+        '-date', '-pk').values_list('date', 'pk', 'balance').first()
+    if anchor:
+        anchor_date, pk, opening = anchor
+        earlier = earlier.after(anchor_date, pk)
+    else:
+        opening = Decimal(0)
+    return opening + (earlier.aggregate(
+        total=Sum('value'))['total'] or Decimal(0))
+
+
+def statement_lines(bank_account, date_from, as_of):
+    """ Returns (opening balance, [BankLine, ...]) for `date_from` to
+    `as_of`, each line with `running_balance` and `balance_differs` (the
+    statement's own `balance` doesn't agree, eg. missing lines). """
+    opening = opening_balance(bank_account, date_from)
+
+    running, object_list = opening, []
+    for bank_line in BankLine.objects.filter(
+            bank_account=bank_account,
+            date__range=(date_from, as_of)).order_by('date', 'pk'):
+        running += bank_line.value
+        bank_line.running_balance = running
+        bank_line.balance_differs = bank_line.balance is not None and \
+            bank_line.balance != running
+        object_list.append(bank_line)
+    return opening, object_list
+
+
+def reconciliation_statement(bank_account, as_of, date_from=None):
+    """ Returns dict, see module docstring. `date_from` (default 1st of
+    `as_of` month) is the start of the statement lines listed. """
+    date_from = date_from or date(as_of.year, as_of.month, 1)
+    opening, object_list = statement_lines(bank_account, date_from, as_of)
+
+    # Statement's own closing balance if it has one.
+    statement_balance = opening
+    if object_list:
+        statement_balance = object_list[-1].balance
+        if statement_balance is None:
+            statement_balance = object_list[-1].running_balance
+
+    # Not reconciled as at `as_of`: no `BankEntry`, or posted after it.
+    unreconciled = list(BankLine.objects.filter(
+        bank_account=bank_account, date__lte=as_of).filter(
+        Q(is_reconciled=False) |
+        Q(bankentry__transaction__date__gt=as_of)).order_by('date', 'pk'))
+
+    # In the ledger by `as_of`, but not matched to a bank line by then.
+    unpresented = list(Line.objects.filter(
+        account=bank_account.account,
+        transaction__date__lte=as_of).exclude(
+        transaction__bankentry__bank_line__date__lte=as_of).select_related(
+        'transaction').order_by('transaction__date', 'pk'))
+    for line in unpresented:
+        line.statement_value = as_statement(line.value)
+
+    unreconciled_total = sum(x.value for x in unreconciled) or Decimal(0)
+    unpresented_total = sum(
+        x.statement_value for x in unpresented) or Decimal(0)
+    balance = as_statement(ledger_balance(bank_account.account, as_of))
+    adjusted = statement_balance - unreconciled_total + unpresented_total
+
+    return {
+        'bank_account': bank_account,
+        'as_of': as_of,
+        'date_from': date_from,
+        'opening_balance': opening,
+        'statement_balance': statement_balance,
+        'statement_lines': object_list,
+        'unreconciled': unreconciled,
+        'unreconciled_total': unreconciled_total,
+        'unpresented': unpresented,
+        'unpresented_total': unpresented_total,
+        'adjusted_balance': adjusted,
+        'ledger_balance': balance,
+        'difference': balance - adjusted,
+    }
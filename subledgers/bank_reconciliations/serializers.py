@@ -5,7 +5,18 @@ from .models import BankLine
 
 
 class BankLineSerializer(serializers.ModelSerializer):
+    """ `fields`: optional list of field names, only these are included. """
+
+    # Concrete columns, as can be used with `QuerySet.only()`.
+    COLUMNS = [field.name for field in BankLine._meta.concrete_fields]
 
     class Meta:
         model = BankLine
         exclude = ['bank_account']
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super(BankLineSerializer, self).__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields) - {'id'}:
+                self.fields.pop(name)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from subledgers.creditors.models import CreditorLearning
+from .categoriser import ACCOUNT, CREDITOR, categoriser
+from .models import BankEntry, BankLearning, BankLine
+
+
+@receiver(post_save, sender=BankLearning)
+def learn_bank_learning(sender, instance, created, **kwargs):
+    if created:
+        categoriser.learn(instance.word, ACCOUNT, instance.account_id,
+                          str(instance.account))
+    else:
+        categoriser.invalidate()
+
+
+@receiver(post_save, sender=CreditorLearning)
+def learn_creditor_learning(sender, instance, created, **kwargs):
+    if created:
+        categoriser.learn(instance.word, CREDITOR, instance.creditor_id,
+                          str(instance.creditor.entity))
+    else:
+        categoriser.invalidate()
+
+
+@receiver(post_delete, sender=BankLearning)
+@receiver(post_delete, sender=CreditorLearning)
+def forget_learning(sender, **kwargs):
+    categoriser.invalidate()
+
+
+@receiver(post_save, sender=BankEntry)
+def set_bank_line_reconciled(sender, instance, **kwargs):
+    BankLine.objects.filter(pk=instance.bank_line_id).update(
+        is_reconciled=True)
+    instance.bank_line.is_reconciled = True
+
+
+@receiver(post_delete, sender=BankEntry)
+def set_bank_line_unreconciled(sender, instance, **kwargs):
+    BankLine.objects.filter(pk=instance.bank_line_id).update(
+        is_reconciled=False)
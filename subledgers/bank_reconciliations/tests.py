@@ -1,15 +1,37 @@
 # -*- coding: utf-8 -*-
 # import warnings
 # import unittest
+import io
+import json
+import os
+import shutil
+import tempfile
 from datetime import date
+from unittest import mock
 from decimal import Decimal
-from django.contrib.auth.models import User
-from django.test import TestCase  # , Client
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase  # , Client
+from django.urls import reverse
 # from django.contrib.auth.models import User
 
+from entities.models import Entity
 from ledgers.models import Account, Transaction
 from ledgers.bank_accounts.models import BankAccount
-from .models import BankLine, BankEntry
+from ledgers.registry import chart_of_accounts
+from subledgers.creditors.models import (Creditor, CreditorInvoice,
+                                         CreditorLearning, CreditorPayment)
+from subledgers.jobs import run_pending_jobs
+from subledgers.journals.models import JournalEntry
+from subledgers.models import ImportJob
+from . import feeds, pagination, parsers
+from .reports import reconciliation_statement
+from .tokens import make_signature, normalise
+from .categoriser import categoriser, tokenise
+from .models import (BankLine, BankEntry, BankFeed, BankFeedFile,
+                     BankLearning)
+from .utils import categorise_bank_lines, import_bank_statement
+from .views import add_statements
 
 
 class TestBankLineQueryset(TestCase):
@@ -70,3 +92,734 @@ class TestBankLineQueryset(TestCase):
         self.assertNotIn(self.b1, unreconciled_obj_list)
         self.assertIn(self.b2, unreconciled_obj_list)
         self.assertIn(self.b3, unreconciled_obj_list)
+
+
+class TestImportBankStatement(TestCase):
+
+    def setUp(self):
+        self.a1 = Account.objects.create(element='01', number='0101',
+                                         name='Test Bank Account 1')
+        self.ba = BankAccount.objects.create(account=self.a1, bank='NAB')
+        self.rows = [
+            "02-Jun-2017\t-4.50\t\t\tCARD\tCAFE\t95.50",
+            "02-Jun-2017\t-4.50\t\t\tCARD\tCAFE\t95.50",
+            "03-Jun-2017\t100.00\t\t\tTRANSFER\tSALES\t195.50",
+        ]
+
+    def import_rows(self, rows, batch_size=None):
+        return import_bank_statement(
+            {'bank': self.ba.pk, 'input_data': "\r\n".join(rows)},
+            batch_size=batch_size)
+
+    def test_import_bank_statement_counts(self):
+        results = self.import_rows(self.rows)
+        self.assertEqual(results, {'inserted': 3, 'skipped': 0})
+        self.assertEqual(BankLine.objects.count(), 3)
+        self.assertEqual(len(set(BankLine.objects.values_list(
+            'fingerprint', flat=True))), 3)
+
+    def test_import_bank_statement_reimport_skipped(self):
+        self.import_rows(self.rows)
+        results = self.import_rows(self.rows, batch_size=2)
+        self.assertEqual(results, {'inserted': 0, 'skipped': 3})
+        self.assertEqual(BankLine.objects.count(), 3)
+
+    def test_import_bank_statement_overlap(self):
+        self.import_rows(self.rows[:2])
+        results = self.import_rows(self.rows + [
+            "04-Jun-2017\t-4.50\t\t\tCARD\tCAFE\t191.00"])
+        self.assertEqual(results, {'inserted': 2, 'skipped': 2})
+        self.assertEqual(BankLine.objects.count(), 4)
+
+    def test_import_bank_statement_chunked_queries(self):
+        rows = ["{:02d}-Jun-2017\t-1.00\t\t\tCARD\tCAFE\t{}.00".format(
+            day, 100 - day) for day in range(1, 31)]
+        # bank, then per chunk: existing, savepoint, insert, release.
+        with self.assertNumQueries(1 + 4 * 3):
+            self.import_rows(rows, batch_size=10)
+
+    def test_import_bank_statement_concurrent_insert(self):
+        """ Line inserted by another import after the existing check """
+        set_tokens = BankLine.set_tokens
+
+        def insert_meanwhile(bank_line):
+            set_tokens(bank_line)
+            if not BankLine.objects.exists():
+                BankLine.objects.bulk_create([BankLine(
+                    bank_account=self.ba, date=bank_line.date,
+                    value=bank_line.value, line_dump=bank_line.line_dump,
+                    fingerprint=bank_line.fingerprint)])
+
+        with mock.patch.object(BankLine, 'set_tokens', autospec=True,
+                               side_effect=insert_meanwhile):
+            results = self.import_rows(self.rows)
+        self.assertEqual(results, {'inserted': 2, 'skipped': 1})
+        self.assertEqual(BankLine.objects.count(), 3)
+
+    def test_bankline_save_fingerprint_matches_import(self):
+        self.import_rows(self.rows[:1])
+        line = BankLine(bank_account=self.ba, date=date(2017, 6, 2),
+                        value=Decimal('-4.5'), line_dump='CAFE CARD',
+                        description='CAFE', balance=Decimal('95.5'))
+        line.save()
+        # saved as 2nd identical line
+        self.assertEqual(self.import_rows(self.rows[:2]),
+                         {'inserted': 0, 'skipped': 2})
+
+
+class TestStatementParsers(TestCase):
+
+    def test_get_parser_bank_then_generic(self):
+        self.assertEqual(parsers.get_parser('CBA', 'csv'),
+                         parsers.parse_CBA_csv)
+        self.assertEqual(parsers.get_parser('CBA', 'ofx'), parsers.parse_ofx)
+        self.assertRaises(Exception, parsers.get_parser, 'CBA', 'xls')
+
+    def test_parse_csv_generic(self):
+        lines = ['Date,Amount,Description,Balance',
+                 '02/06/2017,"-1,004.50",CAFE,95.50']
+        self.assertEqual(list(parsers.parse_csv(lines)), [{
+            'date': date(2017, 6, 2), 'value': Decimal('-1004.50'),
+            'line_dump': 'CAFE', 'description': 'CAFE', 'additional': '',
+            'balance': Decimal('95.50')}])
+
+    def test_parse_CBA_csv(self):
+        lines = ['02/06/2017,-4.50,"CAFE Card xx1234",95.50']
+        result = list(parsers.parse_CBA_csv(lines))[0]
+        self.assertEqual(result['date'], date(2017, 6, 2))
+        self.assertEqual(result['description'], 'CAFE ')
+        self.assertEqual(result['additional'], 'Card xx1234')
+
+    def test_make_statement_date_2_digit_year(self):
+        self.assertEqual(parsers.make_statement_date("6/2'17"),
+                         date(2017, 2, 6))
+        self.assertEqual(parsers.make_statement_date('31/12/99'),
+                         date(1999, 12, 31))
+        self.assertEqual(parsers.make_statement_date('2017-06-02'),
+                         date(2017, 6, 2))
+
+    def test_process_line_dump_later_split(self):
+        self.assertEqual(
+            parsers.process_line_dump('CAFE Value Date: 01/06/2017'),
+            ('CAFE ', 'Value Date: 01/06/2017'))
+        self.assertEqual(parsers.process_line_dump('BPAY TELSTRA'),
+                         ('', 'BPAY TELSTRA'))
+        self.assertEqual(parsers.process_line_dump('TRANSFER'),
+                         ('TRANSFER', ''))
+
+    def test_parse_ofx(self):
+        lines = ['<OFX><BANKTRANLIST>',
+                 '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20170602120000',
+                 '<TRNAMT>-4.50<FITID>1<NAME>CAFE<MEMO>Card xx1234',
+                 '</STMTTRN><STMTTRN><DTPOSTED>20170603<TRNAMT>100',
+                 '<NAME>SALES</STMTTRN>',
+                 '</BANKTRANLIST></OFX>']
+        result = list(parsers.parse_ofx(lines))
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0]['date'], date(2017, 6, 2))
+        self.assertEqual(result[0]['value'], Decimal('-4.50'))
+        self.assertEqual(result[0]['line_dump'], 'CAFE Card xx1234')
+        self.assertEqual(result[1]['balance'], None)
+
+    def test_parse_qif(self):
+        lines = ['!Type:Bank', "D2/6'17", 'T-4.50', 'PCAFE', '^',
+                 'D03/06/2017', 'U1,000.00', 'PSALES', 'MTransfer', '^']
+        result = list(parsers.parse_qif(lines))
+        self.assertEqual([x['date'] for x in result],
+                         [date(2017, 6, 2), date(2017, 6, 3)])
+        self.assertEqual(result[1]['value'], Decimal('1000.00'))
+        self.assertEqual(result[1]['additional'], 'Transfer')
+
+    def test_parsers_stream(self):
+        def lines():
+            yield '02/06/2017,-4.50,CAFE,95.50'
+            raise AssertionError("read past first line")
+        parsed = parsers.parse_CBA_csv(lines())
+        self.assertEqual(next(parsed)['value'], Decimal('-4.50'))
+
+    def test_iter_statement_lines_file(self):
+        statement_file = io.BytesIO(b'\xef\xbb\xbfa,b\r\n\r\nc,d\n')
+        self.assertEqual(list(parsers.iter_statement_lines(statement_file)),
+                         ['a,b', 'c,d'])
+
+
+class TestStatementFileUpload(TestCase):
+
+    def setUp(self):
+        self.a1 = Account.objects.create(element='01', number='0101',
+                                         name='Test Bank Account 1')
+        self.ba = BankAccount.objects.create(account=self.a1, bank='CBA')
+        self.media_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def test_upload_statement_file_imported_by_job(self):
+        statement_file = SimpleUploadedFile(
+            'statement.qif', b"!Type:Bank\nD02/06/2017\nT-4.50\nPCAFE\n^\n"
+                             b"D03/06/2017\nT100\nPSALES\n^\n")
+        with self.settings(MEDIA_ROOT=self.media_root):
+            request = RequestFactory().post(
+                '/bank/reconciliations/statements/', {
+                    'bank': self.ba.pk, 'input_format': 'qif',
+                    'statement_file': statement_file})
+            request.user = AnonymousUser()
+            request.session = {}
+            add_statements(request)
+            run_pending_jobs()
+
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.posted), (ImportJob.DONE, 2))
+        self.assertEqual(BankLine.objects.count(), 2)
+
+
+class TestCategoriser(TestCase):
+
+    def setUp(self):
+        categoriser.invalidate()
+        self.a1 = Account.objects.create(element='01', number='0101',
+                                         name='Test Bank Account 1')
+        self.a2 = Account.objects.create(element='15', number='0501',
+                                         name='Groceries')
+        self.a3 = Account.objects.create(element='15', number='0502',
+                                         name='Fuel')
+        self.ba = BankAccount.objects.create(account=self.a1, bank='CBA')
+        self.creditor = Creditor.objects.create(
+            entity=Entity.objects.create(code='TELCO', name='Telco Ltd'))
+        BankLearning.objects.create(word='woolworths', account=self.a2)
+        BankLearning.objects.create(word='caltex', account=self.a3)
+        BankLearning.objects.create(word='woolworths', account=self.a3)
+        CreditorLearning.objects.create(word='telstra',
+                                        creditor=self.creditor)
+
+    def make_line(self, line_dump):
+        return BankLine.objects.create(
+            bank_account=self.ba, date=date(2017, 6, 2),
+            value=Decimal('-10.00'), line_dump=line_dump,
+            description=line_dump)
+
+    def test_tokenise(self):
+        self.assertEqual(tokenise("WOOLWORTHS 1234 Sydney N"),
+                         ['woolworths', 'sydney'])
+
+    def test_suggest(self):
+        suggestion = categoriser.suggest("CALTEX WOOLWORTHS 1234")
+        self.assertEqual((suggestion.kind, suggestion.pk),
+                         ('account', self.a3.pk))
+        self.assertEqual(suggestion.label, '[15-0502] Fuel')
+        self.assertEqual(suggestion.confidence, 0.75)
+        self.assertEqual(suggestion.words, ['caltex', 'woolworths'])
+        self.assertEqual(categoriser.suggest("UNKNOWN"), None)
+
+    def test_suggest_creditor(self):
+        suggestion = categoriser.suggest("TELSTRA BPAY 123")
+        self.assertEqual((suggestion.kind, suggestion.pk, suggestion.label),
+                         ('creditor', self.creditor.pk, '[TELCO] Telco Ltd'))
+        self.assertEqual(suggestion.confidence, 1)
+
+    def test_learning_updates_loaded_index(self):
+        categoriser.load()
+        self.assertEqual(categoriser.suggest("ALDI"), None)
+        with self.assertNumQueries(1):
+            BankLearning.objects.create(word='aldi', account=self.a2)
+        self.assertEqual(categoriser.suggest("ALDI").pk, self.a2.pk)
+
+        BankLearning.objects.filter(word='aldi').get().delete()
+        self.assertEqual(categoriser.suggest("ALDI"), None)
+
+    def test_suggest_lines_no_queries(self):
+        lines = [self.make_line("WOOLWORTHS 1234"),
+                 self.make_line("CALTEX 99"),
+                 self.make_line("NOTHING KNOWN")]
+        categoriser.load()
+        with self.assertNumQueries(0):
+            suggestions = categoriser.suggest_lines(lines)
+        self.assertEqual(suggestions[lines[1].pk].pk, self.a3.pk)
+        self.assertEqual(suggestions[lines[0].pk].confidence, 0.5)
+        self.assertEqual(suggestions[lines[2].pk], None)
+
+    def test_suggest_as_per_suggest_lines(self):
+        text = "CALTEX WOOLWORTHS Card xx7495 Value Date: 02/06/2017"
+        line = self.make_line(text)
+        self.assertEqual(categoriser.suggest(text),
+                         categoriser.suggest_lines([line])[line.pk])
+
+    def test_suggestions_json(self):
+        line = self.make_line("CALTEX 99")
+        self.make_line("NOTHING KNOWN")
+        url = reverse('bank-reconciliations:bank-categorisation-suggestions')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        User.objects.create_user('test_staff_user', 'test@example.com',
+                                 '1234')
+        self.client.login(username='test_staff_user', password='1234')
+        results = self.client.get(url).json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['bank_line'], line.pk)
+        self.assertEqual(results[0]['label'], '[15-0502] Fuel')
+
+        response = self.client.get(
+            reverse('bank-reconciliations:bank-categorisation'))
+        self.assertContains(response, '[15-0502] Fuel')
+        self.assertContains(response, '100%')
+
+
+class TestCategoriseBankLines(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(element='01', number='0101',
+                                         name='Test Bank Account 1')
+        self.a2 = Account.objects.create(element='03', number='0430',
+                                         name='Expense Clearing')
+        self.a3 = Account.objects.create(element='15', number='0501',
+                                         name='Groceries')
+        self.ba = BankAccount.objects.create(account=self.a1, bank='CBA')
+        self.lines = [BankLine.objects.create(
+            bank_account=self.ba, date=date(2017, 6, i),
+            value=Decimal('-{}.00'.format(i)), line_dump='CAFE {}'.format(i),
+            description='CAFE') for i in range(1, 4)]
+
+    def test_categorise_bank_lines(self):
+        pks = [line.pk for line in self.lines]
+        results = categorise_bank_lines(self.user, pks, 'expenses')
+
+        self.assertEqual([result['bank_line'] for result in results], pks)
+        self.assertEqual([result['error'] for result in results],
+                         [None, None, None])
+        self.assertEqual(BankLine.objects.unreconciled().count(), 0)
+        bank_entry = BankEntry.objects.get(pk=results[1]['bank_entry'])
+        self.assertEqual(bank_entry.bank_line, self.lines[1])
+        self.assertEqual(bank_entry.subledger, 'expenses')
+        self.assertEqual(bank_entry.transaction.pk, results[1]['transaction'])
+        self.assertTrue(bank_entry.transaction.is_balanced)
+        self.assertEqual(
+            sorted(bank_entry.transaction.lines.values_list(
+                'account__number', 'value')),
+            [('0101', Decimal('2.00')), ('0430', Decimal('-2.00'))])
+
+    def test_categorise_bank_lines_as_per_save_transaction(self):
+        categorise_bank_lines(self.user, [self.lines[0].pk], 'expenses',
+                              '15-0501')
+        bank_entry = BankEntry(bank_line=self.lines[1], subledger='expenses')
+        bank_entry.save_transaction({
+            'user': self.user, 'date': self.lines[1].date,
+            'source': 'subledgers.bank_reconciliations.models.BankEntry',
+            'value': self.lines[1].value, 'account_DR': '15-0501',
+            'account_CR': self.a1})
+
+        batch, single = [list(Transaction.objects.get(
+            bankentry__bank_line=line).lines.order_by(
+            'account__number').values_list('account', 'value'))
+            for line in self.lines[:2]]
+        self.assertEqual(batch, [(self.a1.pk, Decimal('1.00')),
+                                 (self.a3.pk, Decimal('-1.00'))])
+        self.assertEqual(single, [(self.a1.pk, Decimal('2.00')),
+                                  (self.a3.pk, Decimal('-2.00'))])
+        self.assertEqual(
+            [Transaction.objects.get(bankentry__bank_line=line).value
+             for line in self.lines[:2]],
+            [Decimal('1.00'), Decimal('2.00')])
+
+    def test_categorised_payment_match_invoices(self):
+        creditor = Creditor.objects.create(
+            entity=Entity.objects.create(code='CAFE', name='Cafe'))
+        invoice = CreditorInvoice()
+        invoice.save_transaction({
+            'user': self.user, 'date': date(2017, 5, 1),
+            'account_DR': self.a3, 'account_CR': self.a2,
+            'value': Decimal('5.00'), 'invoice_number': '1',
+            'relation': creditor, 'gst_total': 0})
+        result, = categorise_bank_lines(self.user, [self.lines[2].pk],
+                                        'creditors', '15-0501')
+        payment = CreditorPayment.objects.create(
+            relation=creditor, user=self.user,
+            bank_entry=BankEntry.objects.get(pk=result['bank_entry']))
+
+        payment.match_invoices()
+        self.assertEqual(payment.invoices_total(), Decimal('3.00'))
+        self.assertEqual(CreditorInvoice.objects.get(pk=invoice.pk).unpaid,
+                         Decimal('2.00'))
+
+    def test_categorise_bank_lines_errors(self):
+        categorise_bank_lines(self.user, [self.lines[0].pk], 'expenses')
+        results = categorise_bank_lines(
+            self.user, [self.lines[0].pk, 0, self.lines[1].pk,
+                        self.lines[1].pk], 'expenses')
+        self.assertEqual([bool(result['error']) for result in results],
+                         [True, True, False, True])
+        self.assertEqual(BankEntry.objects.count(), 2)
+
+        with self.assertRaises(Exception):
+            categorise_bank_lines(self.user, [self.lines[2].pk], 'journals')
+        with self.assertRaises(Exception):
+            categorise_bank_lines(self.user, [self.lines[2].pk], 'expenses',
+                                  '99-9999')
+
+    def test_categorise_bank_lines_queries(self):
+        pks = [line.pk for line in self.lines]
+        chart_of_accounts.load()
+        # bank lines, then in one atomic block: transactions (with pks),
+        # lines, period balances, bank entries (with pks) and is_reconciled,
+        # not per line.
+        with self.assertNumQueries(16):
+            categorise_bank_lines(self.user, pks, 'expenses')
+
+    def test_batch_endpoint(self):
+        url = reverse('bank-reconciliations:bank-categorisation-batch')
+        data = {'bank_lines': [self.lines[0].pk], 'subledger': 'expenses'}
+        self.assertEqual(self.client.post(url, data).status_code, 403)
+
+        self.client.login(username='test_staff_user', password='1234')
+        response = self.client.post(url, data)
+        self.assertEqual(response.json()['results'][0]['error'], None)
+
+        response = self.client.post(
+            url, json.dumps({'bank_lines': [self.lines[1].pk],
+                             'subledger': 'nope'}),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bank_categorisation_view(self):
+        self.client.login(username='test_staff_user', password='1234')
+        response = self.client.post(
+            reverse('bank-reconciliations:bank-categorisation'), {
+                'subledger': 'expenses', 'manual-account': '',
+                'catpk-{}'.format(self.lines[0].pk): 'on',
+                'catpk-{}'.format(self.lines[1].pk): 'on'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BankLine.objects.unreconciled().get(),
+                         self.lines[2])
+        self.assertEqual(len(response.context['object_list']), 1)
+
+
+class TestBankLineQueue(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(element='01', number='0101',
+                                         name='Test Bank Account 1')
+        self.a2 = Account.objects.create(element='15', number='0501',
+                                         name='Test Expenses Account 1')
+        self.ba = BankAccount.objects.create(account=self.a1, bank='CBA')
+        # 2 lines a day, created out of date order.
+        self.lines = [BankLine.objects.create(
+            bank_account=self.ba, date=date(2017, 6, 10 - i // 2),
+            value=Decimal(i + 1), line_dump='Line {}'.format(i),
+            description='Line {}'.format(i)) for i in range(10)]
+
+    def test_is_reconciled_synced_with_bank_entry(self):
+        bank_line = self.lines[0]
+        t1 = Transaction(date=bank_line.date, value=0, user=self.user,
+                         source="{}".format(BankAccount.__module__))
+        t1.save(lines=(self.a1, self.a2, bank_line.value))
+        bank_entry = BankEntry.objects.create(transaction=t1,
+                                              bank_line=bank_line)
+        bank_line.refresh_from_db()
+        self.assertTrue(bank_line.is_reconciled)
+        self.assertNotIn(bank_line, BankLine.objects.unreconciled())
+
+        bank_entry.delete()
+        bank_line.refresh_from_db()
+        self.assertFalse(bank_line.is_reconciled)
+
+    def test_categorise_bank_lines_sets_is_reconciled(self):
+        categorise_bank_lines(self.user, [self.lines[1].pk], 'expenses',
+                              '15-0501')
+        self.assertEqual(list(BankLine.objects.reconciled()),
+                         [self.lines[1]])
+
+    def test_keyset_page(self):
+        ordered = sorted(self.lines, key=lambda line: (line.date, line.pk))
+        queryset = BankLine.objects.unreconciled()
+
+        page, cursor = pagination.keyset_page(queryset, page_size=4)
+        self.assertEqual(page, ordered[:4])
+        self.assertEqual(cursor, "2017-06-07.{}".format(ordered[3].pk))
+
+        page, cursor = pagination.keyset_page(queryset, cursor, page_size=4)
+        self.assertEqual(page, ordered[4:8])
+        page, cursor = pagination.keyset_page(queryset, cursor, page_size=4)
+        self.assertEqual((page, cursor), (ordered[8:], None))
+
+        with self.assertRaises(Exception):
+            pagination.keyset_page(queryset, "2017-06-07")
+
+    def test_viewset_list_paged(self):
+        url = reverse('bank-reconciliations:bank-line-list')
+        response = self.client.get(url, {'page_size': 6})
+        self.assertEqual(len(response.data['results']), 6)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(response.data['next'], None)
+        self.assertEqual(self.client.get(url, {'cursor': 'x'}).status_code,
+                         404)
+
+    def test_viewset_list_filters(self):
+        url = reverse('bank-reconciliations:bank-line-list')
+        other = BankAccount.objects.create(account=self.a2, bank='NAB')
+        BankLine.objects.create(
+            bank_account=other, date=date(2017, 6, 8), value=Decimal(1),
+            line_dump='Other', description='Other')
+        categorise_bank_lines(self.user, [self.lines[0].pk], 'expenses',
+                              '15-0501')
+
+        def values(**params):
+            response = self.client.get(url, params)
+            return sorted(line['value'] for line in response.data['results'])
+
+        self.assertEqual(values(bank_account=other.pk), ['1.00'])
+        self.assertEqual(
+            values(bank_account=self.ba.pk, date_from='2017-06-08',
+                   date_to='2017-06-09'),
+            ['3.00', '4.00', '5.00', '6.00'])
+        self.assertEqual(values(value_min='8', value_max='9.5'),
+                         ['8.00', '9.00'])
+        self.assertEqual(values(reconciled='true'), ['1.00'])
+        self.assertEqual(len(values(reconciled='all')), 11)
+        self.assertEqual(
+            self.client.get(url, {'value_min': 'x'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(url, {'reconciled': 'x'}).status_code, 400)
+
+    def test_viewset_list_sparse_fields(self):
+        url = reverse('bank-reconciliations:bank-line-list')
+        response = self.client.get(url, {'fields': 'date,value'})
+        self.assertEqual(set(response.data['results'][0]),
+                         {'id', 'date', 'value'})
+
+        response = self.client.get(
+            reverse('bank-reconciliations:bank-line-list'))
+        self.assertIn('line_dump', response.data['results'][0])
+
+
+class TestReconciliationStatement(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(element='01', number='0101',
+                                         name='Test Bank Account 1')
+        self.a2 = Account.objects.create(element='15', number='0501',
+                                         name='Test Expenses Account 1')
+        self.ba = BankAccount.objects.create(account=self.a1, bank='CBA')
+
+        # May: opening deposit, on statement and in ledger.
+        self.b0 = self.make_line(date(2017, 5, 1), '1000.00', '1000.00')
+        # June: fee on statement only, deposit in ledger only, one matched.
+        self.b1 = self.make_line(date(2017, 6, 2), '-10.00', '990.00')
+        self.b2 = self.make_line(date(2017, 6, 3), '200.00', None)
+        categorise_bank_lines(self.user, [self.b0.pk, self.b2.pk],
+                              'expenses', '15-0501')
+        JournalEntry().save_transaction({
+            'user': self.user, 'date': date(2017, 6, 29),
+            'account_DR': self.a2, 'account_CR': self.a1,
+            'value': Decimal('50.00')})
+        # July: matched after the end of June.
+        self.b3 = self.make_line(date(2017, 6, 30), '-5.00', '1185.00')
+        BankEntry(bank_line=self.b3, subledger='expenses').save_transaction({
+            'user': self.user, 'date': date(2017, 7, 1),
+            'source': 'subledgers.bank_reconciliations.models.BankEntry',
+            'value': self.b3.value, 'account_DR': self.a2,
+            'account_CR': self.a1})
+
+    def make_line(self, line_date, value, balance):
+        return BankLine.objects.create(
+            bank_account=self.ba, date=line_date, value=Decimal(value),
+            balance=balance and Decimal(balance), line_dump='LINE',
+            description='LINE')
+
+    def test_reconciliation_statement(self):
+        report = reconciliation_statement(self.ba, date(2017, 6, 30))
+
+        self.assertEqual(report['opening_balance'], Decimal('1000.00'))
+        self.assertEqual(
+            [(line.running_balance, line.balance_differs)
+             for line in report['statement_lines']],
+            [(Decimal('990.00'), False), (Decimal('1190.00'), False),
+             (Decimal('1185.00'), False)])
+        self.assertEqual(report['statement_balance'], Decimal('1185.00'))
+        self.assertEqual(report['unreconciled'], [self.b1, self.b3])
+        self.assertEqual(report['unreconciled_total'], Decimal('-15.00'))
+        self.assertEqual(
+            [(line.value, line.statement_value)
+             for line in report['unpresented']],
+            [(Decimal('-50.00'), Decimal('50.00'))])
+        self.assertEqual(report['ledger_balance'], Decimal('1250.00'))
+        self.assertEqual(report['difference'], Decimal('0.00'))
+
+    def test_reconciliation_statement_earlier(self):
+        report = reconciliation_statement(self.ba, date(2017, 5, 31),
+                                          date(2017, 5, 1))
+        self.assertEqual(report['opening_balance'], Decimal('0'))
+        self.assertEqual(report['statement_balance'], Decimal('1000.00'))
+        self.assertEqual(report['unreconciled'], [])
+        self.assertEqual(report['unpresented'], [])
+        self.assertEqual(report['difference'], Decimal('0.00'))
+
+    def test_balance_differs(self):
+        self.b2.balance = Decimal('1000.00')
+        self.b2.save()
+        lines = reconciliation_statement(
+            self.ba, date(2017, 6, 30))['statement_lines']
+        self.assertEqual([line.balance_differs for line in lines],
+                         [False, True, False])
+
+    def test_view(self):
+        url = reverse('bank-reconciliations:bank-reconciliation-statement',
+                      args=[self.ba.pk])
+        response = self.client.get(url, {'date': '2017-06-30'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['as_of'], date(2017, 6, 30))
+        self.assertEqual(response.context['difference'], Decimal('0.00'))
+
+
+class TestBankFeeds(TestCase):
+
+    def setUp(self):
+        self.a1 = Account.objects.create(element='01', number='0101',
+                                         name='Test Bank Account 1')
+        self.ba = BankAccount.objects.create(account=self.a1, bank=None)
+        self.directory = tempfile.mkdtemp()
+        self.feed = BankFeed.objects.create(
+            bank_account=self.ba, directory=self.directory, pattern='*.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data, mode='ab'):
+        with open(os.path.join(self.directory, name), mode) as f:
+            f.write(data)
+
+    def test_new_lines_only(self):
+        self.write('today.csv', b"\xef\xbb\xbfDate,Amount,Description\n"
+                                b"02/06/2017,-4.50,CAFE\n")
+        self.write('ignored.txt', b"not a statement")
+        checkpoint, = feeds.scan_feed(self.feed, settle=3600)
+        self.assertEqual(checkpoint.inserted, 1)
+        self.assertEqual(checkpoint.header, "Date,Amount,Description")
+
+        # second identical coffee, and a line still being written.
+        self.write('today.csv', b"02/06/2017,-4.50,CAFE\n03/06/2017,-1")
+        checkpoint, = feeds.scan_feed(self.feed, settle=3600)
+        self.assertEqual((checkpoint.inserted, checkpoint.skipped), (2, 0))
+        self.assertEqual(checkpoint.offset, checkpoint.size - 13)
+
+        # nothing new: file not read.
+        with self.assertNumQueries(1):
+            feeds.scan_feed(self.feed, settle=3600)
+
+        self.write('today.csv', b"0.00,RENT\n")
+        checkpoint, = feeds.scan_feed(self.feed, settle=3600)
+        self.assertEqual(checkpoint.offset, checkpoint.size)
+        self.assertEqual(
+            list(BankLine.objects.order_by('pk').values_list(
+                'date', 'value', 'description')),
+            [(date(2017, 6, 2), Decimal('-4.50'), 'CAFE'),
+             (date(2017, 6, 2), Decimal('-4.50'), 'CAFE'),
+             (date(2017, 6, 3), Decimal('-10.00'), 'RENT')])
+
+    def test_replaced_and_overlapping_files(self):
+        self.write('1.csv', b"date,value,description\n"
+                            b"02/06/2017,-4.50,CAFE\n02/06/2017,-4.50,CAFE\n")
+        feeds.scan_feed(self.feed, settle=3600)
+        self.write('2.csv', b"date,value,description\n"
+                            b"02/06/2017,-4.50,CAFE\n02/06/2017,-4.50,CAFE\n"
+                            b"03/06/2017,-2.00,BUS\n")
+        self.write('1.csv', b"date,value,description\n", mode='wb')
+        first, second = feeds.scan_feed(self.feed, settle=3600)
+
+        self.assertEqual((second.inserted, second.skipped), (1, 2))
+        self.assertEqual(first.offset, first.size)
+        self.assertEqual(BankLine.objects.count(), 3)
+
+    def test_bad_file_recorded_others_imported(self):
+        self.write('1.csv', b"date,value,description\nnotadate,abc,X\n")
+        self.write('2.csv', b"date,value,description\n"
+                            b"02/06/2017,-4.50,CAFE\n")
+        with self.assertLogs(feeds.__name__, 'ERROR'):
+            bad, good = feeds.scan_feed(self.feed, settle=0)
+        self.assertNotEqual(bad.error, "")
+        self.assertEqual(BankFeedFile.objects.get(pk=bad.pk).offset, 0)
+        self.assertEqual((good.error, good.inserted), ("", 1))
+
+        # fixed: imported, error cleared.
+        self.write('1.csv', b"date,value,description\n"
+                            b"03/06/2017,-2.00,BUS\n", mode='wb')
+        bad, good = feeds.scan_feed(self.feed, settle=0)
+        self.assertEqual((bad.error, bad.inserted), ("", 1))
+
+    def test_missing_directory_other_feeds_scanned(self):
+        BankFeed.objects.create(bank_account=self.ba,
+                                directory=self.directory + '-missing')
+        self.write('today.csv', b"date,value,description\n"
+                                b"02/06/2017,-4.50,CAFE\n")
+        with self.assertLogs(feeds.__name__, 'ERROR'):
+            results = feeds.scan_feeds(settle=0)
+        self.assertEqual(list(results), [self.feed])
+
+    def test_whole_file_formats_wait_to_settle(self):
+        self.feed.input_format, self.feed.pattern = 'qif', '*.qif'
+        self.feed.save()
+        self.write('today.qif', b"!Type:Bank\nD02/06/2017\nT-4.50\nPCAFE\n^\n")
+        checkpoint, = feeds.scan_feed(self.feed, settle=3600)
+        self.assertEqual(checkpoint.offset, 0)
+
+        checkpoint, = feeds.scan_feed(self.feed, settle=0)
+        self.assertEqual((checkpoint.offset, checkpoint.inserted),
+                         (checkpoint.size, 1))
+
+
+class TestBankLineTokens(TestCase):
+
+    def setUp(self):
+        self.a1 = Account.objects.create(element='01', number='0101',
+                                         name='Test Bank Account 1')
+        self.ba = BankAccount.objects.create(account=self.a1, bank='NAB')
+
+    def make_line(self, description, **kwargs):
+        return BankLine.objects.create(
+            bank_account=self.ba, date=date(2017, 6, 2),
+            value=Decimal('-10.00'), line_dump=description,
+            description=description, **kwargs)
+
+    def test_normalise(self):
+        self.assertEqual(
+            normalise("WOOLWORTHS 1234 Sydney Woolworths Card xx7495 "
+                      "Value Date: 02/06/2017"),
+            'woolworths sydney')
+        self.assertEqual(normalise(""), "")
+        self.assertEqual(make_signature(""), 0)
+
+    def test_set_on_save_and_import(self):
+        line = self.make_line("WOOLWORTHS 1234 SYDNEY")
+        import_bank_statement({'bank': self.ba.pk, 'input_data': (
+            "02-Jun-2017\t-4.50\t\t\tCARD\tWoolworths 0077 Sydney"
+            "\t95.50")})
+        imported = BankLine.objects.exclude(pk=line.pk).get()
+        self.assertEqual((line.tokens, imported.tokens),
+                         ('woolworths sydney', 'woolworths sydney'))
+        self.assertNotEqual(line.signature, 0)
+        self.assertEqual(line.signature, imported.signature)
+
+    def test_similar_and_search(self):
+        line = self.make_line("WOOLWORTHS 1234 SYDNEY")
+        self.make_line("WOOLWORTHS METRO SYDNEY")
+        self.make_line("CALTEX SYDNEY")
+        self.assertEqual(list(BankLine.objects.similar(
+            "Woolworths 99 Sydney")), [line])
+        self.assertEqual(BankLine.objects.search("woolworths").count(), 2)
+        self.assertEqual(BankLine.objects.search("sydney metro").count(), 1)
+        self.assertEqual(BankLine.objects.search("sydne").count(), 0)
+
+    def test_api_search(self):
+        self.make_line("WOOLWORTHS METRO SYDNEY")
+        self.make_line("CALTEX SYDNEY")
+        response = self.client.get(
+            reverse('bank-reconciliations:bank-line-list'),
+            {'search': 'caltex', 'fields': 'tokens'})
+        self.assertEqual([x['tokens'] for x in response.data['results']],
+                         ['caltex sydney'])
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+""" Normalised tokens of bank line descriptions.
+
+Stored on `BankLine` when saved/imported (`tokens`, `signature`) so
+matching, learning, search and duplicate detection don't tokenise the same
+descriptions again:
+
+    normalise("WOOLWORTHS 1234 SYDNEY Card xx7495 Value Date: 02/06/2017")
+    # 'woolworths sydney'
+
+    make_signature('woolworths sydney')
+    # crc32 of the tokens, same for any line with the same tokens.
+
+Card numbers, "Value Date" suffixes, numbers (eg. store numbers, dates) and
+single letters are dropped.
+"""
+import re
+import zlib
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9&']+")
+
+NOISE_PATTERN = re.compile(
+    r"card xx\d+|value date:?\s*\S+|\b\d+[/\-.]\d+[/\-.]\d+\b")
+
+
+def tokenise(text):
+    """ Lowercase words of `text`, ignoring numbers and single letters
+    (eg. card numbers, dates). """
+    return [token for token in TOKEN_PATTERN.findall((text or "").lower())
+            if len(token) > 1 and not token.isdigit()]
+
+
+def normalise(text):
+    """ Space separated tokens of `text`, in order, without repeats. """
+    tokens = []
+    for token in tokenise(NOISE_PATTERN.sub(" ", (text or "").lower())):
+        if token not in tokens:
+            tokens.append(token)
+    return " ".join(tokens)
+
+
+def make_signature(tokens):
+    """ Small integer hash of `normalise()`d tokens. """
+    return zlib.crc32(tokens.encode('utf-8')) if tokens else 0
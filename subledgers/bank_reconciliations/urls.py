@@ -18,11 +18,26 @@ urlpatterns = [
          views.bank_categorisation,
          name='bank-categorisation'),
 
+    # Categorisation suggestions (JSON)
+    path('sort/suggestions/',
+         views.bank_categorisation_suggestions,
+         name='bank-categorisation-suggestions'),
+
+    # Batch categorisation (JSON)
+    path('sort/batch/',
+         views.bank_categorisation_batch,
+         name='bank-categorisation-batch'),
+
     # Bank reconciliation by Account
     path('<int:account>/',
          views.bank_reconciliation,
          name='bank-reconciliation'),
 
+    # Reconciliation statement by `BankAccount`
+    path('<int:pk>/statement/',
+         views.bank_reconciliation_statement,
+         name='bank-reconciliation-statement'),
+
     # Reconcile listview
     path('table/',
          views.BankLineListView.as_view(),
@@ -34,6 +49,9 @@ urlpatterns = [
          name='bank-statement-upload'),
 
     # API urls
+    path('api/',
+         views.BankLineViewSet.as_view({'get': 'list'}),
+         name='bank-line-list'),
     path('api/<int:pk>/',
          views.BankLineViewSet.as_view({
              'get': 'retrieve',
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
-from decimal import Decimal
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count
 
-from .models import BankLine
-from ledgers.utils import make_date
+from .models import BankEntry, BankLine, make_fingerprint
+from .parsers import get_parser, iter_statement_lines
 from ledgers.bank_accounts.models import BankAccount
+from ledgers.models import Transaction
+from ledgers.posting import bulk_create_with_pks, chunked
+from ledgers.registry import chart_of_accounts
+from ledgers.utils import get_source, make_decimal, set_CR, set_DR
+from subledgers.settings import IMPORT_CHUNK_SIZE, SUBLEDGERS_AVAILABLE
 
 """ When importing statements we want to ensure that there are not
 duplicate transactions.
@@ -11,75 +17,228 @@ duplicate transactions.
 This is impossible checking any individual line of a statement. It is
 possible for details which are identical in every way to occur twice on a
 bank statement.
+
+So each line is fingerprinted (see `models.make_fingerprint`) including its
+position among identical lines of the statement. Re-importing a statement,
+or an overlapping one, only adds lines not already imported.
+
+Fingerprints are unique per bank account, so two imports running at the
+same time (eg. an upload job and a bank feed) can't both insert a line: the
+second's insert fails, and it skips the lines the first inserted.
 """
 
 
-def import_bank_statement(data):
+def line_key(bank, kwargs):
+    return (bank.pk, kwargs['date'], kwargs['value'], kwargs['line_dump'],
+            kwargs.get('balance'))
 
-    results = []
-    bank = BankAccount.objects.get(pk=data['bank'])
-    preprocessor = globals()['preprocess_statement_{}'.format(bank.bank)]
 
-    # 1. generate list of **kwargs based on lines from statement
-    list_kwargs = preprocessor(data['input_data'])
+def fingerprint_lines(bank, list_kwargs, occurrences=None):
+    """ Yields `BankLine` kwargs with `fingerprint` added.
 
+    `occurrences` {key: number of identical lines already seen}, is updated
+    as lines are fingerprinted. """
+    if occurrences is None:
+        occurrences = {}
     for kwargs in list_kwargs:
-        new = BankLine(bank_account=bank, **kwargs)
-        new.save()
-        results.append(new)
+        key = line_key(bank, kwargs)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        kwargs['fingerprint'] = make_fingerprint(*key, occurrence=occurrence)
+        yield kwargs
+
+
+def count_stored_lines(bank, chunk, occurrences):
+    """ Adds to `occurrences` the number of identical lines already stored
+    for any lines of `chunk` not seen yet (one grouped query). """
+    new = [kwargs for kwargs in chunk
+           if line_key(bank, kwargs) not in occurrences]
+    if not new:
+        return occurrences
+    for key in set(line_key(bank, kwargs) for kwargs in new):
+        occurrences[key] = 0
+    for row in BankLine.objects.filter(
+            bank_account=bank,
+            date__in=set(kwargs['date'] for kwargs in new),
+            line_dump__in=set(kwargs['line_dump'] for kwargs in new)
+    ).order_by().values('date', 'value', 'line_dump', 'balance').annotate(
+            count=Count('pk')):
+        key = line_key(bank, row)
+        if occurrences.get(key) == 0:
+            occurrences[key] = row['count']
+    return occurrences
+
+
+def insert_new_lines(bank, new_lines):
+    """ `bulk_create`s `new_lines`, returns those inserted: lines inserted
+    meanwhile by another import (same fingerprint) are skipped. """
+    try:
+        with db_transaction.atomic():
+            BankLine.objects.bulk_create(new_lines)
+        return new_lines
+    except IntegrityError:
+        pass
+
+    # Another import got there first: only lines still not stored, each in
+    # case it is still going.
+    existing = set(BankLine.objects.filter(
+        bank_account=bank,
+        fingerprint__in=[bank_line.fingerprint for bank_line in new_lines]
+    ).values_list('fingerprint', flat=True))
+    inserted = []
+    for bank_line in new_lines:
+        if bank_line.fingerprint in existing:
+            continue
+        try:
+            with db_transaction.atomic():
+                BankLine.objects.bulk_create([bank_line])
+        except IntegrityError:
+            continue
+        inserted.append(bank_line)
+    return inserted
+
+
+def import_bank_statement(data, batch_size=None, append=False):
+    """ Creates `BankLine`s from statement `data`:
+
+        {
+          'bank':        # `BankAccount` pk
+          'input_data':  # pasted str, or file opened in binary mode
+          'format':      # optional, see `parsers.FORMATS`, default 'tsv'
+        }
+
+    The statement is parsed as a stream (see `parsers`), and lines created
+    with `bulk_create`, `batch_size` at a time, skipping any already
+    imported (each chunk in its own transaction, see `insert_new_lines`).
+    Returns dict: {'inserted': int, 'skipped': int}
+
+    `append` is for lines following on from lines already imported (eg. new
+    lines of a growing file, see `feeds`): identical lines are numbered
+    after those already stored, rather than from the start of `data`.
+    """
+    batch_size = batch_size or IMPORT_CHUNK_SIZE
+    bank = BankAccount.objects.get(pk=data['bank'])
+    parser = get_parser(bank.bank, data.get('format') or 'tsv')
+    results = {'inserted': 0, 'skipped': 0}
+    occurrences = {}
+
+    # 1. generate **kwargs based on lines from statement
+    list_kwargs = parser(iter_statement_lines(data['input_data']))
+
+    # 2. insert new fingerprints only
+    for chunk in chunked(list_kwargs, batch_size):
+        if append:
+            count_stored_lines(bank, chunk, occurrences)
+        chunk = list(fingerprint_lines(bank, chunk, occurrences))
+        existing = set(BankLine.objects.filter(
+            bank_account=bank,
+            fingerprint__in=[kwargs['fingerprint'] for kwargs in chunk]
+        ).values_list('fingerprint', flat=True))
+        new_lines = [BankLine(bank_account=bank, **kwargs)
+                     for kwargs in chunk
+                     if kwargs['fingerprint'] not in existing]
+        for bank_line in new_lines:
+            bank_line.set_tokens()
+        new_lines = insert_new_lines(bank, new_lines)
+        results['inserted'] += len(new_lines)
+        results['skipped'] += len(chunk) - len(new_lines)
 
     return results
 
 
-def preprocess_statement_CBA(data):
-    """ returns list of **kwargs """
-    # date	value	line_dump	balance
-
-    def process_line_dump(line_dump):
-        splits = [
-            'Card xx',
-            'Value Date: ',
-            'BPAY ',
-        ]
-        for split in splits:
-            try:
-                description, additional = line_dump.split(split)
-                return description, "{}{}".format(split, additional)
-            except ValueError:
-                return line_dump, ''
-
-    raw_lines = data.split('\r\n')
-    processed_lines = []
-    for line in raw_lines:
-        if line.split('\t')[0] == 'date':
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Batch Categorisation
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+def categorise_bank_lines(user, bank_line_pks, subledger, account=None):
+    """ Creates a `BankEntry` (with `Transaction` and `Line`s) for each
+    `BankLine` in `bank_line_pks`, against `account` or the subledger's
+    clearing account (see `SUBLEDGERS_AVAILABLE`).
+
+    Lines are posted as per `BankEntry.save_transaction()` (`process_line`)
+    with:
+
+        {'account_DR': account, 'account_CR': bank account, 'value': value}
+
+    ie. [(account, value), (bank account, -value)] and `Transaction.value`
+    the absolute value, but in bulk: one query for the bank lines (with
+    their bank accounts), accounts resolved from `chart_of_accounts`, then everything written
+    with `Transaction.objects.bulk_post()` and `bulk_create` in one atomic
+    block, with `BankLine.is_reconciled` set in one update.
+
+    Lines which can't be categorised (missing, already reconciled, zero
+    value) are skipped, everything else is still posted.
+
+    Returns list, in `bank_line_pks` order:
+        [{'bank_line': pk, 'bank_entry': pk, 'transaction': pk,
+          'error': None or str}, ...]
+    """
+    if subledger not in SUBLEDGERS_AVAILABLE:
+        raise Exception("Subledger not available: {}".format(subledger))
+    code = account or SUBLEDGERS_AVAILABLE[subledger]['account']
+    if not code:
+        raise Exception(
+            "No account provided for subledger: {}".format(subledger))
+    account = chart_of_accounts.get(code)
+    if account is None:
+        raise Exception(
+            "Account can't be found based upon that input: {}.".format(code))
+
+    bank_line_pks = [int(pk) for pk in bank_line_pks]
+    bank_lines = {
+        bank_line.pk: bank_line for bank_line in BankLine.objects.filter(
+            pk__in=bank_line_pks).select_related('bank_account__account')}
+    source = get_source(BankEntry)
+
+    results, entries, new_bank_entries = [], [], []
+    for pk in bank_line_pks:
+        result = {'bank_line': pk, 'bank_entry': None, 'transaction': None,
+                  'error': None}
+        results.append(result)
+        bank_line = bank_lines.get(pk)
+        if bank_line is None:
+            result['error'] = "Bank line not found."
+            continue
+        if bank_line.is_reconciled:
+            result['error'] = "Bank line already categorised."
             continue
-        kwargs = {}
-        date, value, line_dump, balance = line.split('\t')
-        kwargs['date'] = make_date(date).date()
-        kwargs['value'] = Decimal(value)
-        kwargs['line_dump'] = line_dump
-        kwargs['description'], kwargs['additional'] = process_line_dump(
-            line_dump)
-        kwargs['balance'] = Decimal(balance)
-        processed_lines.append(kwargs)
-    return processed_lines
-
-
-def preprocess_statement_NAB(data):
-    """ returns list of **kwargs """
-    # date	value	nil	nil	additional	description	balance
-
-    raw_lines = data.split('\r\n')
-    processed_lines = []
-    for line in raw_lines:
-        kwargs = {}
-        date, value, nil, nil, additional, description, balance = line.split(
-            '\t')
-        kwargs['date'] = make_date(date).date()
-        kwargs['value'] = Decimal(value)
-        kwargs['line_dump'] = "{} {}".format(description, additional)
-        kwargs['description'] = description
-        kwargs['additional'] = additional
-        kwargs['balance'] = Decimal(balance)
-        processed_lines.append(kwargs)
-    return processed_lines
+        value = make_decimal(bank_line.value)
+        if not value:
+            result['error'] = "Bank line has no value."
+            continue
+        lines = [(account, set_DR(value)),
+                 (bank_line.bank_account.account, set_CR(value))]
+        try:
+            Transaction.line_validation(lines)
+        except Exception as e:
+            result['error'] = str(e).strip()
+            continue
+        entries.append(({'user': user, 'date': bank_line.date,
+                         'source': source}, lines))
+        new_bank_entries.append(
+            (result, BankEntry(bank_line=bank_line, subledger=subledger)))
+        # in case the same pk is provided twice
+        bank_line.is_reconciled = True
+
+    if not entries:
+        return results
+
+    with db_transaction.atomic():
+        posted = Transaction.objects.bulk_post(entries)
+        for new_transaction, (result, bank_entry) in zip(
+                posted['transactions'], new_bank_entries):
+            bank_entry.transaction = new_transaction
+            result['transaction'] = new_transaction.pk
+        bulk_create_with_pks(
+            BankEntry, [bank_entry for result, bank_entry in new_bank_entries])
+        # `bulk_create` doesn't send `post_save`, see `signals`.
+        BankLine.objects.filter(pk__in=[
+            bank_entry.bank_line_id for result, bank_entry in new_bank_entries
+        ]).update(is_reconciled=True)
+
+    for result, bank_entry in new_bank_entries:
+        result['bank_entry'] = bank_entry.pk
+    return results
@@ -1,94 +1,228 @@
 # -*- coding: utf-8 -*-
-from django.shortcuts import render
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
 from django.views import generic
 
 # from rest_framework import permissions
 from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
 
 from ledgers.bank_accounts.models import BankAccount
 from ledgers.models import Account, Transaction
 from ledgers.utils import get_source, make_date
+from subledgers.models import ImportJob
 from subledgers.settings import SUBLEDGERS_AVAILABLE
+from subledgers.views import remember_import_job
 
 
-from .forms import StatementUploadForm, BankReconciliationForm
+from .categoriser import categoriser
+from .forms import (StatementUploadForm, StatementFileUploadForm,
+                    BankReconciliationForm)
 from .models import BankLine, BankEntry
+from .pagination import (BankLineKeysetPagination, keyset_page,
+                         parse_iso_date)
+from .reports import reconciliation_statement
 from .serializers import BankLineSerializer
-from .utils import import_bank_statement
+from .utils import categorise_bank_lines
 
 
 class BankLineViewSet(viewsets.ModelViewSet):
+    """ List is paged by (date, pk), see `pagination`, filtered by:
+
+        ?bank_account=<pk>
+        ?date_from=2017-06-01&date_to=2017-06-30
+        ?value_min=-100&value_max=0
+        ?reconciled=false (default), true or all
+        ?search=woolworths   (all these words, see `tokens`)
+        ?fields=date,value,description   (only these fields)
+    """
     queryset = BankLine.objects.all()
     serializer_class = BankLineSerializer
+    pagination_class = BankLineKeysetPagination
     # permission_classes = [permissions.IsAdminUser]
 
+    FILTERS = {
+        'bank_account': ('bank_account', int),
+        'date_from': ('date__gte', parse_iso_date),
+        'date_to': ('date__lte', parse_iso_date),
+        'value_min': ('value__gte', Decimal),
+        'value_max': ('value__lte', Decimal),
+    }
+
+    def get_queryset(self):
+        queryset = super(BankLineViewSet, self).get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        reconciled = params.get('reconciled', 'false').lower()
+        if reconciled in ['false', '0']:
+            queryset = queryset.unreconciled()
+        elif reconciled in ['true', '1']:
+            queryset = queryset.reconciled()
+        elif reconciled != 'all':
+            raise ValidationError({'reconciled': "true, false or all."})
+
+        for param, (lookup, convert) in self.FILTERS.items():
+            if params.get(param):
+                try:
+                    queryset = queryset.filter(
+                        **{lookup: convert(params[param])})
+                except (ValueError, ArithmeticError):
+                    raise ValidationError({param: "Invalid value."})
+        if params.get('search'):
+            queryset = queryset.search(params['search'])
+
+        fields = self.get_fields()
+        if fields:
+            # Don't read skipped columns (eg. 2KB `line_dump`) at all.
+            queryset = queryset.only(*[
+                field for field in fields
+                if field in BankLineSerializer.COLUMNS] + ['date'])
+        return queryset
+
+    def get_fields(self):
+        """ `?fields=` names, for list only. """
+        if self.action != 'list' or not self.request.query_params.get(
+                'fields'):
+            return None
+        return [field.strip() for field in
+                self.request.query_params['fields'].split(',')
+                if field.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_fields())
+        return super(BankLineViewSet, self).get_serializer(*args, **kwargs)
+
 
 def add_statements(request):
-    """ Upload statements view. """
+    """ Upload statements view, pasted or as a file (see `parsers`). """
 
     template_name = 'subledgers/bank_reconciliations/form_statements.html'
     context_data = {}
+    form = StatementUploadForm()
+    file_form = StatementFileUploadForm()
+    user = request.user if request.user.is_authenticated else None
 
-    if request.method == 'POST':
+    if request.method == 'POST' and request.FILES:
+        file_form = StatementFileUploadForm(request.POST, request.FILES)
+        if file_form.is_valid():
+            # Processed by `./manage.py run_import_jobs`, see `subledgers.jobs`
+            context_data['job'] = ImportJob.objects.create(
+                kind=ImportJob.BANK_STATEMENT,
+                user=user,
+                bank_account=file_form.cleaned_data['bank'],
+                input_format=file_form.cleaned_data['input_format'],
+                input_file=file_form.cleaned_data['statement_file'])
+            remember_import_job(request, context_data['job'])
+    elif request.method == 'POST':
         form = StatementUploadForm(request.POST)
         if form.is_valid():
-            context_data['success_obj'] = import_bank_statement(request.POST)
-    else:
-        form = StatementUploadForm()
+            # Processed by `./manage.py run_import_jobs`, see `subledgers.jobs`
+            context_data['job'] = ImportJob.objects.create(
+                kind=ImportJob.BANK_STATEMENT,
+                user=user,
+                bank_account=form.cleaned_data['bank'],
+                input_format='tsv',
+                input_data=form.cleaned_data['input_data'])
+            remember_import_job(request, context_data['job'])
 
     context_data['form'] = form
+    context_data['file_form'] = file_form
     return render(request, template_name, context_data)
 
 
 def bank_categorisation(request):
     template_name = "subledgers/bank_reconciliations/bank_categorisation.html"
+    object_list, next_cursor = keyset_page(
+        BankLine.objects.unreconciled(), request.GET.get('cursor'))
+    suggestions = categoriser.suggest_lines(object_list)
+    for bank_line in object_list:
+        bank_line.suggestion = suggestions[bank_line.pk]
     context_data = {
-        'object_list': BankLine.objects.unreconciled(),
+        'object_list': object_list,
+        'next_cursor': next_cursor,
         'subledger_list': SUBLEDGERS_AVAILABLE,
     }
     # @@TOOD: figure out how to display already sorted.
 
     if request.method == 'POST':
         context_data['request'] = request.POST
-        subledger = request.POST['subledger']
-        log = []
-
-        for field in request.POST:
-            if field.split('-')[0]=='catpk':
-                # @@TODO make this a method of some kind.
-                pk = field.split('-')[1]
-                bank_line = BankLine.objects.get(pk=pk)
-                if request.POST['manual-account']:
-                    account = request.POST['manual-account']
-                else:
-                    account = SUBLEDGERS_AVAILABLE[subledger]['account']
-
-                transaction_kwargs = {
-                    'user': request.user,
-                    'date':  bank_line.date,
-                    'source': get_source(BankEntry),
-                    'value': bank_line.value,
-                    'account_DR': account,
-                    'account_CR': bank_line.bank_account.account
-                }
-                bank_entry = BankEntry(
-                    bank_line=bank_line,
-                    subledger=subledger
-                )
-                bank_entry.save_transaction(transaction_kwargs)
-                log.append(bank_entry)
-
-        context_data['test'] = log
+        bank_line_pks = [field.split('-')[1] for field in request.POST
+                         if field.split('-')[0] == 'catpk']
+        try:
+            context_data['results'] = categorise_bank_lines(
+                request.user, bank_line_pks, request.POST['subledger'],
+                request.POST.get('manual-account'))
+        except Exception as e:
+            context_data['error'] = str(e)
+        # categorised lines are no longer unreconciled.
+        categorised = set(result['bank_line'] for result in
+                          context_data.get('results', [])
+                          if not result['error'])
+        context_data['object_list'] = [
+            bank_line for bank_line in object_list
+            if bank_line.pk not in categorised]
 
     return render(request, template_name, context_data)
 
 
+def bank_categorisation_batch(request):
+    """ JSON batch categorisation, see `utils.categorise_bank_lines`.
+
+    POST (form or JSON body):
+        {'bank_lines': [pk, ...], 'subledger': str, 'account': optional}
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Not logged in."}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': "POST required."}, status=405)
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            bank_line_pks = data.get('bank_lines', [])
+        except ValueError:
+            return JsonResponse({'error': "Invalid JSON."}, status=400)
+    else:
+        data = request.POST
+        bank_line_pks = data.getlist('bank_lines')
+    try:
+        results = categorise_bank_lines(
+            request.user, bank_line_pks, data.get('subledger'),
+            data.get('account'))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': results})
+
+
+def bank_categorisation_suggestions(request):
+    """ JSON suggested `Account`/`Creditor` for every unreconciled
+    `BankLine`, optionally for one `?bank_account=<pk>`. """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Not logged in."}, status=403)
+    queryset = BankLine.objects.unreconciled()
+    if request.GET.get('bank_account'):
+        queryset = queryset.filter(bank_account=request.GET['bank_account'])
+    suggestions = categoriser.suggest_lines(queryset.only(
+        'pk', 'tokens', 'description', 'line_dump'))
+    return JsonResponse({'results': [
+        dict(suggestion._asdict(), bank_line=pk)
+        for pk, suggestion in sorted(suggestions.items()) if suggestion]})
+
+
 def bank_reconciliation(request, account):
 
     template_name = 'subledgers/bank_reconciliations/banktransaction_list.html'
 
+    object_list, next_cursor = keyset_page(
+        BankLine.objects.unreconciled(), request.GET.get('cursor'))
     context_data = {
-        'object_list': BankLine.objects.unreconciled(),
+        'object_list': object_list,
+        'next_cursor': next_cursor,
         'bank_account': Account.objects.by_code(account),
         'account_list': Account.objects.regular(
         ).order_by('element', 'number')
@@ -113,6 +247,27 @@ def bank_reconciliation(request, account):
     return render(request, template_name, context_data)
 
 
+def get_date_param(request, key, default=None):
+    """ ISO date (eg. 2017-06-30) from `request.GET[key]`, or `default`. """
+    try:
+        return parse_iso_date(request.GET[key])
+    except (KeyError, ValueError):
+        return default
+
+
+def bank_reconciliation_statement(request, pk):
+    """ Reconciliation statement for `BankAccount` pk, as at `?date=`
+    (default today), listing statement lines from `?from=`. """
+    template_name = \
+        'subledgers/bank_reconciliations/reconciliation_statement.html'
+    bank_account = get_object_or_404(
+        BankAccount.objects.select_related('account'), pk=pk)
+    context_data = reconciliation_statement(
+        bank_account, get_date_param(request, 'date', date.today()),
+        get_date_param(request, 'from'))
+    return render(request, template_name, context_data)
+
+
 class BankLineListView(generic.list.ListView):
 
     model = BankLine
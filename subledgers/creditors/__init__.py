@@ -0,0 +1 @@
+default_app_config = 'subledgers.creditors.apps.CreditorsConfig'
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+""" ABA (CEMTEX) direct entry files, for uploading payments to the bank.
+
+Fixed width 120 character records, one file:
+
+    0  descriptive record  (payer's bank, user name/id, processing date)
+    1  detail record       one per payment (payee BSB, account, amount)
+    7  file total record
+
+Usage:
+
+    lines = aba_records(bank_account, [
+        Credit('062-000', '12345678', 'ACME PTY LTD', 10050, 'INV 1'),
+    ], date(2017, 6, 30), description='CREDITORS')
+    write_aba(path, lines)
+"""
+import os
+import re
+from collections import namedtuple
+
+from subledgers.settings import ABA_USER_ID, ABA_USER_NAME
+
+
+Credit = namedtuple('Credit', ['bsb', 'account_number', 'account_name',
+                               'cents', 'reference'])
+
+CREDIT_CODE = '50'
+
+ALLOWED = re.compile(r"[^A-Z0-9 &()*+,\-./;<=>?@\[\]_']")
+
+
+def clean(text, width, align='<', fill=' '):
+    """ Uppercase `text` without characters not allowed in ABA files,
+    truncated/padded to `width`. """
+    text = ALLOWED.sub(' ', str(text or '').upper())[:width]
+    return "{:{}{}{}}".format(text, fill, align, width)
+
+
+def format_bsb(bsb):
+    """ "062000" or "062-000" as "062-000". """
+    digits = re.sub(r"\D", "", str(bsb or ""))
+    if len(digits) != 6:
+        raise Exception("Invalid BSB: {}".format(bsb))
+    return "{}-{}".format(digits[:3], digits[3:])
+
+
+def format_account_number(account_number):
+    account_number = re.sub(r"[\s\-]", "", str(account_number or ""))
+    if not account_number.isdigit() or len(account_number) > 9:
+        raise Exception("Invalid account number: {}".format(account_number))
+    return account_number.rjust(9)
+
+
+def is_valid_account(bsb, account_number):
+    try:
+        format_bsb(bsb), format_account_number(account_number)
+    except Exception:
+        return False
+    return True
+
+
+def aba_records(bank_account, credits, process_date, description='',
+                user_name=None, user_id=None):
+    """ Returns list of 120 character records paying `credits` from
+    `BankAccount` `bank_account`. """
+    user_name = user_name or ABA_USER_NAME or bank_account.account.name
+    user_id = user_id or ABA_USER_ID
+    trace_bsb = format_bsb(bank_account.bsb)
+    trace_account = format_account_number(bank_account.account_number)
+    remitter = clean(user_name, 16)
+
+    lines = ["0{}01{}{}{}{}{}{:%d%m%y}{}".format(
+        ' ' * 17, clean(bank_account.bank, 3), ' ' * 7, clean(user_name, 26),
+        clean(user_id, 6, '>', '0'), clean(description, 12), process_date,
+        ' ' * 40)]
+
+    total = 0
+    for credit in credits:
+        if not 0 < credit.cents < 10 ** 10:
+            raise Exception("Invalid amount: {} cents".format(credit.cents))
+        total += credit.cents
+        lines.append("1{}{} {}{:010d}{}{}{}{}{}{}".format(
+            format_bsb(credit.bsb),
+            format_account_number(credit.account_number), CREDIT_CODE,
+            credit.cents, clean(credit.account_name, 32),
+            clean(credit.reference, 18), trace_bsb, trace_account, remitter,
+            '0' * 8))
+
+    lines.append("7999-999{}{:010d}{:010d}{:010d}{}{:06d}{}".format(
+        ' ' * 12, total, total, 0, ' ' * 24, len(credits), ' ' * 40))
+    return lines
+
+
+def write_aba(path, lines):
+    """ Writes `lines` to `path` (creating its directory), CRLF line ends.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w', encoding='ascii', newline='') as aba_file:
+        aba_file.write("".join(line + "\r\n" for line in lines))
+    return path
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+""" Aged payables: open `CreditorInvoice`s bucketed by days overdue.
+
+Every creditor is bucketed in one query (conditional aggregation of `unpaid`
+grouped by creditor), rather than an aggregate per period per creditor.
+
+Buckets are by `due_date` (invoice date if there is none) as at `as_of`,
+using `AGED_PERIODS`:
+
+    current   not yet due
+    1-7       1 to 7 days overdue
+    ...
+    91-120
+    120+      more than 120 days overdue
+
+Usage:
+
+    aged_payables(date(2017, 6, 30))
+    # {'as_of': .., 'buckets': ['current', '1-7', ..], 'rows': [..],
+    #  'totals': [..], 'total': ..}
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from subledgers.settings import AGED_PERIODS
+from .models import CreditorInvoice
+
+
+def aged_buckets(as_of, periods=None):
+    """ [(label, Q on annotated `due`), ...] for `as_of`. """
+    periods = periods or AGED_PERIODS
+    buckets = [('current', Q(due__gte=as_of))]
+    previous = 0
+    for period in periods:
+        buckets.append(("{}-{}".format(previous + 1, period), Q(
+            due__lt=as_of - timedelta(days=previous),
+            due__gte=as_of - timedelta(days=period))))
+        previous = period
+    buckets.append(("{}+".format(previous), Q(
+        due__lt=as_of - timedelta(days=previous))))
+    return buckets
+
+
+def aged_payables(as_of=None, creditor=None, periods=None):
+    """ Returns dict, see module docstring. Each row is:
+
+        {'creditor': pk, 'code': str, 'name': str,
+         'buckets': [Decimal, ...], 'total': Decimal}
+
+    ordered by creditor name. `creditor` limits rows to one `Creditor`. """
+    as_of = as_of or date.today()
+    buckets = aged_buckets(as_of, periods)
+    zero = Value(Decimal(0), output_field=DecimalField())
+    sums = {
+        'bucket_{}'.format(i): Sum(Case(
+            When(condition, then='unpaid'), default=zero,
+            output_field=DecimalField()))
+        for i, (label, condition) in enumerate(buckets)}
+
+    queryset = CreditorInvoice.objects.open().filter(
+        transaction__date__lte=as_of)
+    if creditor is not None:
+        queryset = queryset.filter(relation=creditor)
+    queryset = queryset.annotate(
+        due=Coalesce('due_date', 'transaction__date')).values(
+        'relation', 'relation__entity__code', 'relation__entity__name'
+    ).annotate(total=Sum('unpaid'), **sums).order_by(
+        'relation__entity__name', 'relation')
+
+    rows = []
+    totals = [Decimal(0)] * len(buckets)
+    for row in queryset:
+        values = [row['bucket_{}'.format(i)] or Decimal(0)
+                  for i in range(len(buckets))]
+        totals = [a + b for a, b in zip(totals, values)]
+        rows.append({
+            'creditor': row['relation'],
+            'code': row['relation__entity__code'],
+            'name': row['relation__entity__name'],
+            'buckets': values,
+            'total': row['total'],
+        })
+
+    return {
+        'as_of': as_of,
+        'buckets': [label for label, condition in buckets],
+        'rows': rows,
+        'totals': totals,
+        'total': sum(totals),
+    }
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+""" Allocates `CreditorPayment`s to their creditor's open invoices.
+
+Saving one `CreditorPaymentInvoice` at a time re-aggregates and saves the
+invoice for every allocation. Instead, for any number of payments:
+
+1. existing allocations of the payments are loaded (one query), their value
+   is given back to the invoices in memory ("restart"),
+2. the creditors' open invoices are loaded (one query), and allocated oldest
+   first in memory,
+3. in one atomic block: old allocations are deleted, new ones inserted with
+   `bulk_create`, and each changed invoice's `unpaid` moved by its net
+   change (F() expression, so concurrent allocations are kept) with one
+   `UPDATE ... CASE` per `ALLOCATION_BATCH_SIZE` invoices.
+
+`unpaid` is otherwise kept up to date by `CreditorPaymentInvoice` save and
+delete, `unpaid_drift()` finds any invoice where it isn't.
+
+Usage:
+
+    allocate_payments(CreditorPayment.objects.filter(...))
+    # {payment.pk: [CreditorPaymentInvoice, ...], ...}
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from ledgers.posting import bulk_create_with_pks, chunked
+from .models import CreditorInvoice, CreditorPaymentInvoice
+
+
+# Invoices per `unpaid` UPDATE (2 parameters each).
+ALLOCATION_BATCH_SIZE = getattr(settings, 'SUBLEDGERS_ALLOCATION_BATCH_SIZE',
+                                400)
+
+
+def allocate(total, invoices):
+    """ Yields (invoice, value) allocating `total` to `invoices` in order,
+    reducing `invoice.unpaid` as it goes. """
+    for invoice in invoices:
+        if total <= 0:
+            break
+        if invoice.unpaid <= 0:
+            continue
+        value = min(total, invoice.unpaid)
+        invoice.unpaid -= value
+        total -= value
+        yield invoice, value
+
+
+def update_unpaid(deltas):
+    """ Adds {invoice pk: delta} to `unpaid`, without `save()`. See
+    `InvoiceQuerySet.adjust_unpaid`. """
+    for chunk in chunked(sorted(deltas.items()), ALLOCATION_BATCH_SIZE):
+        CreditorInvoice.objects.filter(
+            pk__in=[pk for pk, delta in chunk]).update(unpaid=Case(
+                *[When(pk=pk, then=F('unpaid') + Value(delta))
+                  for pk, delta in chunk],
+                default=F('unpaid'), output_field=DecimalField()))
+
+
+def allocate_payments(payments, values=None):
+    """ (Re)allocates each of `payments`, in order, to its creditor's open
+    invoices oldest first. `values` is optional {payment.pk: value},
+    otherwise the payment's `bank_entry.transaction.value` is allocated, or
+    without a bank entry (eg. `payment_run`) its existing allocations total.
+
+    Returns {payment.pk: [CreditorPaymentInvoice, ...]}. Use
+    `select_related('bank_entry__transaction')` for many payments. """
+    values = dict(values or {})
+    payments = list(payments)
+    for payment in payments:
+        if payment.pk not in values and payment.bank_entry_id:
+            values[payment.pk] = payment.bank_entry.transaction.value
+
+    with db_transaction.atomic():
+        # 1. restart: value of existing allocations back to their invoices
+        existing = CreditorPaymentInvoice.objects.filter(payment__in=payments)
+        freed, allocated = {}, {}
+        for payment_id, invoice_id, value in existing.values_list(
+                'payment', 'invoice', 'value'):
+            freed[invoice_id] = freed.get(invoice_id, Decimal(0)) + value
+            allocated[payment_id] = allocated.get(
+                payment_id, Decimal(0)) + value
+        for payment in payments:
+            if payment.pk not in values:
+                if payment.pk not in allocated:
+                    raise Exception("Payment {} has no bank entry, a value "
+                                    "is required.".format(payment.pk))
+                values[payment.pk] = allocated[payment.pk]
+
+        # 2. open invoices, oldest first
+        invoices, loaded = {}, {}
+        for invoice in CreditorInvoice.objects.select_for_update().filter(
+                relation__in={payment.relation_id for payment in payments}
+        ).filter(Q(unpaid__gt=0) | Q(pk__in=list(freed))).order_by(
+                'transaction__date', 'pk'):
+            loaded[invoice.pk] = invoice.unpaid
+            invoice.unpaid += freed.get(invoice.pk, Decimal(0))
+            invoices.setdefault(invoice.relation_id, []).append(invoice)
+
+        results, allocations = {}, []
+        for payment in payments:
+            results[payment.pk] = []
+            for invoice, value in allocate(
+                    values[payment.pk], invoices.get(payment.relation_id, [])):
+                allocation = CreditorPaymentInvoice(
+                    payment=payment, invoice=invoice, value=value)
+                results[payment.pk].append(allocation)
+                allocations.append(allocation)
+
+        # 3. write
+        existing.delete()
+        bulk_create_with_pks(CreditorPaymentInvoice, allocations)
+        deltas = dict(freed)
+        for creditor_invoices in invoices.values():
+            for invoice in creditor_invoices:
+                deltas[invoice.pk] = invoice.unpaid - loaded[invoice.pk]
+        update_unpaid({pk: delta for pk, delta in deltas.items() if delta})
+    return results
+
+
+def unpaid_drift():
+    """ Yields (invoice pk, `unpaid`, transaction value less allocations) of
+    every invoice where they differ, from one grouped query. """
+    zero = Value(Decimal(0), output_field=DecimalField())
+    for pk, unpaid, value, paid in CreditorInvoice.objects.annotate(
+            paid=Coalesce(Sum('creditorpaymentinvoice__value'), zero)
+    ).order_by('pk').values_list(
+            'pk', 'unpaid', 'transaction__value', 'paid').iterator():
+        if unpaid != value - paid:
+            yield pk, unpaid, value - paid
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 
 class CreditorsConfig(AppConfig):
-    name = 'creditors'
+    name = 'subledgers.creditors'
+
+    def ready(self):
+        from subledgers.creditors import signals  # noqa
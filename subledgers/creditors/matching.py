@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+""" Matches unreconciled `BankLine` debits to open `CreditorInvoice`s.
+
+Rather than allocating oldest-first once a creditor has been picked (see
+`CreditorPayment.match_invoices`) every debit in the queue is matched in one
+pass, using two queries: open invoices and unreconciled debits.
+
+1. Exact amount: open invoices are held in an index sorted by unpaid amount
+   (in cents), each bank line looks up its amount with `bisect`.
+
+2. Combinations: a payment may cover several invoices of one creditor.
+   Combinations of up to `MATCH_MAX_INVOICES` of a creditor's open invoices
+   (the `MATCH_MAX_COMBINE` closest by date) summing to the amount are
+   found with a bounded subset-sum search. Each creditor's invoices are
+   sorted by date, so only those which can be in the date window are
+   looked at (`bisect` on the dates).
+
+Only invoices dated on or before the bank line, and no more than
+`MATCH_DATE_WINDOW` days past due (or invoice date if no due date) are
+matched.
+
+Usage:
+
+    from subledgers.creditors.matching import match_bank_lines
+
+    match_bank_lines()
+    # {bank_line.pk: [Match, ...] best first, ...}
+"""
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import timedelta
+
+from subledgers.bank_reconciliations.models import BankLine
+from subledgers.settings import (MATCH_DATE_WINDOW, MATCH_MAX_COMBINE,
+                                 MATCH_MAX_INVOICES)
+from .models import CreditorInvoice
+
+
+OpenInvoice = namedtuple('OpenInvoice', ['cents', 'date', 'pk', 'creditor',
+                                         'due_date'])
+
+Match = namedtuple('Match', ['bank_line', 'creditor', 'invoices', 'value',
+                             'score'])
+
+
+def make_cents(value):
+    return int(round(value * 100))
+
+
+def load_open_invoices():
+    """ All open invoices (one query), sorted by amount then date. """
+    return sorted(
+        OpenInvoice(make_cents(unpaid), invoice_date, pk, creditor,
+                    due_date or invoice_date)
+        for pk, creditor, invoice_date, due_date, unpaid in
+        CreditorInvoice.objects.open().values_list(
+            'pk', 'relation_id', 'transaction__date', 'due_date', 'unpaid'))
+
+
+def in_window(invoice, line_date, window):
+    return invoice.date <= line_date <= invoice.due_date + window
+
+
+def score_match(invoices, line_date, window):
+    """ 1 for a single invoice paid on its due date, less for every
+    additional invoice and for distance from the due date(s). """
+    days = max(abs((line_date - invoice.due_date).days)
+               for invoice in invoices)
+    span = max(window.days, 1)
+    score = 1.0 - 0.1 * (len(invoices) - 1) - 0.2 * min(days, span) / span
+    return round(score, 3)
+
+
+def find_subsets(invoices, cents, max_size):
+    """ Yields tuples of up to `max_size` `invoices` with amounts summing to
+    `cents`. `invoices` must be sorted by amount. """
+    def search(start, remaining, chosen):
+        for i in range(start, len(invoices)):
+            invoice = invoices[i]
+            if invoice.cents > remaining:
+                break  # sorted, so nothing after fits either
+            if invoice.cents == remaining:
+                yield chosen + (invoice,)
+            elif len(chosen) + 1 < max_size:
+                for subset in search(i + 1, remaining - invoice.cents,
+                                     chosen + (invoice,)):
+                    yield subset
+
+    for subset in search(0, cents, ()):
+        if len(subset) > 1:
+            yield subset
+
+
+def match_bank_lines(bank_lines=None, invoices=None, window=None,
+                     max_invoices=None, max_combine=None):
+    """ Returns ranked candidate matches for every debit in `bank_lines`
+    (default: all unreconciled):
+
+        {bank_line.pk: [Match(bank_line, creditor, invoices, value, score),
+                        ...]}
+
+    best first, lines without any candidate not included. `invoices` are
+    `OpenInvoice` as per `load_open_invoices()` (the default).
+    """
+    window = timedelta(days=MATCH_DATE_WINDOW if window is None else window)
+    max_invoices = max_invoices or MATCH_MAX_INVOICES
+    max_combine = max_combine or MATCH_MAX_COMBINE
+    if bank_lines is None:
+        bank_lines = BankLine.objects.unreconciled().filter(
+            value__lt=0).only('date', 'value')
+    if invoices is None:
+        invoices = load_open_invoices()
+
+    amounts = [invoice.cents for invoice in invoices]
+    by_creditor = {}
+    for invoice in sorted(invoices, key=lambda invoice: invoice.date):
+        by_creditor.setdefault(invoice.creditor, []).append(invoice)
+    # {creditor: (invoices by date, their dates, longest terms)}, an invoice
+    # dated before line date - window - longest terms is past its window.
+    by_creditor = {
+        creditor: (creditor_invoices,
+                   [invoice.date for invoice in creditor_invoices],
+                   max(invoice.due_date - invoice.date
+                       for invoice in creditor_invoices))
+        for creditor, creditor_invoices in by_creditor.items()}
+
+    results = {}
+    for bank_line in bank_lines:
+        pk, line_date, value = bank_line.pk, bank_line.date, bank_line.value
+        if value >= 0:
+            continue
+        cents = make_cents(-value)
+        matches = []
+
+        # 1. exact amount
+        for invoice in invoices[bisect_left(amounts, cents):
+                                bisect_right(amounts, cents)]:
+            if in_window(invoice, line_date, window):
+                matches.append(Match(
+                    pk, invoice.creditor, (invoice.pk,), -value,
+                    score_match([invoice], line_date, window)))
+
+        # 2. combinations of one creditor's invoices
+        for creditor, (creditor_invoices, dates, terms) in \
+                by_creditor.items():
+            candidates = [
+                invoice for invoice in creditor_invoices[
+                    bisect_left(dates, line_date - window - terms):
+                    bisect_right(dates, line_date)]
+                if invoice.cents < cents and
+                in_window(invoice, line_date, window)]
+            if len(candidates) < 2 or \
+                    sum(invoice.cents for invoice in candidates) < cents:
+                continue
+            candidates = sorted(sorted(
+                candidates,
+                key=lambda invoice: (
+                    abs((line_date - invoice.due_date).days), invoice)
+            )[:max_combine])
+            for subset in find_subsets(candidates, cents, max_invoices):
+                matches.append(Match(
+                    pk, creditor, tuple(invoice.pk for invoice in subset),
+                    -value, score_match(subset, line_date, window)))
+
+        if matches:
+            results[pk] = sorted(
+                matches, key=lambda match: (-match.score, match.invoices))
+    return results
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('creditors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditor',
+            name='account_name',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='creditor',
+            name='account_number',
+            field=models.CharField(blank=True, default='', max_length=9),
+        ),
+        migrations.AddField(
+            model_name='creditor',
+            name='bsb',
+            field=models.CharField(blank=True, default='', max_length=7),
+        ),
+        migrations.AddIndex(
+            model_name='creditorinvoice',
+            index=models.Index(fields=['due_date', 'unpaid'], name='creditorinvoice_due_idx'),
+        ),
+    ]
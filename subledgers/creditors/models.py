@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
-from datetime import date, timedelta
+from decimal import Decimal
 from django.db import models
+from django.db import transaction as db_transaction
 
 from subledgers.models import Invoice, Payment, Relation
 from subledgers.querysets import InvoiceQuerySet, RelationQuerySet
-from subledgers.settings import AGED_PERIODS
 
 
 class Creditor(Relation):
@@ -17,7 +17,12 @@ class Creditor(Relation):
 
     terms = models.IntegerField(default=14)  # settings.DEFAULT_TERMS)
 
+    # Paid to by payment runs, see `payment_run`.
+    bsb = models.CharField(max_length=7, blank=True, default="")
 
+    account_number = models.CharField(max_length=9, blank=True, default="")
+
+    account_name = models.CharField(max_length=32, blank=True, default="")
 
     objects = RelationQuerySet.as_manager()
 
@@ -28,28 +33,13 @@ class Creditor(Relation):
         return self.entity.name
 
 
-    def invoices_aged(self):
-        qs = self.creditorinvoice_set.all()
-        aged = {x: "" for x in AGED_PERIODS}
-        per_day1 = date.today()
-        for period in AGED_PERIODS:
-            if period == AGED_PERIODS[-1]:
-                total = qs.filter(
-                    transaction__date__lte=date.today() - timedelta(
-                        days=AGED_PERIODS[-1])).aggregate(
-                    period_total=models.Sum("transaction__value"))
-                print(total)
-            else:
-                per_day2 = date.today() - timedelta(days=period)
-                print(per_day1, per_day2)
-                total = qs.filter(
-                    transaction__date__lt=per_day1,
-                    transaction__date__gt=per_day2).aggregate(
-                        period_total=models.Sum("transaction__value"))
-                per_day1 = per_day2 + timedelta(days=1)
-            aged[period] = total['period_total']
-
-        return aged
+    def invoices_aged(self, as_of=None):
+        """ {bucket: unpaid total} of open invoices, see `aged`. """
+        from .aged import aged_payables
+        aged = aged_payables(as_of, creditor=self)
+        totals = aged['rows'][0]['buckets'] if aged['rows'] else \
+            [Decimal(0)] * len(aged['buckets'])
+        return dict(zip(aged['buckets'], totals))
 
 
 class CreditorAccount(models.Model):
@@ -85,6 +75,11 @@ class CreditorInvoice(SpecificRelation, Invoice):
     class Meta:
         ordering = ['transaction__date']
         unique_together = ("invoice_number", "relation")
+        indexes = [
+            # Invoices due by a date, see `payment_run`.
+            models.Index(fields=['due_date', 'unpaid'],
+                         name='creditorinvoice_due_idx'),
+        ]
 
     def __str__(self):
         return "[{}] {} -- {} -- ${} [outstanding: ${}]".format(
@@ -93,23 +88,28 @@ class CreditorInvoice(SpecificRelation, Invoice):
             self.unpaid)
 
     def save(self, *args, **kwargs):
-
-        # Set unpaid value
-        # @@ TODO This can be done better.
+        """ `unpaid` is set to the transaction value on insert, after that it
+        is only moved by allocations (F() updates), so it is left out of
+        updates: a stale instance can't undo them. Name it in
+        `update_fields` to write it, eg. `outstanding_balance()`. """
         if not self.pk:
             self.unpaid = self.transaction.value
-        else:
-            if not self.creditorpayment_set.all():
-                self.unpaid = self.transaction.value
+        elif kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'unpaid']
         super(CreditorInvoice, self).save(*args, **kwargs)
 
     def is_settled(self):
-        if self.outstanding_balance():
+        if self.unpaid > 0:
             return False
         else:
             return True
 
     def outstanding_balance(self):
+        """ Recomputes `unpaid` from every allocation. `unpaid` is kept up
+        to date as allocations are made/removed, this is for repairs, see
+        `rebuild_unpaid_balances`. """
         value = self.transaction.value
         paid = self.creditorpaymentinvoice_set.aggregate(
             sum=models.Sum('value'))
@@ -117,7 +117,7 @@ class CreditorInvoice(SpecificRelation, Invoice):
             self.unpaid = value - paid['sum']
         else:
             self.unpaid = value
-        self.save()
+        self.save(update_fields=['unpaid'])
         return self.unpaid
 
 
@@ -142,6 +142,11 @@ class CreditorPayment(SpecificRelation, Payment):
         through='creditors.CreditorPaymentInvoice')
 
     def __str__(self):
+        if not self.bank_entry_id:
+            # eg. `payment_run`, until its bank debit is categorised.
+            return "[{}] {} -- {} -- no bank entry".format(
+                self.relation.entity.code, self.relation.entity.name,
+                self.reference or self.pk)
         return "[{}] {} -- {} -- ${}".format(
             self.relation.entity.code, self.relation.entity.name,
             self.bank_entry.transaction.date,
@@ -162,41 +167,22 @@ class CreditorPayment(SpecificRelation, Payment):
             return False
 
     def restart(self):
-        # @@TODO probably should be pre-delete hook on CreditorPaymentInvoice
-        for crpayinv in self.creditorpaymentinvoice_set.all():
-            invoice = crpayinv.invoice
-            crpayinv.delete()
-            invoice.outstanding_balance()
+        """ Removes allocations, giving their value back to the invoices. """
+        from .allocation import update_unpaid
+        allocations = self.creditorpaymentinvoice_set.all()
+        with db_transaction.atomic():
+            update_unpaid(dict(allocations.order_by().values(
+                'invoice').annotate(total=models.Sum('value')).values_list(
+                'invoice', 'total')))
+            allocations.delete()
 
     def match_invoices(self, value=None):
-        """ Automatic matching done by LIFO.
+        """ Automatic matching, oldest invoice first, see `allocation`.
 
         If bank_entry has been matched `transaction.value` will be used.
         Otherwise `value` argument must be added to this method. """
-        if self.has_invoices():
-            self.restart()
-
-        if value:
-            total = value
-        else:
-            total = self.bank_entry.transaction.value
-
-        for invoice in self.relation.creditorinvoice_set.open():
-            if total > 0:
-                new_crpayinv = CreditorPaymentInvoice(
-                    payment=self,
-                    invoice=invoice,
-                )
-                if total > invoice.unpaid:
-                    total = total - invoice.unpaid
-                    new_crpayinv.value = invoice.unpaid
-                    new_crpayinv.save()
-                elif total < invoice.unpaid:
-                    new_crpayinv.value = total
-                    new_crpayinv.save()
-                    total = 0
-            else:
-                break
+        from .allocation import allocate_payments
+        allocate_payments([self], {self.pk: value} if value else None)
         return self.invoices.all()
 
 
@@ -209,8 +195,33 @@ class CreditorPaymentInvoice(models.Model):
     value = models.DecimalField(max_digits=19, decimal_places=2)
 
     def save(self, *args, **kwargs):
-        super(CreditorPaymentInvoice, self).save(*args, **kwargs)
-        self.invoice.outstanding_balance()
+        """ Moves the invoice's `unpaid` by the change in `value`. """
+        with db_transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = CreditorPaymentInvoice.objects.filter(
+                    pk=self.pk).values_list('invoice', 'value').first()
+            super(CreditorPaymentInvoice, self).save(*args, **kwargs)
+            if previous:
+                CreditorInvoice.objects.filter(
+                    pk=previous[0]).adjust_unpaid(previous[1])
+            CreditorInvoice.objects.filter(
+                pk=self.invoice_id).adjust_unpaid(-Decimal(self.value))
+        self.refresh_invoice()
+
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            result = super(CreditorPaymentInvoice, self).delete(
+                *args, **kwargs)
+            CreditorInvoice.objects.filter(
+                pk=self.invoice_id).adjust_unpaid(Decimal(self.value))
+        self.refresh_invoice()
+        return result
+
+    def refresh_invoice(self):
+        # Caller's `invoice` instance would otherwise save a stale `unpaid`.
+        if self._meta.get_field('invoice').is_cached(self):
+            self.invoice.refresh_from_db(fields=['unpaid'])
 
 
 class CreditorLearning(models.Model):
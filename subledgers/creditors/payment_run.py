@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+""" Payment run: pays every creditor invoice due by a cutoff date.
+
+1. open invoices due by the cutoff are loaded with one query (on the
+   `creditorinvoice_due_idx` (`due_date`, `unpaid`) index), and grouped by
+   creditor. An invoice without a `due_date` is due on its date, as per
+   `aged` and `matching`,
+2. one `CreditorPayment` per creditor, allocated in full to its due
+   invoices, is created with `bulk_create` (payments, allocations) and one
+   `unpaid` update per batch, in one atomic block,
+3. an ABA file paying each creditor is written to `PAYMENT_RUN_DIRECTORY`.
+
+Creditors without valid bank details (`bsb`, `account_number`) are left out
+of the run, and returned as `skipped`.
+
+The payments have no `bank_entry` until the bank debit is categorised. Each
+payment is one ABA credit, so the bank statement has a debit of the
+payment's total (its allocations) for each: `unlinked_payments()` lists the
+run payments still waiting for theirs, with `total`, and
+`link_bank_entry()` links the categorised `BankEntry`. Until then the
+payment's value is its allocations total (see `allocation`).
+
+Usage:
+
+    payment_run(user, date(2017, 6, 30), bank_account)
+    # {'payments': [CreditorPayment, ...], 'skipped': [Creditor, ...],
+    #  'total': Decimal, 'path': '.../payments-20170630-1.aba'}
+"""
+import os
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+
+from ledgers.posting import bulk_create_with_pks
+from subledgers.settings import PAYMENT_RUN_DIRECTORY
+from .aba import Credit, aba_records, is_valid_account, write_aba
+from .allocation import update_unpaid
+from .matching import make_cents
+from .models import (Creditor, CreditorInvoice, CreditorPayment,
+                     CreditorPaymentInvoice)
+
+
+def due_invoices(cutoff):
+    """ {creditor pk: [(invoice pk, invoice number, unpaid), ...]} of open
+    invoices due by `cutoff`, oldest due first. """
+    by_creditor = {}
+    for pk, relation_id, invoice_number, unpaid in \
+            CreditorInvoice.objects.select_for_update(of=('self',)).filter(
+                Q(due_date__lte=cutoff) |
+                Q(due_date__isnull=True, transaction__date__lte=cutoff),
+                unpaid__gt=0).order_by(
+                Coalesce('due_date', 'transaction__date'), 'pk').values_list(
+                'pk', 'relation', 'invoice_number', 'unpaid'):
+        by_creditor.setdefault(relation_id, []).append(
+            (pk, invoice_number, unpaid))
+    return by_creditor
+
+
+def payment_run(user, cutoff, bank_account, process_date=None,
+                directory=None, description='CREDITORS'):
+    """ Pays invoices due by `cutoff` from `BankAccount` `bank_account`.
+    Returns dict, see module docstring (`path` is None if nothing was paid).
+    """
+    process_date = process_date or date.today()
+    directory = directory or PAYMENT_RUN_DIRECTORY
+    reference = "Payment run {:%Y-%m-%d}".format(cutoff)
+
+    with db_transaction.atomic():
+        by_creditor = due_invoices(cutoff)
+        creditors = Creditor.objects.filter(
+            pk__in=list(by_creditor)).select_related('entity').order_by(
+            'entity__name', 'pk')
+
+        payments, skipped = [], []
+        for creditor in creditors:
+            if not is_valid_account(creditor.bsb, creditor.account_number):
+                skipped.append(creditor)
+                continue
+            payments.append(CreditorPayment(relation=creditor, user=user,
+                                            reference=reference,
+                                            bank_entry=None))
+        bulk_create_with_pks(CreditorPayment, payments)
+        totals = {payment.pk: sum(x[2] for x in by_creditor[
+            payment.relation_id]) for payment in payments}
+
+        allocations, deltas = [], {}
+        for payment in payments:
+            for pk, invoice_number, unpaid in by_creditor[payment.relation_id]:
+                allocations.append(CreditorPaymentInvoice(
+                    payment=payment, invoice_id=pk, value=unpaid))
+                deltas[pk] = -unpaid
+        CreditorPaymentInvoice.objects.bulk_create(allocations)
+        update_unpaid(deltas)
+
+        path = None
+        if payments:
+            credits = [Credit(
+                payment.relation.bsb, payment.relation.account_number,
+                payment.relation.account_name or payment.relation.entity.name,
+                make_cents(totals[payment.pk]),
+                ", ".join(x[1] for x in by_creditor[payment.relation_id]))
+                for payment in payments]
+            path = write_aba(os.path.join(
+                directory, "payments-{:%Y%m%d}-{}.aba".format(
+                    cutoff, payments[0].pk)),
+                aba_records(bank_account, credits, process_date, description))
+
+    return {
+        'payments': payments,
+        'skipped': skipped,
+        'total': sum(totals.values(), Decimal(0)),
+        'path': path,
+    }
+
+
+def unlinked_payments(reference=None):
+    """ Run payments (`reference` "Payment run ...", or as given) without a
+    bank entry yet, with `total` of their allocations, oldest first. """
+    queryset = CreditorPayment.objects.filter(bank_entry__isnull=True)
+    if reference is None:
+        queryset = queryset.filter(reference__startswith="Payment run ")
+    else:
+        queryset = queryset.filter(reference=reference)
+    return queryset.select_related('relation__entity').annotate(
+        total=Sum('creditorpaymentinvoice__value')).order_by('pk')
+
+
+def link_bank_entry(payment, bank_entry):
+    """ Links run `payment` to the `BankEntry` of its categorised bank
+    debit, which must be for the payment's total. """
+    total = payment.invoices_total()
+    if bank_entry.transaction.value != total:
+        raise Exception("Bank entry ${} is not payment total ${}.".format(
+            bank_entry.transaction.value, total))
+    payment.bank_entry = bank_entry
+    payment.save(update_fields=['bank_entry'])
+    return payment
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import CreditorPayment
+
+
+@receiver(pre_delete, sender=CreditorPayment)
+def restart_deleted_payment(sender, instance, **kwargs):
+    # Allocations are deleted by cascade (eg. with the `BankEntry`) without
+    # giving their value back to the invoices.
+    instance.restart()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+""" Reconciles supplier statements against `CreditorInvoice`s.
+
+A statement dump (pasted from a spreadsheet, or a file) has a header row and
+one line per invoice outstanding according to the supplier, for any number
+of creditors:
+
+    creditor    invoice_number    value
+    ACME        1001              110.00
+    ACME        1002              55.00
+    BOLTS       A-77              20.00
+
+Lines are grouped by (creditor code, invoice number), then joined to the
+creditors' invoices in memory: the statement creditors and their invoices
+are loaded with one query each (`prefetch_related`), whatever the number of
+creditors. Each creditor's result is:
+
+    matched             on the statement, `unpaid` agrees
+    mismatched          on the statement, `unpaid` differs
+    missing             on the statement, no such invoice
+    not_on_statement    open invoice dated by `as_of` not on the statement
+
+Usage:
+
+    reconcile_statements(dump, date(2017, 6, 30))
+    # {'creditors': [{'creditor': Creditor, 'matched': [..], ..}, ..],
+    #  'unknown': [StatementLine, ..]}
+"""
+from collections import namedtuple
+from datetime import date
+
+from django.db.models import Func, Prefetch, Q
+from django.db.models.functions import Upper
+
+from ledgers import utils
+from .models import Creditor, CreditorInvoice
+
+
+StatementLine = namedtuple('StatementLine', ['creditor', 'invoice_number',
+                                             'value'])
+
+REQUIRED_COLUMNS = ['creditor', 'invoice_number', 'value']
+
+
+class Trim(Func):
+    """ As per `django.db.models.functions.Trim` (Django 2.1+). """
+    function = 'TRIM'
+
+
+def make_invoice_key(invoice_number):
+    return str(invoice_number).strip().upper()
+
+
+def parse_statements(dump):
+    """ Returns {(creditor code, invoice key): StatementLine} from `dump`,
+    amounts of lines for the same invoice added together. """
+    lines = {}
+    for i, row in enumerate(utils.iter_tsv_dicts(dump), 2):
+        row = {k.strip().lower(): v.strip() for k, v in row.items()}
+        missing = [x for x in REQUIRED_COLUMNS if not row.get(x)]
+        if missing:
+            raise Exception("Row {}: missing {}.".format(
+                i, ", ".join(missing)))
+        try:
+            value = utils.make_decimal(row['value'])
+        except ArithmeticError:
+            raise Exception("Row {}: invalid value {}.".format(
+                i, row['value']))
+        key = (row['creditor'], make_invoice_key(row['invoice_number']))
+        if key in lines:
+            value += lines[key].value
+        lines[key] = StatementLine(row['creditor'], row['invoice_number'],
+                                   value)
+    return lines
+
+
+def reconcile_statements(dump, as_of=None):
+    """ Returns dict, see module docstring. Creditors ordered by name. """
+    as_of = as_of or date.today()
+    lines = parse_statements(dump)
+    by_code = {}
+    for (code, invoice_key), line in sorted(lines.items()):
+        by_code.setdefault(code, []).append((invoice_key, line))
+    invoice_keys = {invoice_key for code, invoice_key in lines}
+
+    # Same normalisation as `make_invoice_key`, in the query.
+    invoices = CreditorInvoice.objects.annotate(
+        invoice_key=Upper(Trim('invoice_number'))).filter(
+        Q(unpaid__gt=0, transaction__date__lte=as_of) |
+        Q(invoice_key__in=list(invoice_keys))).select_related(
+        'transaction').order_by('transaction__date', 'pk')
+    creditors = Creditor.objects.filter(
+        entity__code__in=list(by_code)).select_related(
+        'entity').prefetch_related(
+        Prefetch('creditorinvoice_set', queryset=invoices)).order_by(
+        'entity__name', 'pk')
+
+    results, found = [], set()
+    for creditor in creditors:
+        code = creditor.entity.code
+        found.add(code)
+        result = {'creditor': creditor, 'matched': [], 'mismatched': [],
+                  'missing': [], 'not_on_statement': []}
+        by_key = {}
+        for invoice in creditor.creditorinvoice_set.all():
+            invoice_key = make_invoice_key(invoice.invoice_number)
+            if (code, invoice_key) in lines:
+                by_key[invoice_key] = invoice
+            elif invoice.unpaid > 0:
+                result['not_on_statement'].append(invoice)
+
+        for invoice_key, line in by_code[code]:
+            invoice = by_key.get(invoice_key)
+            if invoice is None:
+                result['missing'].append(line)
+            elif invoice.unpaid == line.value:
+                result['matched'].append((line, invoice))
+            else:
+                result['mismatched'].append((line, invoice))
+        results.append(result)
+
+    return {
+        'as_of': as_of,
+        'creditors': results,
+        'unknown': [line for code in sorted(set(by_code) - found)
+                    for invoice_key, line in by_code[code]],
+    }
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 import dateparser
+import io
+import os
+import shutil
+import tempfile
 from datetime import date, timedelta
 from decimal import Decimal
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
 from ledgers.utils import get_source
 
 
@@ -11,7 +17,15 @@ from entities.models import Entity
 from ledgers.bank_accounts.models import BankAccount
 from ledgers.models import Account, Transaction
 from subledgers import settings
+from subledgers.creditors.aged import aged_payables
+from subledgers.creditors.allocation import allocate_payments, unpaid_drift
 from subledgers.bank_reconciliations.models import BankLine, BankEntry
+from subledgers.creditors.matching import (OpenInvoice, find_subsets,
+                                           match_bank_lines)
+from subledgers.creditors.payment_run import (link_bank_entry, payment_run,
+                                              unlinked_payments)
+from subledgers.creditors.statements import (parse_statements,
+                                             reconcile_statements)
 from subledgers.creditors.models import (Creditor, CreditorInvoice,
                                          CreditorPayment,
                                          CreditorPaymentInvoice)
@@ -297,6 +311,93 @@ class TestCreditorPaymentMatchInvoiceMethod(TestCase):
             relation=self.creditor, invoice_number='2')
         self.assertEqual(i2.unpaid, Decimal('30.00'))
 
+    def test_match_invoices_exact_value(self):
+        """ Payment equal to an invoice's unpaid amount settles it """
+        self.p1.match_invoices(Decimal('100.00'))
+        i5 = CreditorInvoice.objects.get(
+            relation=self.creditor, invoice_number='5')
+        self.assertEqual(i5.unpaid, Decimal('0.00'))
+        self.assertEqual(self.p1.invoices_total(), Decimal('100.00'))
+
+    def test_allocate_payments_batched(self):
+        payments = CreditorPayment.objects.filter(
+            pk__in=[self.p1.pk, self.p2.pk]).select_related(
+            'bank_entry__transaction').order_by('pk')
+        # payments, savepoint, allocations, invoices, delete, insert + ids,
+        # update, release: however many invoices.
+        with self.assertNumQueries(9):
+            results = allocate_payments(payments)
+        self.assertEqual([len(results[self.p1.pk]), len(results[self.p2.pk])],
+                         [4, 1])
+        self.assertEqual(
+            list(CreditorInvoice.objects.order_by(
+                'invoice_number').values_list('unpaid', flat=True)),
+            [Decimal('100.00'), Decimal('30.00'), 0, 0, 0])
+
+        # again: allocations replaced, not added to.
+        allocate_payments(payments)
+        self.assertEqual(CreditorPaymentInvoice.objects.count(), 5)
+        self.assertEqual(CreditorInvoice.objects.get(
+            invoice_number='2').unpaid, Decimal('30.00'))
+
+    def test_allocation_save_delete_adjust_unpaid(self):
+        invoice = CreditorInvoice.objects.get(invoice_number='1')
+        allocation = CreditorPaymentInvoice(
+            payment=self.p1, invoice=invoice, value=Decimal('40.00'))
+        allocation.save()
+        self.assertEqual(invoice.unpaid, Decimal('60.00'))
+
+        allocation.value = Decimal('10.00')
+        allocation.save()
+        self.assertEqual(CreditorInvoice.objects.get(
+            pk=invoice.pk).unpaid, Decimal('90.00'))
+
+        allocation.delete()
+        self.assertEqual(CreditorInvoice.objects.get(
+            pk=invoice.pk).unpaid, Decimal('100.00'))
+
+    def test_stale_invoice_save_keeps_unpaid(self):
+        stale = CreditorInvoice.objects.get(invoice_number='1')
+        CreditorPaymentInvoice.objects.create(
+            payment=self.p1, invoice=CreditorInvoice.objects.get(
+                invoice_number='1'), value=Decimal('40.00'))
+        stale.due_date = date(2017, 7, 1)
+        stale.save()
+        invoice = CreditorInvoice.objects.get(pk=stale.pk)
+        self.assertEqual(invoice.unpaid, Decimal('60.00'))
+        self.assertEqual(invoice.due_date, date(2017, 7, 1))
+
+    def test_restart_one_update(self):
+        self.p1.match_invoices()
+        # savepoint, allocations, update, delete, release
+        with self.assertNumQueries(5):
+            self.p1.restart()
+        self.assertEqual(set(CreditorInvoice.objects.values_list(
+            'unpaid', flat=True)), {Decimal('100.00')})
+
+    def test_deleted_payment_restores_unpaid(self):
+        self.p1.match_invoices()
+        self.p1.bank_entry.delete()
+        self.assertEqual(set(CreditorInvoice.objects.values_list(
+            'unpaid', flat=True)), {Decimal('100.00')})
+
+    def test_rebuild_unpaid_balances(self):
+        self.p1.match_invoices()
+        self.assertEqual(list(unpaid_drift()), [])
+        invoice = CreditorInvoice.objects.get(invoice_number='2')
+        CreditorInvoice.objects.filter(pk=invoice.pk).update(unpaid=7)
+
+        out = io.StringIO()
+        call_command('rebuild_unpaid_balances', stdout=out)
+        self.assertIn("invoice {}: unpaid $7.00 should be $50.00".format(
+            invoice.pk), out.getvalue())
+        self.assertEqual(len(list(unpaid_drift())), 1)
+
+        call_command('rebuild_unpaid_balances', fix=True, stdout=out)
+        self.assertEqual(list(unpaid_drift()), [])
+        self.assertEqual(CreditorInvoice.objects.get(
+            pk=invoice.pk).unpaid, Decimal('50.00'))
+
 
 class TestCreditorInvoicesAgedMethod(TestCase):
 
@@ -324,19 +425,397 @@ class TestCreditorInvoicesAgedMethod(TestCase):
             trans_kwargs['account_DR'] = self.a1
             trans_kwargs['account_CR'] = self.a2
             trans_kwargs['date'] = date.today() - timedelta(days=(period + 10))
-            new_invoice = CreditorInvoice(
-                relation=self.creditor,
-                invoice_number=period
-            )
+            trans_kwargs.update({'relation': self.creditor, 'gst_total': 0,
+                                 'invoice_number': period})
+            new_invoice = CreditorInvoice()
             new_invoice.save_transaction(trans_kwargs)
 
         # Make additional record in last period
         trans_kwargs['account_DR'] = self.a1
         trans_kwargs['account_CR'] = self.a2
         trans_kwargs['date'] = date.today() - timedelta(days=(period + 10))
-        new_invoice = CreditorInvoice(
-            relation=self.creditor,
-            invoice_number=period
-        )
+        trans_kwargs['invoice_number'] = "{}a".format(period)
+        new_invoice = CreditorInvoice()
         new_invoice.save_transaction(trans_kwargs)
 
+    def test_invoices_aged(self):
+        aged = self.creditor.invoices_aged()
+        self.assertEqual(
+            aged, {'current': 0, '1-7': 0, '8-14': 0, '15-30': 2,
+                   '31-60': 1, '61-90': 1, '91-120': 1, '120+': 2})
+
+    def test_aged_payables_one_query(self):
+        for code in ['b', 'c', 'd']:
+            creditor = Creditor.objects.create(
+                entity=Entity.objects.create(code=code, name=code))
+            invoice = CreditorInvoice()
+            invoice.save_transaction({
+                'user': self.user, 'date': date.today() - timedelta(days=5),
+                'due_date': date.today(), 'account_DR': self.a1,
+                'account_CR': self.a2, 'value': 2, 'invoice_number': '1',
+                'relation': creditor, 'gst_total': 0})
+
+        with self.assertNumQueries(1):
+            aged = aged_payables()
+        self.assertEqual([row['code'] for row in aged['rows']],
+                         ['a', 'b', 'c', 'd'])
+        self.assertEqual(aged['rows'][1]['buckets'][0], Decimal('2.00'))
+        self.assertEqual(aged['totals'], [6, 0, 0, 2, 1, 1, 1, 2])
+        self.assertEqual(aged['total'], Decimal('13.00'))
+
+        # as at before any invoice was dated.
+        self.assertEqual(aged_payables(date(2000, 1, 1))['rows'], [])
+
+    def test_aged_payables_views(self):
+        url = reverse('creditors:aged-payables-json')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.user)
+        response = self.client.get(url).json()
+        self.assertEqual(response['buckets'][-1], '120+')
+        self.assertEqual(response['rows'][0]['total'], '7.00')
+
+        response = self.client.get(reverse('creditors:aged-payables'))
+        self.assertContains(response, '[a] a')
+
+
+class TestMatchBankLines(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(
+            element='01', number='0150', name='a1')
+        self.a2 = Account.objects.create(
+            element='01', number='0100', name='a2')
+        self.ba = BankAccount.objects.create(account=self.a1, bank='CBA')
+        self.c1 = Creditor.objects.create(
+            entity=Entity.objects.create(code='a', name='a'))
+        self.c2 = Creditor.objects.create(
+            entity=Entity.objects.create(code='b', name='b'))
+
+        self.invoices = {}
+        for creditor, number, value, day in [
+                (self.c1, 'a1', '100.00', 1),
+                (self.c1, 'a2', '50.00', 2),
+                (self.c1, 'a3', '25.50', 3),
+                (self.c2, 'b1', '75.50', 1),
+                (self.c2, 'b2', '100.00', 20)]:
+            invoice = CreditorInvoice()
+            invoice.save_transaction({
+                'user': self.user,
+                'date': date(2017, 6, day),
+                'due_date': date(2017, 6, day) + timedelta(days=14),
+                'account_DR': self.a1,
+                'account_CR': self.a2,
+                'value': Decimal(value),
+                'invoice_number': number,
+                'relation': creditor,
+                'gst_total': 0})
+            self.invoices[number] = invoice.pk
+
+    def make_line(self, line_date, value):
+        return BankLine.objects.create(
+            bank_account=self.ba, date=line_date, value=Decimal(value),
+            line_dump='PAYMENT', description='PAYMENT')
+
+    def test_exact_amount_in_window(self):
+        line = self.make_line(date(2017, 6, 15), '-100.00')
+        matches = match_bank_lines()[line.pk]
+        # b2 invoice dated after payment.
+        self.assertEqual([match.invoices for match in matches],
+                         [(self.invoices['a1'],)])
+        self.assertEqual(matches[0].creditor, self.c1.pk)
+        self.assertEqual(matches[0].score, 1.0)
+
+        line = self.make_line(date(2017, 8, 30), '-100.00')
+        self.assertNotIn(line.pk, match_bank_lines(window=30))
+
+    def test_combinations(self):
+        line = self.make_line(date(2017, 6, 19), '-175.50')
+        matches = match_bank_lines()[line.pk]
+        self.assertEqual(
+            [sorted(match.invoices) for match in matches],
+            [sorted([self.invoices['a1'], self.invoices['a2'],
+                     self.invoices['a3']])])
+        self.assertEqual(matches[0].creditor, self.c1.pk)
+
+        # invoices of different creditors are never combined.
+        line = self.make_line(date(2017, 6, 19), '-125.50')
+        self.assertEqual(
+            [match.invoices for match in match_bank_lines()[line.pk]],
+            [(self.invoices['a3'], self.invoices['a1'])])
+
+    def test_ranked_and_bounded(self):
+        line = self.make_line(date(2017, 6, 21), '-100.00')
+        matches = match_bank_lines()[line.pk]
+        # closest to due date first.
+        self.assertEqual([match.invoices for match in matches],
+                         [(self.invoices['a1'],), (self.invoices['b2'],)])
+        self.assertGreater(matches[0].score, matches[1].score)
+
+        line = self.make_line(date(2017, 6, 19), '-175.50')
+        self.assertNotIn(line.pk, match_bank_lines(max_invoices=2))
+
+    def test_one_pass_queries(self):
+        for i in range(5):
+            self.make_line(date(2017, 6, 15 + i), '-100.00')
+        self.make_line(date(2017, 6, 15), '100.00')
+        with self.assertNumQueries(2):
+            self.assertEqual(len(match_bank_lines()), 5)
+
+    def test_combinations_long_terms(self):
+        """ Invoices are narrowed by date, allowing for the longest terms """
+        invoices = sorted([
+            OpenInvoice(1000, date(2017, 1, 1), 1, 1, date(2017, 6, 30)),
+            OpenInvoice(500, date(2017, 6, 1), 2, 1, date(2017, 6, 15)),
+            OpenInvoice(500, date(2017, 3, 1), 3, 1, date(2017, 3, 15)),
+            OpenInvoice(1000, date(2017, 6, 25), 4, 1, date(2017, 7, 9))])
+        line = self.make_line(date(2017, 6, 20), '-15.00')
+        self.assertEqual(
+            [match.invoices for match in match_bank_lines(
+                [line], invoices, window=30)[line.pk]],
+            [(2, 1)])
+
+    def test_find_subsets(self):
+        class Item(object):
+            def __init__(self, cents):
+                self.cents = cents
+        items = [Item(x) for x in [1, 2, 3, 4, 5]]
+        self.assertEqual(
+            sorted([item.cents for item in subset]
+                   for subset in find_subsets(items, 6, 3)),
+            [[1, 2, 3], [1, 5], [2, 4]])
+
+
+class TestPaymentRun(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(
+            element='01', number='0150', name='a1')
+        self.a2 = Account.objects.create(
+            element='01', number='0100', name='a2')
+        self.ba = BankAccount.objects.create(
+            account=self.a1, bank='CBA', bsb='062-000',
+            account_number=12345678)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.creditors = []
+        for code, bsb in [('a', '062-001'), ('b', '063002'), ('c', '')]:
+            self.creditors.append(Creditor.objects.create(
+                entity=Entity.objects.create(code=code, name=code.upper()),
+                bsb=bsb, account_number='987654', account_name=''))
+
+        for creditor, number, value, due in [
+                (self.creditors[0], 'a1', '100.00', date(2017, 6, 14)),
+                (self.creditors[0], 'a2', '50.25', date(2017, 6, 30)),
+                (self.creditors[0], 'a3', '10.00', date(2017, 7, 14)),
+                (self.creditors[1], 'b1', '75.50', date(2017, 6, 1)),
+                (self.creditors[2], 'c1', '20.00', date(2017, 6, 1))]:
+            invoice = CreditorInvoice()
+            invoice.save_transaction({
+                'user': self.user, 'date': due - timedelta(days=14),
+                'due_date': due, 'account_DR': self.a1,
+                'account_CR': self.a2, 'value': Decimal(value),
+                'invoice_number': number, 'relation': creditor,
+                'gst_total': 0})
+
+    def run_payments(self):
+        return payment_run(self.user, date(2017, 6, 30), self.ba,
+                           process_date=date(2017, 7, 1),
+                           directory=self.directory)
+
+    def test_payment_run(self):
+        results = self.run_payments()
+        self.assertEqual(results['total'], Decimal('225.75'))
+        self.assertEqual(results['skipped'], [self.creditors[2]])
+        self.assertEqual(
+            [(payment.relation, payment.invoices_total())
+             for payment in results['payments']],
+            [(self.creditors[0], Decimal('150.25')),
+             (self.creditors[1], Decimal('75.50'))])
+        self.assertEqual(
+            dict(CreditorInvoice.objects.values_list(
+                'invoice_number', 'unpaid')),
+            {'a1': 0, 'a2': 0, 'a3': Decimal('10.00'), 'b1': 0,
+             'c1': Decimal('20.00')})
+        self.assertEqual(list(unpaid_drift()), [])
+
+        # nothing left to pay
+        self.assertEqual(self.run_payments()['path'], None)
+
+    def test_payments_without_bank_entry(self):
+        payment = self.run_payments()['payments'][0]
+        self.assertEqual(str(payment),
+                         "[a] A -- Payment run 2017-06-30 -- no bank entry")
+        # value: its allocations total.
+        self.assertEqual(len(payment.match_invoices()), 2)
+        self.assertEqual(payment.invoices_total(), Decimal('150.25'))
+        self.assertEqual(list(unpaid_drift()), [])
+
+    def test_link_bank_entry(self):
+        self.run_payments()
+        payment, other = unlinked_payments()
+        self.assertEqual((payment.total, other.total),
+                         (Decimal('150.25'), Decimal('75.50')))
+
+        bank_line = BankLine.objects.create(
+            bank_account=self.ba, date=date(2017, 7, 2),
+            value=Decimal('-150.25'), line_dump='A', description='A')
+        bank_entry = BankEntry(bank_line=bank_line, subledger='creditors')
+        bank_entry.save_transaction({
+            'user': self.user, 'date': bank_line.date,
+            'source': 'subledgers.bank_reconciliations.models.BankEntry',
+            'value': bank_line.value, 'account_DR': self.a2,
+            'account_CR': self.a1})
+        with self.assertRaises(Exception):
+            link_bank_entry(other, bank_entry)
+        link_bank_entry(payment, bank_entry)
+        self.assertEqual(list(unlinked_payments()), [other])
+        self.assertIn("$150.25", str(CreditorPayment.objects.get(
+            pk=payment.pk)))
+
+    def test_no_due_date_due_on_invoice_date(self):
+        CreditorInvoice.objects.filter(invoice_number__in=['a3', 'b1']).update(
+            due_date=None)
+        self.run_payments()
+        # a3 dated 30/6 is paid, b1 dated 18/5 still is.
+        self.assertEqual(
+            dict(CreditorInvoice.objects.filter(
+                relation__in=self.creditors[:2]).values_list(
+                'invoice_number', 'unpaid')),
+            {'a1': 0, 'a2': 0, 'a3': 0, 'b1': 0})
+
+    def test_aba_file(self):
+        path = self.run_payments()['path']
+        with open(path, 'rb') as aba_file:
+            lines = aba_file.read().decode('ascii').split("\r\n")
+        self.assertEqual(lines[-1], "")
+        lines = lines[:-1]
+        self.assertEqual([len(line) for line in lines], [120] * 4)
+        self.assertEqual([line[0] for line in lines], ['0', '1', '1', '7'])
+        self.assertEqual(lines[0][74:80], '010717')
+        self.assertEqual(lines[1][1:30], '062-001   987654 500000015025')
+        self.assertEqual(lines[1][30:62].rstrip(), 'A')
+        self.assertEqual(lines[1][62:80].rstrip(), 'A1, A2')
+        self.assertEqual(lines[1][80:96], '062-000 12345678')
+        self.assertEqual(lines[2][1:8], '063-002')
+        self.assertEqual(lines[3][20:50], '0000022575' '0000022575'
+                                          '0000000000')
+        self.assertEqual(lines[3][74:80], '000002')
+
+    def test_query_count_constant(self):
+        for x in range(20):
+            invoice = CreditorInvoice()
+            invoice.save_transaction({
+                'user': self.user, 'date': date(2017, 6, 1),
+                'due_date': date(2017, 6, 2), 'account_DR': self.a1,
+                'account_CR': self.a2, 'value': Decimal('1.00'),
+                'invoice_number': 'x{}'.format(x),
+                'relation': self.creditors[x % 2], 'gst_total': 0})
+        # savepoint, invoices, creditors, payments + ids, allocations,
+        # unpaid, release
+        with self.assertNumQueries(8):
+            results = self.run_payments()
+        self.assertEqual(len(results['payments']), 2)
+
+
+class TestSupplierStatements(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.a1 = Account.objects.create(
+            element='01', number='0150', name='a1')
+        self.a2 = Account.objects.create(
+            element='01', number='0100', name='a2')
+        self.c1 = Creditor.objects.create(
+            entity=Entity.objects.create(code='ACME', name='Acme'))
+        self.c2 = Creditor.objects.create(
+            entity=Entity.objects.create(code='BOLTS', name='Bolts'))
+
+        self.invoices = {}
+        for creditor, number, value, day in [
+                (self.c1, '1001', '110.00', 1),
+                (self.c1, '1002', '55.00', 2),
+                (self.c1, '1003', '10.00', 3),
+                (self.c1, '1004', '99.00', 25),
+                (self.c2, 'a-77', '20.00', 4)]:
+            invoice = CreditorInvoice()
+            invoice.save_transaction({
+                'user': self.user, 'date': date(2017, 6, day),
+                'account_DR': self.a1, 'account_CR': self.a2,
+                'value': Decimal(value), 'invoice_number': number,
+                'relation': creditor, 'gst_total': 0})
+            self.invoices[number] = invoice
+
+        self.dump = "\r\n".join([
+            "Creditor\tInvoice_Number\tValue",
+            "ACME\t1001\t110.00",
+            "ACME\t1002\t50.00",
+            "ACME\t1002\t5.00",
+            "ACME\t1009\t30.00",
+            "BOLTS\tA-77\t$20.00",
+            "NOBODY\t1\t1.00",
+        ])
+
+    def test_reconcile_statements(self):
+        with self.assertNumQueries(2):
+            results = reconcile_statements(self.dump, date(2017, 6, 20))
+        acme, bolts = results['creditors']
+        self.assertEqual(acme['creditor'], self.c1)
+        self.assertEqual(
+            [line.invoice_number for line, invoice in acme['matched']],
+            ['1001', '1002'])
+        self.assertEqual([line.invoice_number for line in acme['missing']],
+                         ['1009'])
+        # 1004 dated after the statement.
+        self.assertEqual(acme['not_on_statement'], [self.invoices['1003']])
+        self.assertEqual(len(bolts['matched']), 1)
+        self.assertEqual([line.creditor for line in results['unknown']],
+                         ['NOBODY'])
+
+    def test_mismatched_paid_invoice(self):
+        CreditorInvoice.objects.filter(
+            pk=self.invoices['1001'].pk).update(unpaid=0)
+        acme = reconcile_statements(self.dump,
+                                    date(2017, 6, 30))['creditors'][0]
+        (line, invoice), = acme['mismatched']
+        self.assertEqual((line.value, invoice.unpaid),
+                         (Decimal('110.00'), Decimal('0.00')))
+        self.assertEqual(acme['not_on_statement'],
+                         [self.invoices['1003'], self.invoices['1004']])
+
+    def test_mismatched_paid_invoice_case(self):
+        """ Paid `a-77`, not loaded as open, matched to `A-77` """
+        CreditorInvoice.objects.filter(
+            pk=self.invoices['a-77'].pk).update(unpaid=0)
+        bolts = reconcile_statements(self.dump,
+                                     date(2017, 6, 30))['creditors'][1]
+        self.assertEqual(bolts['missing'], [])
+        (line, invoice), = bolts['mismatched']
+        self.assertEqual((line.invoice_number, invoice),
+                         ('A-77', self.invoices['a-77']))
+
+    def test_invalid_rows(self):
+        with self.assertRaises(Exception):
+            parse_statements("creditor\tinvoice_number\tvalue\r\nACME\t1")
+        with self.assertRaises(Exception):
+            parse_statements("creditor\tinvoice_number\tvalue\r\n"
+                             "ACME\t1\tabc")
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'statements.tsv')
+        with open(path, 'w') as statement_file:
+            statement_file.write(self.dump)
+        out = io.StringIO()
+        call_command('reconcile_supplier_statements', path,
+                     date=date(2017, 6, 20), stdout=out)
+        self.assertIn("ACME 1009: statement $30.00 no invoice",
+                      out.getvalue())
+        self.assertIn("2 creditors, 2 differences, 1 lines",
+                      out.getvalue())
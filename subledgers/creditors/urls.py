@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from django.urls import path
+
+from . import views
+
+
+app_name = 'creditors'
+
+urlpatterns = [
+
+    # Aged payables report
+    path('aged/',
+         views.aged_payables_report,
+         name='aged-payables'),
+
+    # Aged payables (JSON)
+    path('aged/json/',
+         views.aged_payables_json,
+         name='aged-payables-json'),
+]
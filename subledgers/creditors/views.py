@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from django.http import JsonResponse
+from django.shortcuts import render
+
+from subledgers.bank_reconciliations.views import get_date_param
+from .aged import aged_payables
+
+
+def aged_payables_report(request):
+    """ Aged payables for every creditor as at `?date=` (default today). """
+    template_name = 'subledgers/creditors/aged_payables.html'
+    context_data = aged_payables(get_date_param(request, 'date', date.today()))
+    return render(request, template_name, context_data)
+
+
+def aged_payables_json(request):
+    """ JSON of `aged_payables_report`. """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Not logged in."}, status=403)
+    return JsonResponse(
+        aged_payables(get_date_param(request, 'date', date.today())))
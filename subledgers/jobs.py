@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+""" Background processing of `ImportJob`.
+
+Upload views only create the job:
+
+    ImportJob.objects.create(user=user, input_data=dump, ...)
+
+and a worker processes them:
+
+    ./manage.py run_import_jobs          # keep polling for jobs
+    ./manage.py run_import_jobs --once   # process queued jobs then exit
+
+Several workers can be run, a job is only ever claimed by one of them.
+
+A job whose worker died (no progress for `IMPORT_JOB_TIMEOUT` seconds) is
+marked failed before the next job is claimed. It isn't run again: rows of
+chunks already committed (`posted`) stay posted.
+"""
+import json
+from datetime import timedelta
+
+from django.utils import timezone
+
+from ledgers.registry import chart_of_accounts
+from subledgers.bank_reconciliations.categoriser import categoriser
+from subledgers.bank_reconciliations.utils import import_bank_statement
+from subledgers.models import ImportJob
+from subledgers.settings import IMPORT_JOB_TIMEOUT
+from subledgers.utils import ImportProgress, convert_import_to_objects
+
+
+def fail_stale_jobs(timeout=None):
+    """ Marks running jobs without progress for `timeout` seconds (default
+    `IMPORT_JOB_TIMEOUT`) failed. Returns number of jobs failed. """
+    timeout = IMPORT_JOB_TIMEOUT if timeout is None else timeout
+    now = timezone.now()
+    count = 0
+    for job in ImportJob.objects.filter(
+            status=ImportJob.RUNNING,
+            heartbeat_at__lt=now - timedelta(seconds=timeout)):
+        errors = job.get_errors() + [[None, None, (
+            "Worker stopped, no progress since {:%Y-%m-%d %H:%M:%S}, "
+            "{} rows posted.").format(job.heartbeat_at, job.posted)]]
+        count += ImportJob.objects.filter(
+            pk=job.pk, status=ImportJob.RUNNING,
+            heartbeat_at=job.heartbeat_at).update(
+            status=ImportJob.FAILED, finished_at=now,
+            errors=json.dumps(errors))
+    return count
+
+
+def claim_next_job():
+    """ Returns the oldest queued `ImportJob` now marked running, or None.
+
+    Claimed with a conditional update, so two workers can't both run it.
+    """
+    fail_stale_jobs()
+    now = timezone.now()
+    for pk in ImportJob.objects.filter(
+            status=ImportJob.QUEUED).values_list('pk', flat=True)[:10]:
+        claimed = ImportJob.objects.filter(
+            pk=pk, status=ImportJob.QUEUED).update(
+            status=ImportJob.RUNNING, started_at=now, heartbeat_at=now)
+        if claimed:
+            return ImportJob.objects.get(pk=pk)
+    return None
+
+
+def save_progress(job, progress, **kwargs):
+    """ Writes `ImportProgress` counts (and any other `kwargs`) to `job`. """
+    kwargs.update({
+        'parsed': progress.parsed,
+        'validated': progress.validated,
+        'posted': progress.posted,
+        'errors': json.dumps(progress.errors),
+        'heartbeat_at': timezone.now(),
+    })
+    ImportJob.objects.filter(pk=job.pk).update(**kwargs)
+    for key, value in kwargs.items():
+        setattr(job, key, value)
+
+
+def import_job_statement(job):
+    """ Bank statement from the uploaded file (streamed) or pasted text. """
+    data = {'bank': job.bank_account_id, 'format': job.input_format}
+    if not job.input_file:
+        data['input_data'] = job.input_data
+        return import_bank_statement(data)
+    with job.input_file.open('rb') as statement_file:
+        data['input_data'] = statement_file
+        return import_bank_statement(data)
+
+
+def run_job(job):
+    """ Processes a claimed `ImportJob`, recording progress as it goes. """
+    # Accounts and learnings saved by other processes (eg. the web server)
+    # don't signal this one: reload them for every job.
+    chart_of_accounts.invalidate()
+    categoriser.invalidate()
+
+    progress = ImportProgress(
+        callback=lambda progress: save_progress(job, progress))
+    status = ImportJob.DONE
+
+    try:
+        if job.kind == ImportJob.BANK_STATEMENT:
+            results = import_job_statement(job)
+            progress.parsed = progress.validated = \
+                results['inserted'] + results['skipped']
+            progress.posted = results['inserted']
+        else:
+            results = convert_import_to_objects(
+                job.input_data, job.user,
+                object_name=job.object_name or None,
+                live=job.live,
+                all_or_nothing=job.all_or_nothing,
+                progress=progress)
+            if not job.live:
+                save_progress(job, progress, results=json.dumps(
+                    [str(result) for result in results]))
+    except Exception as e:
+        status = ImportJob.FAILED
+        progress.errors.append((None, None, str(e)))
+
+    if progress.errors:
+        status = ImportJob.FAILED
+
+    save_progress(job, progress, status=status, finished_at=timezone.now())
+    return job
+
+
+def run_pending_jobs():
+    """ Runs queued jobs until there are none left. Returns number run. """
+    count = 0
+    job = claim_next_job()
+    while job is not None:
+        run_job(job)
+        count += 1
+        job = claim_next_job()
+    return count
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from subledgers.creditors.matching import match_bank_lines
+from subledgers.settings import MATCH_DATE_WINDOW, MATCH_MAX_INVOICES
+
+
+class Command(BaseCommand):
+    help = "List candidate creditor invoice matches for unreconciled " \
+           "bank line debits, best first."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', type=int, default=MATCH_DATE_WINDOW,
+            help="Days after due date a payment is still matched.")
+        parser.add_argument(
+            '--max-invoices', type=int, default=MATCH_MAX_INVOICES,
+            help="Most invoices one payment can be matched to.")
+        parser.add_argument(
+            '--top', type=int, default=3,
+            help="Candidates listed per bank line.")
+
+    def handle(self, *args, **options):
+        results = match_bank_lines(window=options['window'],
+                                   max_invoices=options['max_invoices'])
+        for pk, matches in sorted(results.items()):
+            for match in matches[:options['top']]:
+                self.stdout.write(
+                    "bank line {}: ${} creditor {} invoices {} "
+                    "score {}".format(
+                        pk, match.value, match.creditor,
+                        ", ".join(str(x) for x in match.invoices),
+                        match.score))
+        self.stdout.write("{} bank lines with candidates.".format(
+            len(results)))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from ledgers.bank_accounts.models import BankAccount
+from subledgers.bank_reconciliations.pagination import parse_iso_date
+from subledgers.creditors.payment_run import payment_run
+
+
+class Command(BaseCommand):
+    help = "Create payments for every creditor invoice due by a date, and " \
+           "write the ABA file to upload to the bank."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'bank_account', type=int,
+            help="`BankAccount` pk payments are made from.")
+        parser.add_argument(
+            'username',
+            help="User the payments are created by.")
+        parser.add_argument(
+            '--cutoff', type=parse_iso_date, default=None,
+            help="Pay invoices due by this date (default today).")
+        parser.add_argument(
+            '--directory', default=None,
+            help="Directory the ABA file is written to.")
+
+    def handle(self, *args, **options):
+        results = payment_run(
+            get_user_model().objects.get(username=options['username']),
+            options['cutoff'] or date.today(),
+            BankAccount.objects.select_related('account').get(
+                pk=options['bank_account']),
+            directory=options['directory'])
+        for creditor in results['skipped']:
+            self.stdout.write("skipped {}: no valid bank details.".format(
+                creditor))
+        self.stdout.write("{} payments, ${} total. {}".format(
+            len(results['payments']), results['total'],
+            results['path'] or "Nothing to pay."))
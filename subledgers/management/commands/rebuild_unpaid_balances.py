@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from subledgers.creditors.allocation import unpaid_drift, update_unpaid
+
+
+class Command(BaseCommand):
+    help = "Report creditor invoices whose unpaid balance doesn't agree " \
+           "with their allocations, and optionally fix them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true', default=False,
+            help="Set unpaid balances to invoice value less allocations.")
+
+    def handle(self, *args, **options):
+        drift = list(unpaid_drift())
+        for pk, unpaid, expected in drift:
+            self.stdout.write("invoice {}: unpaid ${} should be ${}".format(
+                pk, unpaid, expected))
+        if options['fix'] and drift:
+            update_unpaid({pk: expected - unpaid
+                           for pk, unpaid, expected in drift})
+            self.stdout.write("{} invoices fixed.".format(len(drift)))
+        else:
+            self.stdout.write("{} invoices differ.".format(len(drift)))
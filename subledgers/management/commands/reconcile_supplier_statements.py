@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from subledgers.bank_reconciliations.pagination import parse_iso_date
+from subledgers.creditors.statements import reconcile_statements
+
+
+class Command(BaseCommand):
+    help = "Reconcile supplier statements (tab separated: creditor, " \
+           "invoice_number, value) against creditor invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'statement_file',
+            help="Statement lines of any number of creditors.")
+        parser.add_argument(
+            '--date', type=parse_iso_date, default=None,
+            help="Statement date (default today).")
+
+    def handle(self, *args, **options):
+        with open(options['statement_file'], encoding='utf-8-sig') as dump:
+            results = reconcile_statements(dump, options['date'] or
+                                           date.today())
+
+        differences = 0
+        for result in results['creditors']:
+            code = result['creditor'].entity.code
+            for line, invoice in result['mismatched']:
+                self.stdout.write("{} {}: statement ${} unpaid ${}".format(
+                    code, line.invoice_number, line.value, invoice.unpaid))
+            for line in result['missing']:
+                self.stdout.write("{} {}: statement ${} no invoice".format(
+                    code, line.invoice_number, line.value))
+            for invoice in result['not_on_statement']:
+                self.stdout.write("{} {}: unpaid ${} not on statement".format(
+                    code, invoice.invoice_number, invoice.unpaid))
+            differences += len(result['mismatched']) + \
+                len(result['missing']) + len(result['not_on_statement'])
+        for line in results['unknown']:
+            self.stdout.write("{} {}: unknown creditor".format(
+                line.creditor, line.invoice_number))
+
+        self.stdout.write("{} creditors, {} differences, {} lines of "
+                          "unknown creditors.".format(
+                              len(results['creditors']), differences,
+                              len(results['unknown'])))
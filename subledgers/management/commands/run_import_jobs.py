@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+
+from subledgers import jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued `ImportJob` uploads in the background."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', default=False,
+            help="Process queued jobs then exit, rather than keep polling.")
+        parser.add_argument(
+            '--sleep', type=float, default=2,
+            help="Seconds to wait between polls when there are no jobs.")
+
+    def handle(self, *args, **options):
+        while True:
+            job = jobs.claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            jobs.run_job(job)
+            self.stdout.write("{}: {} posted, {} errors.".format(
+                job, job.posted, len(job.get_errors())))
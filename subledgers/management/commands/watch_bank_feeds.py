@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+
+from ledgers.registry import chart_of_accounts
+from subledgers.bank_reconciliations import feeds
+
+
+class Command(BaseCommand):
+    help = "Import new statement files/lines from `BankFeed` directories."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', default=False,
+            help="Import anything new then exit, rather than keep polling.")
+        parser.add_argument(
+            '--sleep', type=float, default=30,
+            help="Seconds to wait between polls.")
+
+    def handle(self, *args, **options):
+        while True:
+            # Accounts may have been changed by other processes.
+            chart_of_accounts.invalidate()
+            for feed, checkpoints in feeds.scan_feeds().items():
+                for checkpoint in checkpoints:
+                    if checkpoint.error:
+                        self.stderr.write("{}: {}".format(
+                            checkpoint, checkpoint.error))
+                        continue
+                    self.stdout.write(
+                        "{}: {} bytes read, {} inserted, {} skipped.".format(
+                            checkpoint, checkpoint.offset,
+                            checkpoint.inserted, checkpoint.skipped))
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
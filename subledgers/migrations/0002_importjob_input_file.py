@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subledgers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='input_file',
+            field=models.FileField(blank=True, upload_to='imports/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='input_format',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='input_data',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subledgers', '0002_importjob_input_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='results',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='all_or_nothing',
+            field=models.BooleanField(default=True),
+        ),
+    ]
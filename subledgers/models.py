@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import json
+from collections import namedtuple
 from django.db import models
 from django.utils.module_loading import import_string
 from decimal import Decimal
@@ -7,6 +9,7 @@ from importlib import import_module
 from entities.models import Entity
 from ledgers import utils
 from ledgers.models import Account, Transaction
+from ledgers.registry import chart_of_accounts
 from subledgers import settings
 
 
@@ -20,6 +23,31 @@ from subledgers import settings
 # ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
 
 
+""" Which import keys go where, for each `Entry` subclass.
+
+`make_dicts` used to check every attribute in `dir(Transaction)` and
+`dir(type(self))` for every row. The plan is built once per class from
+`_meta`, so splitting a row is a dict projection.
+"""
+FieldPlan = namedtuple('FieldPlan', [
+    'transaction_keys', 'object_keys',
+    'date_keys', 'decimal_keys', 'relation_keys'])
+
+_field_plans = {}
+
+
+def get_model_keys(model):
+    """ Field names (and `_id` attnames) of `model`, from `_meta`. """
+    keys = set(['pk'])
+    for field in model._meta.get_fields():
+        keys.add(field.name)
+        if getattr(field, 'attname', None):
+            keys.add(field.attname)
+        if field.auto_created and not field.concrete:
+            keys.add(field.get_accessor_name())
+    return frozenset(keys)
+
+
 class Entry(models.Model):
 
     # *** ABSTRACT CLASS ***
@@ -109,7 +137,18 @@ class Entry(models.Model):
         new_creditorinvoice = CreditorInvoice()
         new_creditorinvoice.save_transaction(kwargs)
         """
-        lines, trans_kwargs, obj_kwargs = self.make_dicts(kwargs)
+        return self.save_dicts(kwargs, self.make_dicts(kwargs), live=live)
+
+    def save_dicts(self, kwargs, dicts, live=True, raise_errors=False):
+        """ As per `.save_transaction`, with `dicts` already made using
+        `.make_dicts(kwargs)`, so imports validate each row only once.
+
+        `raise_errors` re-raises instead of returning an error message, for
+        use inside an atomic block (eg. `deferred_balancing()`) which will
+        roll back the `Transaction` itself.
+        """
+        lines, trans_kwargs, obj_kwargs = dicts
+        obj_kwargs = dict(obj_kwargs)
 
         if 'relation' in obj_kwargs:
             relation = obj_kwargs.pop('relation')
@@ -132,20 +171,41 @@ class Entry(models.Model):
                 self.save(force_insert=True)
                 return self
             else:
+                # Unsaved, so the preview can be displayed.
+                self.transaction = self_transaction
                 print("Pass!: {}: {}".format(self, obj_kwargs))
                 return kwargs
         except Exception as e:
+            if raise_errors:
+                raise
             print("Error {}. Keys provided: {}".format(e, ", ".join(
                 obj_kwargs)))
             try:
                 # Delete transaction if created so not to pollute.
                 # @@ TODO save signals
-                self_transaction.delete()
+                if self_transaction.pk:
+                    self_transaction.delete()
             except NameError:
                 pass
 
             return "Error {}: {}".format(e, ", ".join(kwargs))
 
+    @classmethod
+    def get_field_plan(cls):
+        """ Returns the `FieldPlan` for cls, built on first use. """
+        try:
+            return _field_plans[cls]
+        except KeyError:
+            pass
+        plan = FieldPlan(
+            transaction_keys=get_model_keys(Transaction) - set(['lines']),
+            object_keys=get_model_keys(cls),
+            date_keys=frozenset(settings.FIELD_IS_DATE),
+            decimal_keys=frozenset(settings.FIELD_IS_DECIMAL),
+            relation_keys=frozenset(settings.FIELD_IS_RELATION))
+        _field_plans[cls] = plan
+        return plan
+
     def get_object_settings(self):
         return settings.OBJECT_SETTINGS[utils.get_source_name(self)]
 
@@ -192,17 +252,13 @@ class Entry(models.Model):
         # Convert kwargs to dictionaries to create objects.
 
         kwargs = self.process_kwargs(input_kwargs)
-        trans_kwargs, obj_kwargs = {}, {}
+        plan = self.get_field_plan()
 
-        # cherry-pick transaction kwargs from dir
-        for attr in dir(Transaction):
-            if kwargs.get(attr) and not attr == 'lines':
-                trans_kwargs[attr] = kwargs.get(attr)
-
-        # cherry-pick obj kwargs from dir
-        for attr in dir(type(self)):
-            if kwargs.get(attr):
-                obj_kwargs[attr] = kwargs.get(attr)
+        # cherry-pick transaction/obj kwargs as per field plan
+        trans_kwargs = {key: value for key, value in kwargs.items()
+                        if value and key in plan.transaction_keys}
+        obj_kwargs = {key: value for key, value in kwargs.items()
+                      if value and key in plan.object_keys}
 
         # @@TODO Should make_lines go here or in self.process_kwargs?
         lines = self.make_lines(kwargs)
@@ -222,8 +278,10 @@ class Entry(models.Model):
         # Basically check all required fields exist in kwargs.
         required_fields = self.get_required()
 
+        relation_keys = self.get_field_plan().relation_keys
+
         for key, value in kwargs.items():
-            if key in settings.FIELD_IS_RELATION:
+            if key in relation_keys:
                 try:
                     required_fields.remove('relation')
                 except KeyError:
@@ -260,9 +318,10 @@ class Entry(models.Model):
              append `row_dict` set to `list_kwargs`
         """
 
-        # Generate list of codes to check against.
+        # Set of codes to check against, from the in-memory CofA.
         # Cheaper than checking db for every account.
-        ACCOUNT_CODE_LIST = Account.get_account_code_list()
+        ACCOUNT_CODES = chart_of_accounts.codes()
+        plan = self.get_field_plan()
 
         process_kwargs = {k.lower(): v for k, v in kwargs.items()}
 
@@ -270,13 +329,13 @@ class Entry(models.Model):
         process_kwargs['source'] = utils.get_source(self)
 
         for key in kwargs:
-            if key in settings.FIELD_IS_DATE:
+            if key in plan.date_keys:
                 process_kwargs[key] = utils.make_date(kwargs[key])
 
-            if key in settings.FIELD_IS_DECIMAL:
+            if key in plan.decimal_keys:
                 process_kwargs[key] = utils.make_decimal(kwargs[key])
 
-            if key in settings.FIELD_IS_RELATION:
+            if key in plan.relation_keys:
                 # Relation names are not always consistently used.
                 # eg. Creditor, Relation
                 if kwargs[key] is None:
@@ -286,9 +345,10 @@ class Entry(models.Model):
                 else:
                     process_kwargs['relation'] = self.get_relation(kwargs[key])
 
-            if key in ACCOUNT_CODE_LIST:
-                process_kwargs.setdefault(
-                    'accounts', []).append((key, kwargs[key]))
+            if key in ACCOUNT_CODES:
+                # Parsed once here, reused when making lines.
+                process_kwargs.setdefault('accounts', []).append(
+                    (key, utils.make_decimal(kwargs[key])))
 
         self.check_required(process_kwargs)
 
@@ -396,8 +456,7 @@ class Entry(models.Model):
 
     def process_account(self, account, val):
         """ If only account is provided, retrieve tb account. """
-        return [(Account.get_account(account),
-                 utils.set_DR(utils.make_decimal(val)))]
+        return [(Account.get_account(account), utils.set_DR(val))]
 
     def process_accounts(self, accounts):
         lines = []
@@ -407,10 +466,9 @@ class Entry(models.Model):
         return lines
 
     def process_line(self, account_DR, account_CR, val):
-        return [(Account.get_account(account_DR),
-                 utils.set_DR(utils.make_decimal(val))),
-                (Account.get_account(account_CR),
-                 utils.set_CR(utils.make_decimal(val)))]
+        val = utils.make_decimal(val)
+        return [(Account.get_account(account_DR), utils.set_DR(val)),
+                (Account.get_account(account_CR), utils.set_CR(val))]
 
     def process_lines_tax(self, kwargs, lines, local=None):
         # Process tax BEFORE set_lines_sign
@@ -578,3 +636,120 @@ class Relation(models.Model):
 
     class Meta:
         abstract = True
+
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+# Import Jobs
+#
+# Large uploads are processed in the background, see `subledgers.jobs`.
+
+# ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
+
+
+class ImportJob(models.Model):
+
+    """ An upload (subledger import or bank statement) waiting for, or
+    processed by, `./manage.py run_import_jobs`.
+
+    Upload views create the job and return immediately, progress is polled
+    from `subledgers:import-job-progress`.
+
+    Jobs commit `IMPORT_CHUNK_SIZE` rows at a time so progress is visible
+    while running. If `all_or_nothing` and a chunk fails, the chunks already
+    posted are removed again (see `convert_import_to_objects`).
+    """
+
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    SUBLEDGERS, BANK_STATEMENT = 'subledgers', 'bank_statement'
+
+    KINDS = [
+        (SUBLEDGERS, 'Subledgers upload'),
+        (BANK_STATEMENT, 'Bank statement'),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KINDS, default=SUBLEDGERS)
+
+    status = models.CharField(max_length=8, choices=STATUSES, default=QUEUED,
+                              db_index=True)
+
+    # Bank statements may be uploaded anonymously, subledgers may not.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, models.PROTECT,
+                             blank=True, null=True)
+
+    object_name = models.CharField(max_length=64, blank=True, default="")
+
+    bank_account = models.ForeignKey('bank_accounts.BankAccount',
+                                     models.CASCADE, blank=True, null=True)
+
+    live = models.BooleanField(default=True)
+
+    all_or_nothing = models.BooleanField(default=True)
+
+    input_data = models.TextField(blank=True, default="")
+
+    # Bank statement files are streamed from here rather than `input_data`.
+    input_file = models.FileField(upload_to='imports/%Y/%m/', blank=True)
+
+    # See `bank_reconciliations.parsers.FORMATS`
+    input_format = models.CharField(max_length=8, blank=True, default="")
+
+    # ---
+    # Progress, as per `subledgers.utils.ImportProgress`.
+
+    parsed = models.IntegerField(default=0)
+
+    validated = models.IntegerField(default=0)
+
+    posted = models.IntegerField(default=0)
+
+    # json list of [first_row, last_row, message]
+    errors = models.TextField(blank=True, default="")
+
+    # json list of messages, previews (not `live`) only.
+    results = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    started_at = models.DateTimeField(blank=True, null=True)
+
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    # Last progress saved by the worker, see `jobs.fail_stale_jobs`.
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return "{} #{} ({})".format(self.get_kind_display(), self.pk,
+                                    self.status)
+
+    def get_errors(self):
+        return json.loads(self.errors or "[]")
+
+    def get_results(self):
+        return json.loads(self.results or "[]")
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'kind': self.kind,
+            'status': self.status,
+            'parsed': self.parsed,
+            'validated': self.validated,
+            'posted': self.posted,
+            'errors': self.get_errors(),
+            'results': self.get_results(),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
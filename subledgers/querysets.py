@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 from django.db import models
+from django.db.models import F
 
 
 class InvoiceQuerySet(models.query.QuerySet):
@@ -11,6 +12,11 @@ class InvoiceQuerySet(models.query.QuerySet):
             return self.filter(relation=relation)
         return self.filter(unpaid__gt=0)
 
+    def adjust_unpaid(self, delta):
+        """ Adds `delta` to `unpaid` in the database (F() expression), so
+        concurrent allocations don't overwrite each other. """
+        return self.update(unpaid=F('unpaid') + delta)
+
 
 class RelationQuerySet(models.query.QuerySet):
 
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import os
+
 from django.conf import settings
 
 
@@ -8,6 +10,29 @@ AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL')
 
 AGED_PERIODS = [7, 14, 30, 60, 90, 120]
 
+# Rows validated and committed together by `convert_import_to_objects`.
+IMPORT_CHUNK_SIZE = getattr(settings, 'SUBLEDGERS_IMPORT_CHUNK_SIZE', 100)
+# Seconds without progress after which a running `ImportJob` is failed,
+# its worker presumed dead, see `jobs.fail_stale_jobs`.
+IMPORT_JOB_TIMEOUT = getattr(settings, 'SUBLEDGERS_IMPORT_JOB_TIMEOUT', 600)
+
+# Bank line to open invoice matching, see `creditors.matching`.
+# Days after due date (or invoice date) a payment is still matched.
+MATCH_DATE_WINDOW = getattr(settings, 'SUBLEDGERS_MATCH_DATE_WINDOW', 30)
+# Most invoices one payment can be matched to.
+MATCH_MAX_INVOICES = getattr(settings, 'SUBLEDGERS_MATCH_MAX_INVOICES', 4)
+# Most open invoices of one creditor tried in combination, per bank line.
+MATCH_MAX_COMBINE = getattr(settings, 'SUBLEDGERS_MATCH_MAX_COMBINE', 20)
+
+# Creditor payment runs, see `creditors.payment_run`.
+# Directory ABA (CEMTEX) files are written to.
+PAYMENT_RUN_DIRECTORY = getattr(
+    settings, 'SUBLEDGERS_PAYMENT_RUN_DIRECTORY',
+    os.path.join(getattr(settings, 'MEDIA_ROOT', None) or '', 'payment_runs'))
+# As registered with the bank (APCA user name and 6 digit user id).
+ABA_USER_NAME = getattr(settings, 'SUBLEDGERS_ABA_USER_NAME', '')
+ABA_USER_ID = getattr(settings, 'SUBLEDGERS_ABA_USER_ID', '000000')
+
 # ~~~~~~~ ======= ######################################### ======== ~~~~~~~ #
 
 # Default ledger accounts
@@ -30,12 +30,12 @@ def process_tax(cls, kwargs, lines):
         # 2. defining `GST_total` column on import
 
         # First check if GST_CR_ACCOUNT or GST_DR_ACCOUNT lines exist
+        # (accounts resolved from in-memory CofA, not db)
         gst_allocated = False
         for line in lines:
-            if Account.get_account(line[0]) == \
-               Account.get_account(settings.GST_DR_ACCOUNT)\
-               or Account.get_account(line[0]) == \
-               Account.get_account(settings.GST_CR_ACCOUNT):
+            if Account.get_account(line[0]) in (
+                    Account.get_account(settings.GST_DR_ACCOUNT),
+                    Account.get_account(settings.GST_CR_ACCOUNT)):
                 gst_allocated = True
 
         # If not:
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ledgers.bank_accounts.models import BankAccount
+from ledgers.models import Account
+from ledgers.registry import chart_of_accounts
+from subledgers import jobs, settings
+from subledgers.bank_reconciliations.models import BankLine
+from subledgers.bank_reconciliations.views import add_statements
+from subledgers.journals.models import JournalEntry
+from subledgers.models import ImportJob
+from subledgers.views import SESSION_IMPORT_JOBS, upload_view
+
+
+class TestImportJobs(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.ac = Account.objects.create(
+            element='03', number='0450', name='Clearing - Payroll')
+        self.ab = Account.objects.create(
+            element='15', number='1905', name='Bar')
+        self.ba = BankAccount.objects.create(account=self.ac, bank='NAB')
+        self.dump = "value\tdate\t[03-0450]\t[15-1905]\r\n" \
+            "10\t2-May-2017\t-10\t10\r\n20\t3-May-2017\t-20\t20"
+        self.factory = RequestFactory()
+
+    def test_upload_view_queues_job(self):
+        request = self.factory.post('/upload/', {
+            'object_name': 'JournalEntry', 'live': 1,
+            'input_data': self.dump})
+        request.user = self.user
+        response = upload_view(request)
+
+        self.assertEqual(response.status_code, 200)
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.QUEUED)
+        self.assertEqual(job.object_name, 'JournalEntry')
+        self.assertEqual(JournalEntry.objects.count(), 0)
+        self.assertTrue(job.all_or_nothing)
+
+    def test_preview_job_results(self):
+        job = ImportJob.objects.create(
+            user=self.user, object_name='JournalEntry', live=False,
+            input_data=self.dump)
+        jobs.run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(len(job.as_dict()['results']), 2)
+        self.assertEqual(JournalEntry.objects.count(), 0)
+
+    def test_run_pending_jobs_posts(self):
+        job = ImportJob.objects.create(
+            user=self.user, object_name='JournalEntry',
+            input_data=self.dump)
+        self.assertEqual(jobs.run_pending_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual((job.parsed, job.validated, job.posted), (2, 2, 2))
+        self.assertEqual(job.get_errors(), [])
+        self.assertEqual(JournalEntry.objects.count(), 2)
+        self.assertEqual(jobs.claim_next_job(), None)
+
+    def test_run_job_reloads_chart_of_accounts(self):
+        """ Account added by another process, without signals """
+        chart_of_accounts.load()
+        Account.objects.bulk_create([Account(
+            element='15', number='1906', name='Kitchen')])
+        job = ImportJob.objects.create(
+            user=self.user, object_name='JournalEntry',
+            input_data=self.dump.replace('15-1905', '15-1906'))
+        jobs.run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.posted), (ImportJob.DONE, 2))
+
+    def test_run_job_failure_recorded(self):
+        job = ImportJob.objects.create(
+            user=self.user, object_name='JournalEntry',
+            input_data=self.dump.replace("-20\t20", "-20\t21"))
+        jobs.run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(len(job.get_errors()), 1)
+        self.assertEqual(JournalEntry.objects.count(), 0)
+
+    def test_claim_next_job_once(self):
+        ImportJob.objects.create(user=self.user, input_data=self.dump)
+        self.assertNotEqual(jobs.claim_next_job(), None)
+        self.assertEqual(jobs.claim_next_job(), None)
+
+    def test_stale_running_job_failed(self):
+        stale = ImportJob.objects.create(
+            user=self.user, status=ImportJob.RUNNING, posted=100,
+            heartbeat_at=timezone.now() - timedelta(hours=1))
+        running = ImportJob.objects.create(
+            user=self.user, status=ImportJob.RUNNING,
+            heartbeat_at=timezone.now())
+        self.assertEqual(jobs.claim_next_job(), None)
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ImportJob.FAILED)
+        self.assertIn("100 rows posted", stale.get_errors()[0][2])
+        running.refresh_from_db()
+        self.assertEqual(running.status, ImportJob.RUNNING)
+
+    def test_add_statements_queues_bank_job(self):
+        request = self.factory.post('/bank/reconciliations/statements/', {
+            'bank': self.ba.pk,
+            'input_data': "02-Jun-2017\t-5.00\t\t\tCARD\tCAFE\t100.00"})
+        request.user = AnonymousUser()
+        request.session = {}
+        add_statements(request)
+        self.assertEqual(BankLine.objects.count(), 0)
+
+        jobs.run_pending_jobs()
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(job.posted, 1)
+        self.assertEqual(BankLine.objects.count(), 1)
+        self.assertEqual(request.session[SESSION_IMPORT_JOBS], [job.pk])
+
+    def test_anonymous_job_progress_by_session(self):
+        self.client.post(
+            reverse('bank-reconciliations:bank-statement-upload'), {
+                'bank': self.ba.pk,
+                'input_data': "02-Jun-2017\t-5.00\t\t\tCARD\tCAFE"})
+        job = ImportJob.objects.get()
+        self.assertEqual(job.user, None)
+        url = reverse('subledgers:import-job-progress', args=[job.pk])
+        self.assertEqual(self.client.get(url).json()['status'],
+                         ImportJob.QUEUED)
+
+        # not from another session, even logged in.
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.login(username='test_staff_user', password='1234')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_import_job_progress_json(self):
+        job = ImportJob.objects.create(
+            user=self.user, object_name='JournalEntry',
+            input_data=self.dump)
+        url = reverse('subledgers:import-job-progress', args=[job.pk])
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.login(username='test_staff_user', password='1234')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], ImportJob.QUEUED)
+
+        jobs.run_pending_jobs()
+        response = self.client.get(url)
+        self.assertEqual(response.json()['posted'], 2)
+
+        other = User.objects.create_user(
+            'test_other_user', 'other@example.com', '1234')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class TestImportJobProgress(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        Account.objects.create(
+            element='03', number='0450', name='Clearing - Payroll')
+        Account.objects.create(element='15', number='1905', name='Bar')
+        self.dump = "value\tdate\t[03-0450]\t[15-1905]\r\n" \
+            "10\t2-May-2017\t-10\t10\r\n20\t3-May-2017\t-20\t20"
+
+    def test_progress_committed_per_chunk(self):
+        """ Progress is saved outside the import's transaction """
+        job = ImportJob.objects.create(
+            user=self.user, object_name='JournalEntry', input_data=self.dump)
+        self.assertTrue(job.all_or_nothing)
+        saved = []
+
+        def save_progress(job, progress, **kwargs):
+            saved.append((progress.posted, connection.in_atomic_block))
+            return jobs_save_progress(job, progress, **kwargs)
+
+        jobs_save_progress = jobs.save_progress
+        with mock.patch.object(settings, 'IMPORT_CHUNK_SIZE', 1), \
+                mock.patch.object(jobs, 'save_progress', save_progress):
+            jobs.run_pending_jobs()
+        self.assertEqual(saved, [(1, False), (2, False), (2, False)])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.posted), (ImportJob.DONE, 2))
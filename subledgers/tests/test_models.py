@@ -194,6 +194,29 @@ class TestModelEntryGetRelation(TestCase):
         self.assertEqual(self.creditor, test_rel)
 
 
+class TestModelEntryFieldPlan(TestCase):
+
+    # keys seen in imports, after `process_kwargs`
+    import_keys = [
+        'value', 'date', 'user', 'source', 'note', 'lines', 'accounts',
+        'type', 'relation', 'creditor', 'gst_total', 'invoice_number',
+        'order_number', 'reference', 'due_date', 'additional', '[15-0151]']
+
+    def test_field_plan_matches_attributes(self):
+        for cls in [JournalEntry, Sale, Expense, CreditorInvoice]:
+            plan = cls.get_field_plan()
+            for key in self.import_keys:
+                self.assertEqual(
+                    key in plan.transaction_keys,
+                    hasattr(Transaction, key) and not key == 'lines', key)
+                self.assertEqual(key in plan.object_keys, hasattr(cls, key),
+                                 (cls, key))
+
+    def test_field_plan_built_once(self):
+        self.assertIs(Sale.get_field_plan(), Sale.get_field_plan())
+        self.assertIsNot(Sale.get_field_plan(), Expense.get_field_plan())
+
+
 class TestModelEntryCreateObjectJournal(TestCase):
 
     def setUp(self):
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from ledgers import utils
+from ledgers.models import Account, AccountPeriodBalance, Line, Transaction
+from subledgers.journals.models import JournalEntry
+from subledgers.models import Entry
+from subledgers.utils import ImportProgress, convert_import_to_objects
+
+
+class TestIterTsvDicts(TestCase):
+
+    def test_iter_tsv_dicts_same_as_tsv_to_dict(self):
+        dump = 'a\tb\r\n1\t2\r\n3\t4'
+        self.assertEqual(list(utils.iter_tsv_dicts(dump)),
+                         utils.tsv_to_dict(dump))
+
+    def test_iter_tsv_dicts_skips_blank_lines(self):
+        dump = 'a\tb\r\n1\t2\r\n\r\n3\t4\r\n'
+        self.assertEqual(list(utils.iter_tsv_dicts(dump)),
+                         [{'a': '1', 'b': '2'}, {'a': '3', 'b': '4'}])
+
+    def test_iter_tsv_dicts_lines_iterable(self):
+        lines = iter(['a\tb\n', '1\t2\n'])
+        self.assertEqual(list(utils.iter_tsv_dicts(lines)),
+                         [{'a': '1', 'b': '2'}])
+
+    def test_iter_tsv_dicts_rubbish_failure(self):
+        self.assertRaises(Exception, list, utils.iter_tsv_dicts(None))
+
+
+class TestConvertImportToObjectsChunked(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'test_staff_user', 'test@example.com', '1234')
+        self.ac = Account.objects.create(
+            element='03', number='0450', name='Clearing - Payroll')
+        self.ab = Account.objects.create(
+            element='15', number='1905', name='Bar')
+        self.header = 'value\tdate\ttype\t[03-0450]\t[15-1905]'
+
+    def make_dump(self, n, bad_row=None):
+        rows = [self.header]
+        for x in range(1, n + 1):
+            debit = x + 1 if x == bad_row else x
+            rows.append('{0}\tJan. 31, 2016\tJournalEntry\t-{0}\t{1}'.format(
+                x, debit))
+        return "\r\n".join(rows)
+
+    def test_convert_import_chunked_creates_all(self):
+        progress = ImportProgress()
+        test_result = convert_import_to_objects(
+            self.make_dump(7), user=self.user, chunk_size=3,
+            progress=progress)
+        self.assertEqual(len(test_result), 7)
+        self.assertEqual(JournalEntry.objects.count(), 7)
+        self.assertEqual(Line.objects.count(), 14)
+        self.assertEqual(
+            Transaction.objects.filter(is_balanced=True).count(), 7)
+        self.assertEqual((progress.parsed, progress.validated,
+                          progress.posted), (7, 7, 7))
+
+    def test_convert_import_make_dicts_once_per_row(self):
+        with mock.patch.object(Entry, 'make_dicts', autospec=True,
+                               side_effect=Entry.make_dicts) as make_dicts:
+            convert_import_to_objects(
+                self.make_dump(4), user=self.user, chunk_size=3)
+        self.assertEqual(make_dicts.call_count, 4)
+
+    def test_convert_import_all_or_nothing_failure(self):
+        self.assertRaises(
+            Exception, convert_import_to_objects, self.make_dump(7, 6),
+            user=self.user, chunk_size=3)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.assertEqual(JournalEntry.objects.count(), 0)
+        self.assertEqual(Line.objects.count(), 0)
+        self.assertFalse(AccountPeriodBalance.objects.exclude(
+            net=0, line_count=0).exists())
+
+    def test_convert_import_by_chunk_skips_failed_chunk(self):
+        progress = ImportProgress()
+        test_result = convert_import_to_objects(
+            self.make_dump(7, 5), user=self.user, chunk_size=3,
+            all_or_nothing=False, progress=progress)
+        self.assertEqual(len(test_result), 4)
+        self.assertEqual(JournalEntry.objects.count(), 4)
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertEqual([error[:2] for error in progress.errors], [(4, 6)])
+
+    def test_convert_import_progress_callback(self):
+        updates = []
+        convert_import_to_objects(
+            self.make_dump(5), user=self.user, chunk_size=2,
+            progress=ImportProgress(lambda p: updates.append(p.posted)))
+        self.assertEqual(updates, [2, 4, 5])
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from django.urls import path
+
+from . import views
+
+
+app_name = 'subledgers'
+
+urlpatterns = [
+
+    # Import job progress (json)
+    path('jobs/<int:pk>/',
+         views.import_job_progress,
+         name='import-job-progress'),
+]
@@ -1,44 +1,86 @@
 # -*- coding: utf-8 -*-
+from django.db import transaction as db_transaction
 from django.utils.module_loading import import_string
 
 from ledgers import utils
-from ledgers.models import Account
+from ledgers.models import Transaction
+from ledgers.posting import chunked, deferred_balancing
+from ledgers.registry import chart_of_accounts
+from subledgers import settings
 
 
-def convert_import_to_objects(dump, user, object_name=None, live=True):
+class ImportProgress(object):
+    """ Counts rows as they pass through `convert_import_to_objects`.
+
+    `callback(progress)` is called after every chunk, eg. to report the
+    progress of a long running import.
+
+    `errors` is only used when not `all_or_nothing`:
+        [(first_row, last_row, message), ...]
     """
-    ** End-to-End **
 
-    Main function for bringing together the elements of constructing
-    the list of kwargs for transactions / invoices based upon whatever is
-    required for the object.
+    def __init__(self, callback=None):
+        self.parsed = 0
+        self.validated = 0
+        self.posted = 0
+        self.errors = []
+        self.callback = callback
 
-    Defining Object type by "object_name":
-     Either: batch of same Object Class(using * arg `object_name`)
-             or: by calling method from Object Class(eg. CreditorInvoice)
-         or: column header `object_name` defining on a row-by-row basis.
+    def update(self):
+        if self.callback:
+            self.callback(self)
 
-     There is the choice of either preselecting what object_name of
-     objects are being defined such as "CreditorInvoice" objects or
-    "JournalEntry" objects.
+    def as_dict(self):
+        return {'parsed': self.parsed,
+                'validated': self.validated,
+                'posted': self.posted,
+                'errors': self.errors}
 
-     Alternatively each `row` should define a `object_name`.
 
-    `user` will be added here as the individual creating this list is
-    the one who should be tied to the objects.
+def iter_import_rows(dump, user):
+    """ Yields kwargs `dict` for each row in `dump`, lazily.
+
+    Keys are lowercased, and `user` added.
     """
+    for row_dict in utils.iter_tsv_dicts(dump):
+        # Copy kwargs for safety to ensure valid set/uniform keys
+        kwargs = {k.lower(): v for k, v in row_dict.items()}
+        kwargs['user'] = user
+        yield kwargs
 
-    # ** Part 1. convert dump to `list` of `dict` objects
-    table = utils.tsv_to_dict(dump)
 
-    obj_list, valid_kwargs = [], []
+def parse_import_amounts(rows):
+    """ Converts amount columns (`FIELD_IS_DECIMAL` and account codes) of
+    `rows` to `Decimal`, a column at a time, in place.
 
-    for row_dict in table:
+    `Entry.process_kwargs` and line making then reuse the `Decimal`s rather
+    than parsing each str again.
+    """
+    codes = chart_of_accounts.codes()
+    keys = set()
+    for kwargs in rows:
+        keys.update(kwargs)
 
-        # Copy kwargs for safety to ensure valid set/uniform keys
-        kwargs = {k.lower(): v for k, v in row_dict.items()}
+    for key in keys:
+        if key in settings.FIELD_IS_DECIMAL or key in codes:
+            column = [kwargs for kwargs in rows if key in kwargs]
+            amounts = utils.parse_amounts(kwargs[key] for kwargs in column)
+            for kwargs, amount in zip(column, amounts):
+                kwargs[key] = amount
+    return rows
 
-        kwargs['user'] = user
+
+def validate_import_rows(rows, object_name=None):
+    """ Yields `(cls, kwargs, dicts)` for each kwargs in `rows`.
+
+    `dicts` is the result of `cls().make_dicts(kwargs)`, kept so saving
+    doesn't have to resolve dates, decimals, relations and accounts again.
+
+    Raises on the first invalid row.
+    """
+    classes = {}
+
+    for kwargs in rows:
 
         """ There are a couple of different ways to provide `cls`.
 
@@ -50,26 +92,117 @@ def convert_import_to_objects(dump, user, object_name=None, live=True):
         """
         # `type` is particular to import as easy nomenclature for csv
         # 1. prioritise type provided for individual line
-        if kwargs.get('type'):
-            cls = utils.get_cls(kwargs['type'])
         # 2. fall back on `object_name` arg provided
-        elif object_name:
-            cls = utils.get_cls(object_name)
-        else:
+        name = kwargs.get('type') or object_name
+        if not name:
             raise Exception(
                 "No `type` column specified for {}, unable to create objects.".format(kwargs))  # noqa
-        cls = import_string(utils.get_source(cls))
+        try:
+            cls = classes[name]
+        except KeyError:
+            cls = classes[name] = import_string(
+                utils.get_source(utils.get_cls(name)))
+
+        yield cls, kwargs, cls().make_dicts(kwargs)
 
-        # If errors Blow up whole lot instead of processing few then blowing up
-        cls().make_dicts(kwargs)
 
-        # If doesn't blow up add to valid list
-        valid_kwargs.append((cls, kwargs))
+def commit_import_rows(valid_rows, live=True):
+    """ Saves `(cls, kwargs, dicts)` rows from `validate_import_rows`.
 
-    # If whole set has been validated:
-    for cls, kwargs in valid_kwargs:
-        new_object = cls().save_transaction(kwargs, live=live)
-        obj_list.append(new_object)
+    All rows are saved in one `deferred_balancing()` block, so either all
+    are saved or none (the first error is raised).
+    """
+    if not live:
+        return [cls().save_dicts(kwargs, dicts, live=False)
+                for cls, kwargs, dicts in valid_rows]
+
+    with deferred_balancing():
+        return [cls().save_dicts(kwargs, dicts, raise_errors=True)
+                for cls, kwargs, dicts in valid_rows]
+
+
+def remove_imported(obj_list):
+    """ Deletes `Entry` objects posted by an import, with their
+    `Transaction`s (and so `Line`s and period balances). """
+    with db_transaction.atomic():
+        Transaction.objects.filter(pk__in=[
+            obj.transaction_id for obj in obj_list]).delete()
+
+
+def convert_import_to_objects(dump, user, object_name=None, live=True,
+                              all_or_nothing=True, chunk_size=None,
+                              progress=None):
+    """
+    ** End-to-End **
+
+    Main function for bringing together the elements of constructing
+    the list of kwargs for transactions / invoices based upon whatever is
+    required for the object.
+
+    Defining Object type by "object_name":
+     Either: batch of same Object Class(using * arg `object_name`)
+             or: by calling method from Object Class(eg. CreditorInvoice)
+         or: column header `object_name` defining on a row-by-row basis.
+
+     There is the choice of either preselecting what object_name of
+     objects are being defined such as "CreditorInvoice" objects or
+    "JournalEntry" objects.
+
+     Alternatively each `row` should define a `object_name`.
+
+    `user` will be added here as the individual creating this list is
+    the one who should be tied to the objects.
+
+    `dump` is the pasted str, or any iterable of lines (eg. an open file).
+    Rows are parsed lazily then validated and committed `chunk_size` rows at
+    a time (default `IMPORT_CHUNK_SIZE`):
+
+    - `all_or_nothing` (default): if any row fails nothing is saved and the
+      error is raised. Each chunk is still committed on its own, so
+      progress can be seen while importing, and the chunks already posted
+      are removed (`remove_imported`) if a later one fails.
+    - otherwise each chunk is committed atomically on its own, a failing
+      chunk is skipped and recorded in `progress.errors`.
+
+    `progress` is an optional `ImportProgress`.
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    if progress is None:
+        progress = ImportProgress()
+
+    rows = iter_import_rows(dump, user)
+    obj_list = []
+
+    def import_chunk(chunk):
+        progress.parsed += len(chunk)
+        parse_import_amounts(chunk)
+        valid_rows = list(validate_import_rows(chunk, object_name))
+        progress.validated += len(valid_rows)
+        new_objects = commit_import_rows(valid_rows, live=live)
+        if live:
+            progress.posted += len(new_objects)
+        return new_objects
+
+    if all_or_nothing:
+        try:
+            for chunk in chunked(rows, chunk_size):
+                with deferred_balancing():
+                    obj_list += import_chunk(chunk)
+                progress.update()
+        except Exception:
+            if live:
+                remove_imported(obj_list)
+            raise
+    else:
+        first_row = 1
+        for chunk in chunked(rows, chunk_size):
+            try:
+                obj_list += import_chunk(chunk)
+            except Exception as e:
+                progress.errors.append(
+                    (first_row, first_row + len(chunk) - 1, str(e)))
+            first_row += len(chunk)
+            progress.update()
 
     # Returns list of generated objects/messages (depending if live or not).
     return obj_list
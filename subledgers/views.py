@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
 # from django.forms import formset_factory
-from django.shortcuts import render, redirect
-from django.utils.module_loading import import_string
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render, redirect
 
-from ledgers import utils
 from subledgers.forms import UploadForm, BasicForm
-from subledgers.models import Entry
+from subledgers.models import ImportJob
+
+
+# Session key: pks of `ImportJob`s uploaded in the session.
+SESSION_IMPORT_JOBS = 'subledgers_import_jobs'
+
+
+def remember_import_job(request, job):
+    """ Records `job` in the session, so its progress can be polled without
+    logging in (bank statements may be uploaded anonymously). """
+    request.session[SESSION_IMPORT_JOBS] = request.session.get(
+        SESSION_IMPORT_JOBS, [])[-49:] + [job.pk]
 
 
 def upload_view(request, import_function=None):
@@ -16,24 +27,25 @@ def upload_view(request, import_function=None):
         context_data = {}
 
         if request.method == 'POST':
-            form = UploadForm(request.POST)
             context_data['dump'] = request.POST
 
-            print(request.POST)
-
-            if request.POST.get('object_name'):
-                data = Entry.dump_to_objects(
-                    request.POST['input_data'],
-                    request.user, request.POST['object_name'],
-                    live=int(request.POST['live']),
-                )
-            else:
-                data = Entry.dump_to_objects(
-                    request.POST['input_data'], request.user,
-                    live=int(request.POST['live']),
-                )
+            # "Mixed" is posted as "None", rows must define `type`.
+            object_name = request.POST.get('object_name') or ""
+            if object_name == 'None':
+                object_name = ""
+
+            # Processed by `./manage.py run_import_jobs`, see `subledgers.jobs`
+            job = ImportJob.objects.create(
+                user=request.user,
+                object_name=object_name,
+                live=bool(int(request.POST.get('live', 1))),
+                input_data=request.POST['input_data'])
+
+            if request.is_ajax():
+                return JsonResponse(job.as_dict(), status=202)
+
             template_name = 'subledgers/upload_form.html'
-            context_data['results'] = data
+            context_data['job'] = job
             form = UploadForm()
             context_data['form'] = form
             return render(request, template_name, context_data)
@@ -58,3 +70,16 @@ def dump_view(request):
         return render(request, template_name, context_data)
 
     return render(request, template_name, context_data)
+
+
+def import_job_progress(request, pk):
+    """ JSON progress of an `ImportJob`, for polling after upload: the
+    user's own jobs, or anonymous jobs uploaded in the session. """
+    session_jobs = request.session.get(SESSION_IMPORT_JOBS, [])
+    if not request.user.is_authenticated and pk not in session_jobs:
+        return JsonResponse({'error': "Not logged in."}, status=403)
+    owned = Q(pk__in=session_jobs, user__isnull=True)
+    if request.user.is_authenticated:
+        owned |= Q(user=request.user)
+    job = get_object_or_404(ImportJob.objects.filter(owned), pk=pk)
+    return JsonResponse(job.as_dict())